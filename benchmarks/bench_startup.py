@@ -0,0 +1,165 @@
+"""
+Startup cost of `dpos`, which runs in many short CI jobs. Measured with
+`python -X importtime` in fresh interpreters and compared to a budget.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --update-budget
+"""
+
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import click
+
+BUDGET_PATH = Path(__file__).parent / "startup_budget.json"
+CLI_MODULE = "docker_publisher_osparc_services.cli"
+
+# only imported by the commands which need them, never by the entry point
+HEAVY_MODULES = (
+    "asyncio",
+    "httpx",
+    "importlib.metadata",
+    "pydantic",
+    "tenacity",
+    "yaml",
+    "yarl",
+)
+
+# process start-up is noisy, the heavy modules check is deterministic
+TIME_TOLERANCE = 0.5
+
+_LOADED_HEAVY_MODULES = f"""
+import json
+import sys
+import {CLI_MODULE}
+print(json.dumps(sorted(set(sys.modules) & set({list(HEAVY_MODULES)!r}))))
+"""
+
+
+def _parse_importtime(stderr: str, module: str) -> List[Tuple[int, str]]:
+    """
+    (cumulative microseconds, name) of `module` and of everything it
+    imported, from the `-X importtime` output (children come first)
+    """
+    subtree: List[Tuple[int, str]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        subtree.append((int(cumulative), name.rstrip()))
+        if not name.startswith("  "):
+            # top level import, closes its subtree
+            if name.strip() == module:
+                return subtree
+            subtree = []
+    raise ValueError(f"'{module}' not found in the -X importtime output")
+
+
+def _import_time(repeat: int) -> Tuple[float, List[Tuple[int, str]]]:
+    """best cumulative import time of the entry point and its slowest imports"""
+    best_us, best_imports = None, []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {CLI_MODULE}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        imports = _parse_importtime(completed.stderr, CLI_MODULE)
+        total_us = imports[-1][0]
+        if best_us is None or total_us < best_us:
+            best_us, best_imports = total_us, imports
+    assert best_us is not None
+    slowest = sorted(best_imports[:-1], reverse=True)
+    return best_us / 1000, slowest[:10]
+
+
+def _version_wall_time(repeat: int) -> float:
+    """best wall time of `dpos --version`, interpreter start-up included"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", CLI_MODULE, "--version"],
+            capture_output=True,
+            check=True,
+        )
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def _loaded_heavy_modules() -> List[str]:
+    completed = subprocess.run(
+        [sys.executable, "-c", _LOADED_HEAVY_MODULES],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(completed.stdout)
+
+
+def run_benchmark(repeat: int) -> Tuple[Dict[str, Any], List[Tuple[int, str]]]:
+    import_time_ms, slowest = _import_time(repeat)
+    result = {
+        "import_time_ms": round(import_time_ms, 3),
+        "version_wall_time_ms": round(_version_wall_time(repeat), 3),
+    }
+    return result, slowest
+
+
+def _compare(result: Dict[str, Any], budget: Dict[str, Any]) -> Dict[str, str]:
+    regressions = {}
+    for key in ("import_time_ms", "version_wall_time_ms"):
+        if result[key] > budget[key] * (1 + TIME_TOLERANCE):
+            regressions[key] = "slower"
+    return regressions
+
+
+@click.command()
+@click.option("--repeat", default=5, show_default=True, help="runs, best is kept")
+@click.option("--budget", type=Path, default=BUDGET_PATH, show_default=True)
+@click.option("--update-budget", is_flag=True, default=False)
+def main(repeat: int, budget: Path, update_budget: bool) -> None:
+    result, slowest = run_benchmark(repeat)
+    heavy_modules = _loaded_heavy_modules()
+
+    print(f"entry point: {CLI_MODULE}")
+    for key, value in result.items():
+        print(f"  {key:<22} {value:>10.3f}")
+    print("  slowest imports [ms]:")
+    for cumulative_us, name in slowest:
+        print(f"    {cumulative_us / 1000:>8.3f} {name}")
+
+    if heavy_modules:
+        print(f"REGRESSION heavy modules imported at startup: {heavy_modules}")
+        sys.exit(1)
+
+    if update_budget:
+        budget.write_text(json.dumps(result, indent=2, sort_keys=True) + "\n")
+        print(f"budget updated in '{budget}'")
+        return
+
+    if not budget.exists():
+        print(f"no budget in '{budget}', run with --update-budget")
+        return
+
+    budgets = json.loads(budget.read_text())
+    regressions = _compare(result, budgets)
+    for key, reason in regressions.items():
+        print(
+            f"REGRESSION {key}: {reason}, "
+            f"{result[key]:.3f} vs budget {budgets[key]:.3f}"
+        )
+    if regressions:
+        sys.exit(1)
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+End-to-end benchmark of `run_command` against in-process fake services and
+local git repositories. Nothing leaves this host.
+
+    python -m benchmarks.bench_sweep --repos 20 --images 3 --outdated 30
+    python -m benchmarks.bench_sweep --update-baseline
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, Iterator
+
+import click
+import httpx
+
+from docker_publisher_osparc_services.http_interface import (
+    clear_caches,
+    set_transport_factory,
+)
+from docker_publisher_osparc_services.runner import run_command
+from docker_publisher_osparc_services.tracing import (
+    CATEGORY_SUBPROCESS,
+    Span,
+    add_listener,
+    remove_listener,
+)
+
+from .fake_services import FakeServices
+from .fixtures import create_world, world_environment
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+# wall time is noisy, counters are deterministic and must not grow
+WALL_TIME_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.25
+
+
+class _SubprocessCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, span: Span) -> None:
+        if span.category == CATEGORY_SUBPROCESS:
+            self.count += 1
+
+
+@contextlib.contextmanager
+def _patched_environment(env: Dict[str, str], cwd: Path) -> Iterator[None]:
+    previous_env = dict(os.environ)
+    previous_cwd = Path.cwd()
+    os.environ.update(env)
+    os.chdir(cwd)
+    try:
+        yield
+    finally:
+        os.chdir(previous_cwd)
+        os.environ.clear()
+        os.environ.update(previous_env)
+
+
+def _run_sweep(
+    config: Path, services: FakeServices, trace_memory: bool
+) -> Dict[str, Any]:
+    subprocess_counter = _SubprocessCounter()
+    add_listener(subprocess_counter)
+    services.request_counts.clear()
+    # every run must start cold, as a scheduled CI job does
+    clear_caches()
+    if trace_memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            asyncio.run(run_command(config, legacy_escape=False))
+    finally:
+        elapsed = time.perf_counter() - start
+        remove_listener(subprocess_counter)
+        peak_memory = 0
+        if trace_memory:
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    return {
+        "wall_time_s": elapsed,
+        "http_requests": services.total_requests,
+        "subprocesses": subprocess_counter.count,
+        "peak_memory_mb": peak_memory / 2**20,
+    }
+
+
+def run_benchmark(
+    repos: int, images: int, outdated: float, label_size: int, repeat: int
+) -> Dict[str, Any]:
+    services = FakeServices()
+    set_transport_factory(lambda: httpx.MockTransport(services))
+    try:
+        with tempfile.TemporaryDirectory(prefix="dpos-bench-") as tmp:
+            root = Path(tmp)
+            config = create_world(root, services, repos, images, outdated, label_size)
+            output_dir = root / "output"
+            output_dir.mkdir()
+
+            with _patched_environment(world_environment(root), output_dir):
+                runs = [
+                    _run_sweep(config, services, trace_memory=False)
+                    for _ in range(repeat)
+                ]
+                # tracemalloc slows everything down, measure memory separately
+                memory_run = _run_sweep(config, services, trace_memory=True)
+    finally:
+        set_transport_factory(None)
+
+    result = min(runs, key=lambda r: r["wall_time_s"])
+    result["peak_memory_mb"] = memory_run["peak_memory_mb"]
+    return result
+
+
+def _compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, str]:
+    regressions = {}
+    if result["wall_time_s"] > baseline["wall_time_s"] * (1 + WALL_TIME_TOLERANCE):
+        regressions["wall_time_s"] = "slower"
+    if result["peak_memory_mb"] > baseline["peak_memory_mb"] * (1 + MEMORY_TOLERANCE):
+        regressions["peak_memory_mb"] = "more memory"
+    for counter in ("http_requests", "subprocesses"):
+        if result[counter] > baseline[counter]:
+            regressions[counter] = "more calls"
+    return regressions
+
+
+@click.command()
+@click.option("--repos", default=10, show_default=True, help="repositories")
+@click.option("--images", default=3, show_default=True, help="images per repository")
+@click.option(
+    "--outdated", default=30.0, show_default=True, help="%% of images to rebuild"
+)
+@click.option(
+    "--label-size", default=64, show_default=True, help="bytes per compose label"
+)
+@click.option("--repeat", default=3, show_default=True, help="timed runs, best is kept")
+@click.option("--baseline", type=Path, default=BASELINE_PATH, show_default=True)
+@click.option("--update-baseline", is_flag=True, default=False)
+def main(
+    repos: int,
+    images: int,
+    outdated: float,
+    label_size: int,
+    repeat: int,
+    baseline: Path,
+    update_baseline: bool,
+) -> None:
+    scenario = f"{repos}x{images}-{outdated:g}%-labels{label_size}"
+    result = run_benchmark(repos, images, outdated, label_size, repeat)
+
+    print(f"scenario: {scenario}")
+    for key, value in result.items():
+        formatted = f"{value:.3f}" if isinstance(value, float) else f"{value}"
+        print(f"  {key:<16} {formatted:>10}")
+
+    baselines = json.loads(baseline.read_text()) if baseline.exists() else {}
+    if update_baseline:
+        baselines[scenario] = result
+        baseline.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        print(f"baseline updated in '{baseline}'")
+        return
+
+    if scenario not in baselines:
+        print(f"no baseline for '{scenario}', run with --update-baseline")
+        return
+
+    regressions = _compare(result, baselines[scenario])
+    for key, reason in regressions.items():
+        print(
+            f"REGRESSION {key}: {reason}, "
+            f"{result[key]:.3f} vs baseline {baselines[scenario][key]:.3f}"
+        )
+    if regressions:
+        sys.exit(1)
+    print("no regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Micro-benchmark of configuration and compose spec loading on large
+synthetic files, pure-Python PyYAML (the previous behaviour) against
+libyaml, selective compose parsing and the configuration cache.
+
+    python -m benchmarks.bench_yaml --repos 500 --services 20
+"""
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import click
+import yaml
+
+from docker_publisher_osparc_services.config_loader import load_config_dict
+from docker_publisher_osparc_services.models import ConfigModel
+from docker_publisher_osparc_services.yaml_utils import (
+    SafeLoader,
+    read_compose_services,
+)
+
+from .fixtures import DEPLOY_PASSWORD, DEPLOY_USER
+
+TOKEN_VARIABLE = "BENCH_GITLAB_TOKEN"
+
+
+def _config(repos: int, images: int) -> Dict[str, Any]:
+    repositories = []
+    for repo_index in range(repos):
+        names = [f"bench-{repo_index}-{i}" for i in range(images)]
+        repositories.append(
+            {
+                "address": f"https://gitlab.bench.local/bench/repo-{repo_index}.git",
+                "branch": "master",
+                "host_type": "gitlab",
+                "gitlab": {
+                    "personal_access_token": f"${{{TOKEN_VARIABLE}}}",
+                    "deploy_token_username": DEPLOY_USER,
+                    "deploy_token_password": DEPLOY_PASSWORD,
+                },
+                "registry": {
+                    "target": "bench",
+                    "local_to_test": {
+                        f"simcore/services/dynamic/{n}": f"ci/builder/bench/{n}"
+                        for n in names
+                    },
+                    "test_to_release": {
+                        f"ci/builder/bench/{n}": f"ci/bench/{n}" for n in names
+                    },
+                },
+                "ci_stage_test_script": ["make test", "make integration-test"],
+            }
+        )
+    return {
+        "registries": {
+            "bench": {"address": "registry.bench.local", "user": "u", "password": "p"}
+        },
+        "repositories": repositories,
+    }
+
+
+def _compose_spec(services: int, fields: int) -> Dict[str, Any]:
+    """labels are large JSON documents and environments are long, as with ooil"""
+    spec: Dict[str, Any] = {"version": "3.7", "services": {}}
+    for index in range(services):
+        schema = {
+            f"field_{i}": {"type": "string", "description": "x" * 40}
+            for i in range(fields)
+        }
+        spec["services"][f"service-{index}"] = {
+            "image": f"simcore/services/dynamic/service-{index}:1.0.{index}",
+            "build": {
+                "context": f"./services/service-{index}",
+                "dockerfile": "Dockerfile",
+                "labels": {
+                    f"io.simcore.{key}": json.dumps({key: schema})
+                    for key in ("inputs", "outputs", "settings", "description")
+                },
+            },
+            "environment": {f"VARIABLE_{i}": f"{i}" for i in range(fields * 4)},
+        }
+    return spec
+
+
+def _best_of(repeat: int, function: Callable[[], Any]) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def _previous_compose_images(compose_file: Path) -> List[str]:
+    spec = yaml.safe_load(compose_file.read_text())
+    return [service["image"] for service in spec["services"].values()]
+
+
+def run_benchmark(
+    repos: int, images: int, services: int, fields: int, repeat: int
+) -> List[Tuple[str, float]]:
+    results = []
+    with tempfile.TemporaryDirectory(prefix="dpos-bench-yaml-") as tmp:
+        root = Path(tmp)
+        config_path = root / "config.yml"
+        config_path.write_text(yaml.safe_dump(_config(repos, images), sort_keys=False))
+        compose_file = root / "docker-compose.yml"
+        compose_file.write_text(yaml.safe_dump(_compose_spec(services, fields)))
+        print(
+            f"config {config_path.stat().st_size / 1024:.0f} kB, "
+            f"compose spec {compose_file.stat().st_size / 1024:.0f} kB"
+        )
+        cache_dir = root / "cache"
+        os.environ[TOKEN_VARIABLE] = "bench-token"
+
+        def _cold_config() -> None:
+            for entry in cache_dir.glob("*"):
+                entry.unlink()
+            load_config_dict(config_path, cache_dir)
+
+        results += [
+            (
+                "config: pure-Python safe_load",
+                _best_of(repeat, lambda: yaml.safe_load(config_path.read_text())),
+            ),
+            ("config: libyaml, cold cache", _best_of(repeat, _cold_config)),
+            (
+                "config: cached",
+                _best_of(repeat, lambda: load_config_dict(config_path, cache_dir)),
+            ),
+            (
+                "config: cached + validation",
+                _best_of(
+                    repeat,
+                    lambda: ConfigModel.model_validate(
+                        load_config_dict(config_path, cache_dir)
+                    ),
+                ),
+            ),
+            (
+                "compose: pure-Python safe_load",
+                _best_of(repeat, lambda: _previous_compose_images(compose_file)),
+            ),
+            (
+                "compose: libyaml full load",
+                _best_of(
+                    repeat,
+                    lambda: yaml.load(compose_file.read_text(), Loader=SafeLoader),
+                ),
+            ),
+            (
+                "compose: selective",
+                _best_of(repeat, lambda: read_compose_services(compose_file)),
+            ),
+        ]
+        assert [s.image for s in read_compose_services(compose_file)] == (
+            _previous_compose_images(compose_file)
+        )
+    return results
+
+
+@click.command()
+@click.option("--repos", default=500, show_default=True, help="repositories")
+@click.option("--images", default=3, show_default=True, help="images per repository")
+@click.option("--services", default=20, show_default=True, help="compose services")
+@click.option("--fields", default=50, show_default=True, help="fields per label schema")
+@click.option("--repeat", default=3, show_default=True, help="runs, best is kept")
+def main(repos: int, images: int, services: int, fields: int, repeat: int) -> None:
+    print(
+        f"libyaml: {yaml.__with_libyaml__}, "
+        f"{repos} repositories, {services} services"
+    )
+    for name, milliseconds in run_benchmark(repos, images, services, fields, repeat):
+        print(f"  {name:<32} {milliseconds:>10.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+In-process stand-ins for the remote services used during a sweep. They are
+plugged in as an httpx transport, so no sockets are opened.
+"""
+
+import json
+from collections import Counter
+from typing import Any, Dict, List, Set
+from urllib.parse import parse_qs
+
+import httpx
+
+REGISTRY_HOST = "registry.bench.local"
+REGISTRY_AUTH_HOST = "auth.bench.local"
+GITLAB_HOST = "gitlab.bench.local"
+GITHUB_API_HOST = "api.github.com"
+
+_BEARER_TOKEN = "bench-token"
+
+
+def _json(data: Any, status_code: int = 200) -> httpx.Response:
+    return httpx.Response(
+        status_code,
+        content=json.dumps(data).encode(),
+        headers={"content-type": "application/json"},
+    )
+
+
+class FakeServices:
+    """
+    - Docker registry v2 protected by Portus style token auth
+    - GitLab v4 API (project search and pipelines)
+    - GitHub REST API (workflow runs)
+    """
+
+    def __init__(self) -> None:
+        self.request_counts: Counter = Counter()
+        # registry path -> tags
+        self.registry_tags: Dict[str, Set[str]] = {}
+        # gitlab http_url_to_repo -> project id
+        self.gitlab_projects: Dict[str, int] = {}
+        # gitlab project id -> green commit hashes
+        self.gitlab_green_hashes: Dict[int, Set[str]] = {}
+        # github "org/repo" -> (branch, green commit hash)
+        self.github_green_runs: Dict[str, List[Dict[str, str]]] = {}
+
+    @property
+    def total_requests(self) -> int:
+        return sum(self.request_counts.values())
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        self.request_counts[host] += 1
+        if host == REGISTRY_HOST:
+            return self._registry(request)
+        if host == REGISTRY_AUTH_HOST:
+            return _json({"token": _BEARER_TOKEN})
+        if host == GITLAB_HOST:
+            return self._gitlab(request)
+        if host == GITHUB_API_HOST:
+            return self._github(request)
+        return _json({"message": f"unknown host {host}"}, status_code=404)
+
+    def _registry(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if not path.startswith("/v2/") or not path.endswith("/tags/list"):
+            return _json({"errors": [{"code": "UNSUPPORTED"}]}, status_code=404)
+        name = path[len("/v2/") : -len("/tags/list")]
+
+        if request.headers.get("authorization") != f"Bearer {_BEARER_TOKEN}":
+            challenge = (
+                f'Bearer realm="https://{REGISTRY_AUTH_HOST}/v2/token",'
+                f'service="{REGISTRY_HOST}",'
+                f'scope="repository:{name}:pull"'
+            )
+            return httpx.Response(401, headers={"www-authenticate": challenge})
+
+        if name not in self.registry_tags:
+            return _json({"errors": [{"code": "NAME_UNKNOWN"}]}, status_code=404)
+        return _json({"name": name, "tags": sorted(self.registry_tags[name])})
+
+    def _gitlab(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        query = parse_qs(request.url.query.decode())
+        if path == "/api/v4/projects":
+            search = query.get("search", [""])[0]
+            return _json(
+                [
+                    {"id": project_id, "http_url_to_repo": url}
+                    for url, project_id in self.gitlab_projects.items()
+                    if search in url
+                ]
+            )
+
+        parts = path.split("/")
+        if len(parts) == 6 and parts[5] == "pipelines":
+            project_id = int(parts[4])
+            sha = query.get("sha", [""])[0]
+            status = (
+                "success"
+                if sha in self.gitlab_green_hashes.get(project_id, set())
+                else "failed"
+            )
+            return _json([{"id": 1, "sha": sha, "status": status}])
+
+        return _json({"message": "404 Not Found"}, status_code=404)
+
+    def _github(self, request: httpx.Request) -> httpx.Response:
+        parts = request.url.path.strip("/").split("/")
+        if len(parts) == 5 and parts[0] == "repos" and parts[3:] == ["actions", "runs"]:
+            runs = [
+                {
+                    "head_commit": {"id": run["hash"]},
+                    "head_branch": run["branch"],
+                    "status": "completed",
+                    "conclusion": "success",
+                }
+                for run in self.github_green_runs.get(f"{parts[1]}/{parts[2]}", [])
+            ]
+            return _json({"total_count": len(runs), "workflow_runs": runs})
+        return _json({"message": "Not Found"}, status_code=404)
@@ -0,0 +1,206 @@
+"""
+Synthetic world for the benchmarks: local bare git repositories containing
+`.osparc` metadata, a stub `ooil` and the matching dpos configuration.
+"""
+
+import os
+import random
+import stat
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Dict, List
+
+import yaml
+
+from .fake_services import GITLAB_HOST, REGISTRY_HOST, FakeServices
+
+DEPLOY_USER = "bench-user"
+DEPLOY_PASSWORD = "bench-password"
+BRANCH = "master"
+
+_STUB_OOIL = """#!{python}
+import shutil
+import sys
+
+if sys.argv[1:] == ["--version"]:
+    print("ooil bench-stub")
+elif sys.argv[1:2] == ["compose"]:
+    shutil.copy(".osparc/docker-compose.bench.yml", "docker-compose.yml")
+else:
+    sys.exit(f"unsupported stub command {{sys.argv[1:]}}")
+"""
+
+
+def _git(*args: str, cwd: Path) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout.strip()
+
+
+def _compose_spec(repo_index: int, images: int, label_size: int) -> Dict[str, Any]:
+    services = {}
+    for image_index in range(images):
+        name = f"bench-{repo_index}-{image_index}"
+        services[name] = {
+            "image": f"simcore/services/dynamic/{name}:1.0.{image_index}",
+            "build": {
+                "context": f"./services/{name}",
+                "dockerfile": "Dockerfile",
+                # ooil renders the `.osparc` metadata, the version included
+                "labels": {
+                    **{
+                        f"io.simcore.{key}": "x" * label_size
+                        for key in ("description", "inputs", "outputs", "settings")
+                    },
+                    "io.simcore.version": f'{{"version": "1.0.{image_index}"}}',
+                },
+            },
+        }
+    return {"services": services}
+
+
+def _create_repo(root: Path, repo_index: int, images: int, label_size: int) -> Path:
+    work_dir = root / "work" / f"repo-{repo_index}"
+    (work_dir / ".osparc").mkdir(parents=True)
+    for image_index in range(images):
+        service_dir = work_dir / "services" / f"bench-{repo_index}-{image_index}"
+        service_dir.mkdir(parents=True)
+        (service_dir / "Dockerfile").write_text("FROM scratch\n")
+        (work_dir / ".osparc" / f"bench-{repo_index}-{image_index}").mkdir()
+        (
+            work_dir / ".osparc" / f"bench-{repo_index}-{image_index}" / "metadata.yml"
+        ).write_text(f"version: 1.0.{image_index}\n")
+    (work_dir / ".osparc" / "docker-compose.bench.yml").write_text(
+        yaml.safe_dump(_compose_spec(repo_index, images, label_size))
+    )
+
+    _git("init", "-q", "-b", BRANCH, cwd=work_dir)
+    _git("add", ".", cwd=work_dir)
+    _git(
+        "-c",
+        "user.name=bench",
+        "-c",
+        "user.email=bench@bench.local",
+        "commit",
+        "-q",
+        "-m",
+        "initial",
+        cwd=work_dir,
+    )
+    bare_dir = root / "remotes" / f"repo-{repo_index}.git"
+    bare_dir.parent.mkdir(parents=True, exist_ok=True)
+    _git("clone", "-q", "--bare", f"{work_dir}", f"{bare_dir}", cwd=root)
+    return bare_dir
+
+
+def install_stub_ooil(root: Path) -> Path:
+    bin_dir = root / "bin"
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    ooil = bin_dir / "ooil"
+    ooil.write_text(_STUB_OOIL.format(python=sys.executable))
+    ooil.chmod(ooil.stat().st_mode | stat.S_IEXEC)
+    return bin_dir
+
+
+def git_environment(root: Path) -> Dict[str, str]:
+    """rewrites the remote addresses used in the config to the local bare repos"""
+    remotes = f"file://{root / 'remotes'}/"
+    rewrites = [
+        f"https://{DEPLOY_USER}:{DEPLOY_PASSWORD}@{GITLAB_HOST}/bench/",
+        "https://github.com/bench/",
+    ]
+    env = {"GIT_CONFIG_COUNT": f"{len(rewrites)}", "GIT_TERMINAL_PROMPT": "0"}
+    for k, rewrite in enumerate(rewrites):
+        env[f"GIT_CONFIG_KEY_{k}"] = f"url.{remotes}.insteadOf"
+        env[f"GIT_CONFIG_VALUE_{k}"] = rewrite
+    return env
+
+
+def create_world(
+    root: Path,
+    services: FakeServices,
+    repos: int,
+    images: int,
+    outdated_percent: float,
+    label_size: int = 64,
+    seed: int = 42,
+) -> Path:
+    """creates repos, registers them with the fake services, returns the config"""
+    rng = random.Random(seed)
+    repositories: List[Dict[str, Any]] = []
+
+    for repo_index in range(repos):
+        bare_dir = _create_repo(root, repo_index, images, label_size)
+        branch_hash = _git("rev-parse", BRANCH, cwd=bare_dir)
+
+        local_to_test = {}
+        test_to_release = {}
+        for image_index in range(images):
+            name = f"bench-{repo_index}-{image_index}"
+            local_name = f"simcore/services/dynamic/{name}"
+            test_name = f"ci/builder/bench/{name}"
+            release_name = f"ci/bench/{name}"
+            local_to_test[local_name] = test_name
+            test_to_release[test_name] = release_name
+
+            tags = {"0.9.0"}
+            if rng.random() * 100 >= outdated_percent:
+                tags.add(f"1.0.{image_index}")
+            services.registry_tags[release_name] = tags
+
+        repo_entry: Dict[str, Any] = {
+            "branch": BRANCH,
+            "registry": {
+                "target": "bench",
+                "local_to_test": local_to_test,
+                "test_to_release": test_to_release,
+            },
+        }
+        if repo_index % 2 == 0:
+            address = f"https://{GITLAB_HOST}/bench/repo-{repo_index}.git"
+            project_id = repo_index + 1
+            services.gitlab_projects[address] = project_id
+            services.gitlab_green_hashes[project_id] = {branch_hash}
+            repo_entry.update(
+                address=address,
+                host_type="gitlab",
+                gitlab={
+                    "personal_access_token": "bench-token",
+                    "deploy_token_username": DEPLOY_USER,
+                    "deploy_token_password": DEPLOY_PASSWORD,
+                },
+            )
+        else:
+            address = f"https://github.com/bench/repo-{repo_index}.git"
+            services.github_green_runs[f"bench/repo-{repo_index}"] = [
+                {"branch": BRANCH, "hash": branch_hash}
+            ]
+            repo_entry.update(
+                address=address,
+                host_type="github",
+                github={"github_token": "bench-token"},
+            )
+        repositories.append(repo_entry)
+
+    config = {
+        "registries": {
+            "bench": {
+                "address": REGISTRY_HOST,
+                "user": "bench",
+                "password": "bench",
+            }
+        },
+        "repositories": repositories,
+    }
+    config_path = root / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config, sort_keys=False))
+    return config_path
+
+
+def world_environment(root: Path) -> Dict[str, str]:
+    bin_dir = install_stub_ooil(root)
+    return {
+        **git_environment(root),
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+    }
@@ -1 +1,7 @@
-from ._meta import __version__
+def __getattr__(name: str) -> str:
+    # resolved on first access, importlib.metadata is slow to import
+    if name == "__version__":
+        from ._meta import __version__
+
+        return __version__
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
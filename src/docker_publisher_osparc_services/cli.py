@@ -1,128 +1,160 @@
-import asyncio
+"""
+Entry point of `dpos`. It runs in many short CI jobs: only click and the
+standard library are imported here, everything else is imported by the
+command which needs it (see `benchmarks/bench_startup.py`).
+"""
+
+import sys
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
 
 import click
 
-from . import __version__
-from .gitlab_ci_setup.commands import (
-    assemble_env_vars,
-    get_commands_test_base,
-    get_commands_push,
-    get_commands_build_base,
-    validate_commands_list,
-)
-from .gitlab_ci_setup.pipeline_config import PipelineConfig, PipelineGenerator
-from .http_interface import get_tags_for_repo
-from .models import ConfigModel
-from .operations import (
-    assemble_compose,
-    clone_repo,
-    did_ci_pass,
-    fetch_images_from_compose_spec,
-    get_branch_hash,
-)
-
-
-async def run_command(config: Path, legacy_escape: bool) -> None:
-    cfg = ConfigModel.from_cfg_path(config)
-    print(cfg)
-
-    async with PipelineGenerator() as pipeline_generator:
-        for repo_model in cfg.repositories:
-            branch_hash = await get_branch_hash(repo_model)
-            target = f"'{repo_model.repo}@{repo_model.branch}#{branch_hash}'"
-
-            if not await did_ci_pass(repo_model, branch_hash):
-                print(f"CI FAILED for {target}, no build will be triggered!")
-                continue
-
-            print(f"CI OK for {target}")
-
-            await clone_repo(repo_model)
-            # invoke ooil to generate docker-compose.yml
-            # extract tags from the images build in docker-compose.yaml
-            # check if tags exist
-            await assemble_compose(repo_model)
-            images = fetch_images_from_compose_spec(repo_model)
-
-            # check if image is present in repository
-            for image in images:
-                image_name, tag = image.split(":")
-
-                if image_name in repo_model.registry.skip_images:
-                    print(
-                        f"Skipping {image_name}, used as a dependency by other images"
-                    )
-                    continue
-
-                if image_name not in repo_model.registry.local_to_test:
-                    raise ValueError(
-                        (
-                            f"Image={image_name} expected to be defined in "
-                            f"local_to_test={repo_model.registry.local_to_test}"
-                        )
-                    )
-                test_name = repo_model.registry.local_to_test[image_name]
-                release_name = repo_model.registry.test_to_release[test_name]
-                tags = await get_tags_for_repo(
-                    cfg.registries[repo_model.registry.target], release_name
-                )
-                print(
-                    f"Checking tag '{tag}' for '{image}' was pushed at '{release_name}'. "
-                    f"List of remote tags {[t for t in tags]}"
-                )
-
-                if tag not in tags:
-                    print(f"Assembling pipeline for image {image}")
-                    # write pipeline configuration here in the folder or append it as a result of this job
-                    # just have some scripts to be generated with commands or something!
-                    # how do I determine if there is a test stage?
-
-                    # build commands validation
-                    env_vars = assemble_env_vars(
-                        repo_model=repo_model,
-                        image_name=image_name,
-                        registries=cfg.registries,
-                        tag=tag,
-                    )
-
-                    build_commands = get_commands_build_base(
-                        repo_model.pre_docker_build_hooks, legacy_escape
-                    )
-                    validate_commands_list(build_commands, env_vars)
-
-                    # check if test stage is required
-                    test_commands = None
-                    if repo_model.ci_stage_test_script is not None:
-                        # test commands assembly and validation
-                        test_commands = (
-                            get_commands_test_base() + repo_model.ci_stage_test_script
-                        )
-                        validate_commands_list(test_commands, env_vars)
-
-                    # deploy stage validation
-                    push_commands = get_commands_push()
-                    validate_commands_list(push_commands, env_vars)
-
-                    pipeline_config = PipelineConfig(
-                        target=image_name,
-                        build=build_commands,
-                        test=test_commands,
-                        push=push_commands,
-                    )
-                    pipeline_config.write_config()
-                    await pipeline_generator.add_pipeline_from(
-                        pipeline_config, env_vars
-                    )
-                else:
-                    print(
-                        f"No pipline will be generated, tag '{tag}' for image "
-                        f"'{image}' already present."
-                    )
-
-
-@click.command()
-@click.version_option(version=__version__)
+from .gitlab_ci_setup.constants import (
+    EXECUTOR_GITLAB,
+    EXECUTOR_LOCAL,
+    GENERATED_PIPELINE_PATH,
+)
+
+if TYPE_CHECKING:
+    from .sharding import Shard
+
+
+class _DefaultCommandGroup(click.Group):
+    """invokes `default_command` if the first argument is not a subcommand"""
+
+    def __init__(self, *args, default_command: str, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx: click.Context, args: List[str]) -> List[str]:
+        if (
+            args
+            and args[0] not in self.commands
+            and args[0] not in ctx.help_option_names + ["--version"]
+        ):
+            args = [self.default_command, *args]
+        return super().parse_args(ctx, args)
+
+
+def _parse_shard(
+    ctx: click.Context, param: click.Parameter, value: Optional[str]
+) -> Optional["Shard"]:
+    if value is None:
+        return None
+    from .sharding import Shard
+
+    try:
+        return Shard.parse(value)
+    except ValueError as exc:
+        raise click.BadParameter(f"{exc}") from exc
+
+
+def _parse_workspace_quota(
+    ctx: click.Context, param: click.Parameter, value: Optional[str]
+) -> Optional[int]:
+    if value is None:
+        return None
+    from .workspace import parse_size
+
+    try:
+        return parse_size(value)
+    except ValueError as exc:
+        raise click.BadParameter(f"{exc}") from exc
+
+
+def _print_version(ctx: click.Context, param: click.Parameter, value: bool) -> None:
+    # reading the installed version requires importlib.metadata, only when asked
+    if not value or ctx.resilient_parsing:
+        return
+    from . import __version__
+
+    click.echo(f"{ctx.find_root().info_name}, version {__version__}")
+    ctx.exit()
+
+
+def _workspace_options(command: Callable) -> Callable:
+    """options shared by all commands cloning repositories"""
+    command = click.option(
+        "--workspace-quota",
+        type=str,
+        default=None,
+        callback=_parse_workspace_quota,
+        help="Fail if the clones use more disk space than this, e.g. '2G'.",
+    )(command)
+    command = click.option(
+        "--keep-workspace",
+        is_flag=True,
+        default=False,
+        help="Do not remove the clones, e.g. to inspect them after the run.",
+    )(command)
+    command = click.option(
+        "--workspace",
+        "workspace_root",
+        type=Path,
+        default=None,
+        help="Directory where repositories are cloned, the system temporary directory by default.",
+    )(command)
+    return command
+
+
+def _timeout_options(command: Callable) -> Callable:
+    """options shared by all commands evaluating repositories"""
+    command = click.option(
+        "--phase-timeout",
+        type=click.FloatRange(min=0, min_open=True),
+        default=600,
+        show_default=True,
+        help="Seconds for each phase of a repository (ls-remote, CI check, clone, ...).",
+    )(command)
+    command = click.option(
+        "--repo-timeout",
+        type=click.FloatRange(min=0, min_open=True),
+        default=1200,
+        show_default=True,
+        help="Seconds for evaluating a repository, it is skipped when exceeded.",
+    )(command)
+    return command
+
+
+def _config_options(command: Callable) -> Callable:
+    """options shared by all commands loading the configuration"""
+    command = click.option(
+        "--config-cache",
+        is_flag=True,
+        envvar="DPOS_CONFIG_CACHE",
+        default=False,
+        help=(
+            "Cache the parsed configuration in ~/.cache/dpos or $DPOS_CACHE_DIR, "
+            "read from DPOS_CONFIG_CACHE if not provided. Saves parsing large "
+            "configurations, but the cache holds the substituted environment "
+            "variables, i.e. registry and GitLab credentials, in a file only "
+            "readable by its owner. Do not use on shared runners."
+        ),
+    )(command)
+    return command
+
+
+def _config_cache_dir(config_cache: bool) -> Optional[Path]:
+    from .config_loader import default_cache_dir
+
+    return default_cache_dir() if config_cache else None
+
+
+@click.group(cls=_DefaultCommandGroup, default_command="run")
+@click.option(
+    "--version",
+    is_flag=True,
+    expose_value=False,
+    is_eager=True,
+    callback=_print_version,
+    help="Show the version and exit.",
+)
+def main() -> None:
+    """Interface to be used in CI"""
+
+
+@main.command()
 @click.argument("config", type=Path)
 @click.option(
     "--legacy-escape",
@@ -130,9 +162,352 @@ async def run_command(config: Path, legacy_escape: bool) -> None:
     default=False,
     help="Enable legacy escape for ooil commands.",
 )
-def main(config: Path, legacy_escape: bool = False) -> None:
-    """Interface to be used in CI"""
-    asyncio.get_event_loop().run_until_complete(run_command(config, legacy_escape))
+@click.option(
+    "--compact-pipeline",
+    is_flag=True,
+    default=False,
+    help=(
+        "Generate a compact child pipeline: shared variables are moved to `.basic` "
+        "and images with identical jobs are collapsed into `parallel:matrix` entries."
+    ),
+)
+@click.option(
+    "--print-pipeline",
+    is_flag=True,
+    default=False,
+    help="Print the generated pipeline, by default only a summary is printed.",
+)
+@click.option(
+    "--executor",
+    type=click.Choice([EXECUTOR_GITLAB, EXECUTOR_LOCAL]),
+    default=EXECUTOR_GITLAB,
+    show_default=True,
+    help=(
+        "'gitlab' generates the child pipeline, 'local' runs the build, test "
+        "and push jobs directly on this host."
+    ),
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Amount of jobs running concurrently with the local executor.",
+)
+@click.option(
+    "--trace",
+    type=Path,
+    default=None,
+    help=(
+        "Record timings of each repository, phase, HTTP request and subprocess "
+        "to this file (Chrome trace-event format) and print the slowest ones."
+    ),
+)
+@click.option(
+    "--metrics-textfile",
+    type=Path,
+    default=None,
+    help="Write Prometheus metrics of the sweep to this file (textfile collector).",
+)
+@click.option(
+    "--metrics-pushgateway",
+    type=str,
+    default=None,
+    help="Push Prometheus metrics of the sweep to this pushgateway URL.",
+)
+@click.option(
+    "--shard",
+    type=str,
+    default=None,
+    callback=_parse_shard,
+    help=(
+        "Only process the 'i/N' share of the repositories (1 based, e.g. "
+        "$CI_NODE_INDEX/$CI_NODE_TOTAL) and write a partial pipeline, to be "
+        "combined with 'merge-pipelines'."
+    ),
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help=(
+        "Amount of repositories evaluated concurrently. Above 1 the slowest "
+        "repositories are evaluated first, see --history."
+    ),
+)
+@click.option(
+    "--history",
+    "history_path",
+    type=Path,
+    default=None,
+    help=(
+        "Durations measured by previous runs, used to evaluate the slowest "
+        "repositories first. Default with --concurrency above 1: history.json "
+        "in ~/.cache/dpos or $DPOS_CACHE_DIR. With --concurrency 1 the order "
+        "cannot change the duration, the history is only used if given."
+    ),
+)
+@click.option(
+    "--no-history",
+    is_flag=True,
+    default=False,
+    help="Evaluate repositories in configuration order and record nothing.",
+)
+@click.option(
+    "--print-schedule",
+    is_flag=True,
+    default=False,
+    help=(
+        "Print the evaluation order and the predicted duration of the sweep "
+        "(the sum of all durations with --concurrency 1)."
+    ),
+)
+@_workspace_options
+@_timeout_options
+@_config_options
+@click.option(
+    "--fail-on-error",
+    is_flag=True,
+    default=False,
+    help="Exit with code 1 if a repository was skipped because of an error or timeout.",
+)
+def run(
+    config: Path,
+    legacy_escape: bool = False,
+    compact_pipeline: bool = False,
+    print_pipeline: bool = False,
+    executor: str = EXECUTOR_GITLAB,
+    jobs: int = 1,
+    trace: Optional[Path] = None,
+    metrics_textfile: Optional[Path] = None,
+    metrics_pushgateway: Optional[str] = None,
+    shard: Optional["Shard"] = None,
+    concurrency: int = 1,
+    history_path: Optional[Path] = None,
+    no_history: bool = False,
+    print_schedule: bool = False,
+    workspace_root: Optional[Path] = None,
+    keep_workspace: bool = False,
+    workspace_quota: Optional[int] = None,
+    repo_timeout: float = 1200,
+    phase_timeout: float = 600,
+    config_cache: bool = False,
+    fail_on_error: bool = False,
+) -> None:
+    """Generates the child pipeline for all outdated images (default command)"""
+    import asyncio
+
+    from .evaluation import Timeouts
+    from .runner import run_command
+    from .scheduling import default_history_path
+    from .workspace import Workspace
+
+    if no_history:
+        history_path = None
+    elif history_path is None and concurrency > 1:
+        # evaluated one at a time the order does not change the duration
+        history_path = default_history_path()
+
+    skipped = asyncio.get_event_loop().run_until_complete(
+        run_command(
+            config,
+            legacy_escape=legacy_escape,
+            compact_pipeline=compact_pipeline,
+            print_pipeline=print_pipeline,
+            executor=executor,
+            jobs=jobs,
+            trace=trace,
+            metrics_textfile=metrics_textfile,
+            metrics_pushgateway=metrics_pushgateway,
+            shard=shard,
+            workspace=Workspace(workspace_root, keep_workspace, workspace_quota),
+            timeouts=Timeouts(repository=repo_timeout, phase=phase_timeout),
+            concurrency=concurrency,
+            history_path=history_path,
+            print_schedule=print_schedule,
+            config_cache_dir=_config_cache_dir(config_cache),
+        )
+    )
+    if skipped and fail_on_error:
+        sys.exit(1)
+
+
+@main.command()
+@click.argument("config", type=Path)
+@click.option(
+    "--repo",
+    "repo_filters",
+    multiple=True,
+    help="Only evaluate repositories whose 'address@branch' contains this text.",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=8,
+    show_default=True,
+    help="Amount of repositories evaluated concurrently.",
+)
+@click.option(
+    "--json", "as_json", is_flag=True, default=False, help="One JSON record per image."
+)
+@_workspace_options
+@_timeout_options
+@_config_options
+@click.option(
+    "--fail-on-error",
+    is_flag=True,
+    default=False,
+    help="Exit with code 1 if a repository could not be evaluated.",
+)
+def plan(
+    config: Path,
+    repo_filters: Tuple[str, ...],
+    concurrency: int,
+    as_json: bool,
+    workspace_root: Optional[Path] = None,
+    keep_workspace: bool = False,
+    workspace_quota: Optional[int] = None,
+    repo_timeout: float = 1200,
+    phase_timeout: float = 600,
+    config_cache: bool = False,
+    fail_on_error: bool = False,
+) -> None:
+    """Shows what would be built, without writing any files"""
+    import asyncio
+
+    from .evaluation import Timeouts
+    from .runner import plan_command
+    from .workspace import Workspace
+
+    skipped = asyncio.get_event_loop().run_until_complete(
+        plan_command(
+            config,
+            repo_filters=repo_filters,
+            concurrency=concurrency,
+            as_json=as_json,
+            workspace=Workspace(workspace_root, keep_workspace, workspace_quota),
+            timeouts=Timeouts(repository=repo_timeout, phase=phase_timeout),
+            config_cache_dir=_config_cache_dir(config_cache),
+        )
+    )
+    if skipped and fail_on_error:
+        sys.exit(1)
+
+
+@main.command("merge-pipelines")
+@click.argument(
+    "inputs", nargs=-1, required=True, type=click.Path(exists=True, path_type=Path)
+)
+@click.option(
+    "-o",
+    "--output",
+    type=Path,
+    default=GENERATED_PIPELINE_PATH,
+    show_default=True,
+    help="Where to write the combined child pipeline.",
+)
+def merge_pipelines(inputs: Tuple[Path, ...], output: Path) -> None:
+    """Combines the partial pipelines written by each shard"""
+    from .gitlab_ci_setup.pipeline_config import merge_pipeline_files
+
+    job_count = merge_pipeline_files(list(inputs), output)
+    print(
+        f"MERGED {len(inputs)} PIPELINES INTO '{output}' "
+        f"({job_count} jobs, {output.stat().st_size} bytes)"
+    )
+
+
+@main.command()
+@click.argument("config", type=Path)
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=click.IntRange(1, 65535), default=8080, show_default=True)
+@click.option(
+    "--webhook-secret",
+    envvar="DPOS_WEBHOOK_SECRET",
+    default=None,
+    help=(
+        "Expected X-Gitlab-Token, or key of the GitHub X-Hub-Signature-256. "
+        "Read from DPOS_WEBHOOK_SECRET if not provided."
+    ),
+)
+@click.option(
+    "--reconcile-interval",
+    type=click.FloatRange(min=1),
+    default=3600,
+    show_default=True,
+    help="Seconds between full re-evaluations of all repositories.",
+)
+@click.option(
+    "--concurrency",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="Amount of repositories evaluated concurrently.",
+)
+@click.option(
+    "--output-dir",
+    type=Path,
+    default=Path("pipelines"),
+    show_default=True,
+    help="Where a child pipeline is written for each repository requiring builds.",
+)
+@click.option(
+    "--compact-pipeline",
+    is_flag=True,
+    default=False,
+    help="Generate compact child pipelines, see 'run --help'.",
+)
+@click.option(
+    "--legacy-escape",
+    is_flag=True,
+    default=False,
+    help="Enable legacy escape for ooil commands.",
+)
+@_workspace_options
+@_timeout_options
+@_config_options
+def serve(
+    config: Path,
+    host: str,
+    port: int,
+    webhook_secret: Optional[str],
+    reconcile_interval: float,
+    concurrency: int,
+    output_dir: Path,
+    compact_pipeline: bool,
+    legacy_escape: bool,
+    workspace_root: Optional[Path] = None,
+    keep_workspace: bool = False,
+    workspace_quota: Optional[int] = None,
+    repo_timeout: float = 1200,
+    phase_timeout: float = 600,
+    config_cache: bool = False,
+) -> None:
+    """Re-evaluates repositories when GitLab or GitHub webhooks arrive"""
+    import asyncio
+
+    from .evaluation import Timeouts
+    from .runner import serve_command
+    from .workspace import Workspace
+
+    asyncio.get_event_loop().run_until_complete(
+        serve_command(
+            config,
+            host=host,
+            port=port,
+            webhook_secret=webhook_secret,
+            reconcile_interval=reconcile_interval,
+            concurrency=concurrency,
+            output_dir=output_dir,
+            compact_pipeline=compact_pipeline,
+            legacy_escape=legacy_escape,
+            workspace=Workspace(workspace_root, keep_workspace, workspace_quota),
+            timeouts=Timeouts(repository=repo_timeout, phase=phase_timeout),
+            config_cache_dir=_config_cache_dir(config_cache),
+        )
+    )
 
 
 if __name__ == "__main__":
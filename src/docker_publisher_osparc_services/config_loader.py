@@ -0,0 +1,208 @@
+"""
+Loads the dpos configuration with the semantics of EnvYAML, which was used
+before: variables from the environment and from a `.env` file (`$ENV_FILE`
+or `.env` in the working directory) are substituted in the text before it
+is parsed, so `port: $PORT` is an int. Supported references are `$NAME`,
+`${NAME}`, `$NAME|default`, `${NAME|default}` and `$$` for a literal `$`.
+Undefined variables raise, unless `ENVYAML_STRICT_DISABLE` is set.
+
+The parsed result can be cached on disk, keyed by the hash of the
+substituted text. Since it holds the values taken from the environment,
+e.g. credentials, caching is opt-in and the files are only readable by
+their owner.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Set
+
+from .yaml_utils import safe_load
+
+ENV_CACHE_DIR = "DPOS_CACHE_DIR"
+ENV_FILE = "ENV_FILE"
+DEFAULT_ENV_FILE = ".env"
+ENV_STRICT_DISABLE = "ENVYAML_STRICT_DISABLE"
+CACHE_FORMAT = 2
+
+# same patterns as EnvYAML
+_RE_COMMENTS = re.compile(r"(^#.*\n)", re.MULTILINE | re.UNICODE | re.IGNORECASE)
+_RE_DOT_ENV = re.compile(
+    r"^(?!\d+)(?P<name>[\w\-\.]+)\=[\"\']?(?P<value>(.*?))[\"\']?$",
+    re.MULTILINE | re.UNICODE | re.IGNORECASE,
+)
+_RE_REFERENCE = re.compile(
+    r"(?P<pref>[\"\'])?"
+    r"(\$(?:(?P<escaped>(\$|\d+))|"
+    r"{(?P<braced>(.*?))(\|(?P<braced_default>.*?))?}|"
+    r"(?P<named>[\w\-\.]+)(\|(?P<named_default>.*))?))"
+    r"(?P<post>[\"\'])?",
+    re.MULTILINE | re.UNICODE | re.IGNORECASE,
+)
+
+
+def default_cache_dir() -> Path:
+    if os.environ.get(ENV_CACHE_DIR):
+        return Path(os.environ[ENV_CACHE_DIR])
+    cache_home = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(cache_home) / "dpos"
+
+
+def _is_strict(environ: Mapping[str, str]) -> bool:
+    return ENV_STRICT_DISABLE not in environ
+
+
+def read_env_file(env_file: Path, strict: bool = True) -> Dict[str, str]:
+    """`NAME=value` lines, `$` references are expanded from the environment"""
+    variables: Dict[str, str] = {}
+    defined_twice: Set[str] = set()
+    for entry in _RE_DOT_ENV.finditer(env_file.read_text(encoding="utf8")):
+        name, value = entry.group("name"), entry.group("value")
+        if name in variables:
+            defined_twice.add(name)
+        variables[name] = os.path.expandvars(value) if "$" in value else value
+    if strict and defined_twice:
+        raise ValueError(
+            "variables "
+            + ", ".join(f"${name}" for name in sorted(defined_twice))
+            + f" are defined several times in '{env_file}'"
+        )
+    return variables
+
+
+def load_environment() -> Dict[str, str]:
+    """the environment, updated with the `.env` file if there is one"""
+    environ = dict(os.environ)
+    env_file = os.environ.get(ENV_FILE) or (
+        DEFAULT_ENV_FILE if os.path.exists(DEFAULT_ENV_FILE) else None
+    )
+    if env_file:
+        environ.update(read_env_file(Path(env_file), _is_strict(environ)))
+    return environ
+
+
+def substitute_env(
+    content: str, environ: Mapping[str, str], strict: bool = True
+) -> str:
+    """replaces the references in the text, before parsing, as EnvYAML does"""
+    content = _RE_COMMENTS.sub("", content)
+    missing: Set[str] = set()
+    replaces: Dict[str, str] = {}
+    shifting = 0
+
+    for entry in _RE_REFERENCE.finditer(content):
+        groups = entry.groupdict()
+        variable, default = None, None
+        if groups["named"]:
+            variable, default = groups["named"], groups["named_default"]
+        elif groups["braced"]:
+            variable, default = groups["braced"], groups["braced_default"]
+        elif groups["escaped"] and "$" in groups["escaped"]:
+            # `content` is edited in place, spans refer to the original text
+            start, end = entry.span()
+            content = (
+                content[: start + shifting]
+                + groups["escaped"]
+                + content[end + shifting :]
+            )
+            shifting += len(groups["escaped"]) - (end - start)
+
+        if variable is None:
+            continue
+        if variable in environ:
+            replace = environ[variable]
+        elif default is not None:
+            replace = default
+        else:
+            missing.add(variable)
+            continue
+
+        search = "${" if groups["braced"] else "$"
+        search += variable
+        search += f"|{default}" if default is not None else ""
+        search += "}" if groups["braced"] else ""
+        replaces[search] = replace
+
+    if strict and missing:
+        raise ValueError(
+            "variables "
+            + ", ".join(f"${name}" for name in sorted(missing))
+            + " are not defined"
+        )
+    # longest first among references sharing a prefix, e.g. $AB before $A
+    for search in sorted(replaces, reverse=True):
+        content = content.replace(search, replaces[search])
+    return content
+
+
+class _ConfigCache:
+    """one JSON file per configuration path, written with mode 0600"""
+
+    def __init__(self, cache_dir: Path, config_path: Path) -> None:
+        key = hashlib.sha256(f"{config_path.resolve()}".encode()).hexdigest()
+        self.cache_dir = cache_dir
+        self.path = cache_dir / f"config-{key[:16]}.json"
+
+    def read(self, digest: str) -> Optional[Any]:
+        try:
+            entry = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return None
+        if (
+            not isinstance(entry, dict)
+            or entry.get("format") != CACHE_FORMAT
+            or entry.get("sha256") != digest
+        ):
+            return None
+        return entry["data"]
+
+    def write(self, digest: str, data: Any) -> None:
+        try:
+            content = json.dumps(
+                {"format": CACHE_FORMAT, "sha256": digest, "data": data}
+            )
+        except (TypeError, ValueError):
+            # e.g. YAML timestamps, which have no JSON representation
+            return
+        tmp_path = None
+        try:
+            self.cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as tmp_file:
+                tmp_file.write(content)
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            print(f"[WARNING] could not cache the configuration: {exc}")
+            if tmp_path is not None:
+                Path(tmp_path).unlink(missing_ok=True)
+
+
+def load_config_dict(
+    config_path: Path,
+    cache_dir: Optional[Path] = None,
+    environ: Optional[Mapping[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    parsed configuration with environment references substituted,
+    `environ` defaults to the environment and the `.env` file,
+    nothing is cached without `cache_dir`
+    """
+    environ = load_environment() if environ is None else environ
+    content = substitute_env(
+        config_path.read_text(encoding="utf8"), environ, _is_strict(environ)
+    )
+    if cache_dir is None:
+        data = safe_load(content)
+    else:
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        cache = _ConfigCache(cache_dir, config_path)
+        data = cache.read(digest)
+        if data is None:
+            data = safe_load(content)
+            cache.write(digest, data)
+    if not isinstance(data, dict):
+        raise ValueError(f"'{config_path}' does not contain a mapping")
+    return data
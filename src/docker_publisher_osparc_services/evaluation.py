@@ -0,0 +1,346 @@
+"""
+Evaluation phases of a repository: branch hash, CI verdict, clone, compose
+and tag lookups. Evaluating has no side effects on the working tree.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+
+from pydantic import BaseModel, Field
+
+from .exceptions import EvaluationTimeoutError
+from .http_interface import get_tags_for_repo
+from .models import ConfigModel, RepoModel
+from .operations import (
+    BuildSpec,
+    assemble_compose,
+    clone_repo,
+    did_ci_pass,
+    fetch_build_specs_from_compose_spec,
+    fetch_images_from_compose_spec,
+    get_branch_hash,
+    get_content_hash,
+)
+from .tracing import CATEGORY_REPO, record_event, span
+from .workspace import Workspace
+
+TREE_TAG_PREFIX = "tree-"
+REVISION_TAG_PREFIX = "rev-"
+
+T = TypeVar("T")
+
+
+class Timeouts(BaseModel):
+    repository: Optional[float] = Field(
+        None, description="seconds for all phases of a repository, None for no limit"
+    )
+    phase: Optional[float] = Field(
+        None, description="seconds for each phase, None for no limit"
+    )
+
+
+class ImageEvaluation(BaseModel):
+    image_name: str
+    tag: str
+    test_image: str
+    release_image: str
+    release_tag_exists: bool = Field(
+        ..., description="True if the tag was already pushed to the release image"
+    )
+    revision: str = Field(
+        ..., description="commit the image is built from, the branch hash"
+    )
+    test_tag_exists: bool = Field(
+        False,
+        description=(
+            "True if a previous run already pushed the test image built from "
+            "the same source, i.e. its revision tag"
+        ),
+    )
+    tree_hash: Optional[str] = Field(
+        None,
+        description=(
+            "hash of the build context tree and of the rendered build section, "
+            "in content addressed mode"
+        ),
+    )
+
+    @property
+    def tree_tag(self) -> Optional[str]:
+        return None if self.tree_hash is None else f"{TREE_TAG_PREFIX}{self.tree_hash}"
+
+    @property
+    def revision_tag(self) -> str:
+        """tag of the test image identifying the source it was built from"""
+        return self.tree_tag or f"{REVISION_TAG_PREFIX}{self.revision}"
+
+
+class RepoEvaluation(BaseModel):
+    repo_model: RepoModel
+    branch_hash: Optional[str] = None
+    ci_passed: bool = False
+    images: List[ImageEvaluation] = Field(default_factory=list)
+    timings: Dict[str, float] = Field(
+        default_factory=dict, description="seconds spent in each phase"
+    )
+    error: Optional[str] = Field(
+        None, description="why the evaluation did not complete, images are partial"
+    )
+    timed_out: bool = False
+
+    @property
+    def outdated_images(self) -> List[ImageEvaluation]:
+        return [image for image in self.images if not image.release_tag_exists]
+
+
+@contextmanager
+def _phase(timings: Dict[str, float], name: str, **args) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        with span(name, **args):
+            yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+async def _with_deadline(
+    awaitable: Awaitable[T], timeout: Optional[float], scope: str
+) -> T:
+    # on timeout the awaitable is cancelled, subprocesses are killed
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError as exc:
+        raise EvaluationTimeoutError(scope, timeout or 0) from exc
+
+
+async def _run_phase(
+    timings: Dict[str, float],
+    timeouts: Timeouts,
+    name: str,
+    awaitable: Awaitable[T],
+    **args: Any,
+) -> T:
+    with _phase(timings, name, **args):
+        return await _with_deadline(awaitable, timeouts.phase, f"phase '{name}'")
+
+
+async def _evaluate_images(
+    cfg: ConfigModel,
+    repo_model: RepoModel,
+    evaluation: RepoEvaluation,
+    images: List[str],
+    build_specs: Dict[str, Optional[BuildSpec]],
+    timeouts: Timeouts,
+) -> None:
+    """checks if each image is present in the registry"""
+    assert evaluation.branch_hash
+    timings = evaluation.timings
+    for image in images:
+        image_name, tag = image.split(":")
+
+        if image_name in repo_model.registry.skip_images:
+            print(f"Skipping {image_name}, used as a dependency by other images")
+            continue
+
+        if image_name not in repo_model.registry.local_to_test:
+            raise ValueError(
+                (
+                    f"Image={image_name} expected to be defined in "
+                    f"local_to_test={repo_model.registry.local_to_test}"
+                )
+            )
+        test_name = repo_model.registry.local_to_test[image_name]
+        release_name = repo_model.registry.test_to_release[test_name]
+        tags = await _run_phase(
+            timings,
+            timeouts,
+            "tag-lookup",
+            get_tags_for_repo(cfg.registries[repo_model.registry.target], release_name),
+            image=image_name,
+        )
+        print(
+            f"Checking tag '{tag}' for '{image}' was pushed at '{release_name}'. "
+            f"List of remote tags {[t for t in tags]}"
+        )
+        record_event("tag-lookup", result="hit" if tag in tags else "miss")
+
+        image_evaluation = ImageEvaluation(
+            image_name=image_name,
+            tag=tag,
+            test_image=test_name,
+            release_image=release_name,
+            release_tag_exists=tag in tags,
+            revision=evaluation.branch_hash,
+        )
+        build_spec = build_specs.get(image)
+        if not image_evaluation.release_tag_exists and build_spec is not None:
+            image_evaluation.tree_hash = await _run_phase(
+                timings,
+                timeouts,
+                "tree-hash",
+                get_content_hash(repo_model, build_spec),
+                image=image_name,
+            )
+        if not image_evaluation.release_tag_exists:
+            # a retried run tests and pushes the image built by the failed one,
+            # only if it was built from the same source: a bare tag match could
+            # be an image built before a fix which did not bump the version
+            test_tags = await _run_phase(
+                timings,
+                timeouts,
+                "tag-lookup",
+                get_tags_for_repo(
+                    cfg.registries[repo_model.registry.target], test_name
+                ),
+                image=image_name,
+            )
+            image_evaluation.test_tag_exists = (
+                image_evaluation.revision_tag in test_tags
+            )
+        evaluation.images.append(image_evaluation)
+
+
+async def _evaluate(
+    cfg: ConfigModel,
+    evaluation: RepoEvaluation,
+    workspace: Workspace,
+    timeouts: Timeouts,
+) -> None:
+    repo_model = evaluation.repo_model
+    timings = evaluation.timings
+
+    evaluation.branch_hash = await _run_phase(
+        timings, timeouts, "ls-remote", get_branch_hash(repo_model)
+    )
+    target = f"'{repo_model.repo}@{repo_model.branch}#{evaluation.branch_hash}'"
+
+    evaluation.ci_passed = await _run_phase(
+        timings,
+        timeouts,
+        "ci-check",
+        did_ci_pass(repo_model, evaluation.branch_hash),
+    )
+    if not evaluation.ci_passed:
+        print(f"CI FAILED for {target}, no build will be triggered!")
+        record_event("repo-outcome", outcome="ci-failed")
+        return
+
+    print(f"CI OK for {target}")
+
+    # the clone is only required during the evaluation
+    with workspace.repository_dir(repo_model) as repo_dir:
+        try:
+            await _run_phase(
+                timings, timeouts, "clone", clone_repo(repo_model, repo_dir / "clone")
+            )
+            workspace.check_quota()
+            # invoke ooil to generate docker-compose.yml
+            # extract tags from the images build in docker-compose.yaml
+            with _phase(timings, "compose"):
+                await _with_deadline(
+                    assemble_compose(repo_model), timeouts.phase, "phase 'compose'"
+                )
+                images = fetch_images_from_compose_spec(repo_model)
+                build_specs = (
+                    fetch_build_specs_from_compose_spec(repo_model)
+                    if repo_model.content_addressed
+                    else {}
+                )
+
+            await _evaluate_images(
+                cfg, repo_model, evaluation, images, build_specs, timeouts
+            )
+        finally:
+            repo_model.clone_path = None
+
+    record_event(
+        "repo-outcome",
+        outcome="outdated" if evaluation.outdated_images else "up-to-date",
+    )
+
+
+async def evaluate_repository(
+    cfg: ConfigModel,
+    repo_model: RepoModel,
+    workspace: Workspace,
+    timeouts: Optional[Timeouts] = None,
+) -> RepoEvaluation:
+    """
+    Never raises: errors and timeouts are stored in the returned evaluation,
+    so one repository cannot stop the others.
+    """
+    timeouts = timeouts or Timeouts()
+    evaluation = RepoEvaluation(repo_model=repo_model)
+    try:
+        await _with_deadline(
+            _evaluate(cfg, evaluation, workspace, timeouts),
+            timeouts.repository,
+            "repository",
+        )
+    except EvaluationTimeoutError as exc:
+        evaluation.error = f"{exc}"
+        evaluation.timed_out = True
+    except Exception as exc:  # pylint: disable=broad-except
+        evaluation.error = f"{exc.__class__.__name__}: {exc}"
+
+    if evaluation.error is not None:
+        print(f"[WARNING] {repo_span_name(repo_model)} skipped: {evaluation.error}")
+        record_event(
+            "repo-outcome", outcome="timed-out" if evaluation.timed_out else "failed"
+        )
+    return evaluation
+
+
+def repo_span_name(repo_model: RepoModel) -> str:
+    return f"{repo_model.http_url_to_repo}@{repo_model.branch}"
+
+
+async def _evaluate_in_span(
+    cfg: ConfigModel, repo_model: RepoModel, workspace: Workspace, timeouts: Timeouts
+) -> RepoEvaluation:
+    with span(
+        repo_span_name(repo_model), CATEGORY_REPO, repo=repo_model.http_url_to_repo
+    ):
+        return await evaluate_repository(cfg, repo_model, workspace, timeouts)
+
+
+async def evaluate_repositories(
+    cfg: ConfigModel,
+    repo_models: Sequence[RepoModel],
+    workspace: Workspace,
+    concurrency: int = 1,
+    timeouts: Optional[Timeouts] = None,
+) -> AsyncIterator[RepoEvaluation]:
+    """evaluates up to `concurrency` repositories at once, yields as they complete"""
+    timeouts = timeouts or Timeouts()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _bounded(repo_model: RepoModel) -> RepoEvaluation:
+        async with semaphore:
+            return await _evaluate_in_span(cfg, repo_model, workspace, timeouts)
+
+    if concurrency == 1:
+        for repo_model in repo_models:
+            yield await _evaluate_in_span(cfg, repo_model, workspace, timeouts)
+        return
+
+    tasks = [asyncio.create_task(_bounded(repo_model)) for repo_model in repo_models]
+    try:
+        for next_completed in asyncio.as_completed(tasks):
+            yield await next_completed
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -70,4 +70,49 @@ class RegistryRequestUnparseableJsonError(BaseAppException):
             f"Registry request to '{requested_url}' returned non-JSON response "
             f"(status_code={status_code}, content-type={content_type!r}). "
             f"Response body: {response_body!r}"
-        )
\ No newline at end of file
+        )
+
+
+class InvalidPipelineError(BaseAppException):
+    """raised if the generated pipeline does not respect the GitLab CI schema"""
+
+    def __init__(self, job_name: str, reason: str) -> None:
+        self.job_name = job_name
+        super().__init__(f"Invalid GitLab CI job '{job_name}': {reason}")
+
+
+class WebhookRejectedError(BaseAppException):
+    """raised if a webhook request is not authenticated or cannot be parsed"""
+
+    def __init__(self, status_code: int, reason: str) -> None:
+        self.status_code = status_code
+        super().__init__(reason)
+
+
+class WorkspaceQuotaExceededError(BaseAppException):
+    """raised if the workspace uses more disk space than allowed"""
+
+    def __init__(self, path, used: int, quota: int) -> None:
+        super().__init__(
+            f"Workspace '{path}' uses {used} bytes, more than the quota of {quota} bytes"
+        )
+
+
+class EvaluationTimeoutError(BaseAppException):
+    """raised if a repository or one of its phases exceeds its time budget"""
+
+    def __init__(self, scope: str, timeout: float) -> None:
+        self.scope = scope
+        self.timeout = timeout
+        super().__init__(f"{scope} exceeded its time budget of {timeout:g}s")
+
+
+class RegistryAuthVariableCollisionError(BaseAppException):
+    """raised if several registries would share the same credentials variable"""
+
+    def __init__(self, variable: str, registries) -> None:
+        self.variable = variable
+        self.registries = registries
+        super().__init__(
+            f"Registries {registries} all map to the variable '{variable}', rename them"
+        )
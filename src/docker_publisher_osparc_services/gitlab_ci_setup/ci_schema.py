@@ -0,0 +1,142 @@
+"""
+Subset of the GitLab CI schema covering the keywords used by the generated
+child pipelines. Used to validate jobs locally, before GitLab rejects them.
+"""
+
+from typing import Dict, List, Optional, Set, Union
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+from ..exceptions import InvalidPipelineError
+from .pipeline_writer import (
+    MAX_JOB_NAME_LENGTH,
+    MAX_MATRIX_ENTRIES,
+    Job,
+    Pipeline,
+)
+
+RESERVED_KEYWORDS: Set[str] = {
+    "stages",
+    "variables",
+    "default",
+    "include",
+    "workflow",
+}
+
+
+class ParallelMatrix(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    matrix: List[Dict[str, Union[str, List[str]]]] = Field(
+        ..., min_length=1, max_length=MAX_MATRIX_ENTRIES
+    )
+
+
+class GitlabJob(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    extends: Optional[str] = None
+    image: Optional[str] = None
+    stage: Optional[str] = None
+    tags: Optional[List[str]] = None
+    needs: Optional[List[str]] = None
+    variables: Optional[Dict[str, str]] = None
+    script: Optional[List[str]] = Field(None, min_length=1)
+    parallel: Optional[Union[int, ParallelMatrix]] = Field(
+        None, description="either a job count (2 to 200) or a matrix"
+    )
+
+    def to_dict(self) -> Job:
+        return self.model_dump(exclude_none=True)
+
+
+class PipelineValidator:
+    """
+    Validates a pipeline incrementally, one job at a time. References
+    between jobs (`needs`, `extends`) are checked once all jobs are known.
+    """
+
+    def __init__(self, stages: List[str]) -> None:
+        self.stages = stages
+        self._templates: Dict[str, GitlabJob] = {}
+        self._job_names: Set[str] = set()
+        self._needs: Dict[str, List[str]] = {}
+
+    @property
+    def job_count(self) -> int:
+        return len(self._job_names)
+
+    def add_job(self, name: str, job: Job) -> GitlabJob:
+        try:
+            gitlab_job = GitlabJob.model_validate(job)
+        except ValidationError as exc:
+            raise InvalidPipelineError(name, f"{exc}") from exc
+
+        if name.startswith("."):
+            self._templates[name] = gitlab_job
+            return gitlab_job
+
+        if name in self._job_names:
+            raise InvalidPipelineError(name, "job defined more than once")
+        if len(name) > MAX_JOB_NAME_LENGTH:
+            raise InvalidPipelineError(
+                name, f"name is longer than {MAX_JOB_NAME_LENGTH} characters"
+            )
+        if gitlab_job.extends is not None and gitlab_job.extends not in self._templates:
+            raise InvalidPipelineError(
+                name, f"extends unknown template '{gitlab_job.extends}'"
+            )
+
+        template = (
+            self._templates[gitlab_job.extends]
+            if gitlab_job.extends is not None
+            else GitlabJob()
+        )
+        stage = gitlab_job.stage or template.stage
+        if stage is not None and stage not in self.stages:
+            raise InvalidPipelineError(name, f"stage '{stage}' not in {self.stages}")
+        if not (gitlab_job.script or template.script):
+            raise InvalidPipelineError(name, "'script' is required")
+        if isinstance(gitlab_job.parallel, int) and not (
+            2 <= gitlab_job.parallel <= MAX_MATRIX_ENTRIES
+        ):
+            raise InvalidPipelineError(
+                name, f"'parallel' must be between 2 and {MAX_MATRIX_ENTRIES}"
+            )
+
+        self._job_names.add(name)
+        if gitlab_job.needs:
+            self._needs[name] = gitlab_job.needs
+        return gitlab_job
+
+    def finalize(self) -> None:
+        for name, needs in self._needs.items():
+            for needed_job in needs:
+                if needed_job not in self._job_names:
+                    raise InvalidPipelineError(
+                        name, f"needs unknown job '{needed_job}'"
+                    )
+        if self.job_count == 0:
+            raise InvalidPipelineError("<pipeline>", "contains no jobs")
+
+
+def validate_pipeline(pipeline: Pipeline) -> PipelineValidator:
+    validator = PipelineValidator(stages=pipeline.get("stages", []))
+    for name, job in pipeline.items():
+        if name in RESERVED_KEYWORDS:
+            continue
+        validator.add_job(name, job)
+    validator.finalize()
+    return validator
+
+
+def validate_header(pipeline: Pipeline) -> PipelineValidator:
+    """validates the stages and the templates, jobs are added afterwards"""
+    validator = PipelineValidator(stages=pipeline.get("stages", []))
+    for name, job in pipeline.items():
+        if name in RESERVED_KEYWORDS:
+            continue
+        if not name.startswith("."):
+            raise InvalidPipelineError(name, "only templates are allowed in the header")
+        validator.add_job(name, job)
+    return validator
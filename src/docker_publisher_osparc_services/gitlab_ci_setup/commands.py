@@ -1,14 +1,33 @@
+import base64
+import json
 import re
-from pathlib import Path
-from tempfile import TemporaryDirectory
-from typing import Dict, List
+from typing import Dict, Iterable, List
 
+from ..exceptions import RegistryAuthVariableCollisionError
 from ..models import RegistryEndpointModel, RepoModel
 
-DOCKER_LOGIN: str = (
-    "echo ${SCCI_TARGET_REGISTRY_PASSWORD} | "
-    "docker login ${SCCI_TARGET_REGISTRY_ADDRESS} --username ${SCCI_TARGET_REGISTRY_USER} --password-stdin"
-)
+REGISTRY_AUTH_VARIABLE_PREFIX = "SCCI_REGISTRY_AUTH_"
+REGISTRY_AUTH_VARIABLE = "SCCI_TARGET_REGISTRY_AUTH_VARIABLE"
+
+# credentials are defined once per registry in `.basic`, each job only knows
+# the name of the variable holding the docker config of its target registry.
+# It is merged into a copy of the job's docker config in a new directory: the
+# runner's config is never overwritten and its other credentials (e.g. Docker
+# Hub for base images) keep working. A `credsStore` is dropped, docker would
+# otherwise ignore the inline credentials.
+DOCKER_AUTH_SETUP: List[str] = [
+    'DPOS_DOCKER_CONFIG="$(mktemp -d)"',
+    'printenv "${SCCI_TARGET_REGISTRY_AUTH_VARIABLE}" > "${DPOS_DOCKER_CONFIG}/auth.json"',
+    'DPOS_CURRENT_CONFIG="${DOCKER_CONFIG:-${HOME}/.docker}/config.json"',
+    'if [ -f "${DPOS_CURRENT_CONFIG}" ]; then '
+    'jq -s \'.[0] * .[1] | del(.credsStore)\' "${DPOS_CURRENT_CONFIG}" "${DPOS_DOCKER_CONFIG}/auth.json" > "${DPOS_DOCKER_CONFIG}/config.json"; '
+    'else cp "${DPOS_DOCKER_CONFIG}/auth.json" "${DPOS_DOCKER_CONFIG}/config.json"; fi',
+    'export DOCKER_CONFIG="${DPOS_DOCKER_CONFIG}"',
+]
+
+# expanded by GitLab: jobs, retries and concurrent pipelines never share a
+# clone, even on shell runners, while the generated pipeline stays stable
+CI_CLONE_DIR = "/tmp/scci-clone-${CI_JOB_ID}"
 
 CommandList = List[str]
 
@@ -20,7 +39,7 @@ def get_commands_build_base(
         [
             "git clone --single-branch --branch ${SCCI_BRANCH} ${SCCI_REPO} ${SCCI_CLONE_DIR}",
             "cd ${SCCI_CLONE_DIR}",
-            DOCKER_LOGIN,
+            *DOCKER_AUTH_SETUP,
         ]
         + (["ooil legacy-escape"] if legacy_escape else [])
         + [
@@ -29,6 +48,10 @@ def get_commands_build_base(
             "docker compose build",
             "docker tag ${SCCI_IMAGE_NAME}:${SCCI_TAG} ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_TAG}",
             "docker push ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_TAG}",
+            # records the source the test image was built from, later stages
+            # and retried runs only use the image built from this revision
+            "docker tag ${SCCI_IMAGE_NAME}:${SCCI_TAG} ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_REVISION_TAG}",
+            "docker push ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_REVISION_TAG}",
         ]
     )
 
@@ -37,45 +60,77 @@ def get_commands_test_base() -> CommandList:
     return [
         "git clone --single-branch --branch ${SCCI_BRANCH} ${SCCI_REPO} ${SCCI_CLONE_DIR}",
         "cd ${SCCI_CLONE_DIR}",
-        DOCKER_LOGIN,
-        "docker pull ${SCCI_CI_IMAGE_NAME}:${SCCI_TAG}",
+        *DOCKER_AUTH_SETUP,
+        "docker pull ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_REVISION_TAG}",
+        "docker tag ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_REVISION_TAG} ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_TAG}",
         # if user defines extra commands those will be append here
     ]
 
 
 def get_commands_push() -> CommandList:
     return [
-        DOCKER_LOGIN,
-        "docker pull ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_TAG}",
-        "docker tag ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_TAG} ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_RELEASE_IMAGE}:${SCCI_TAG}",
+        *DOCKER_AUTH_SETUP,
+        "docker pull ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_REVISION_TAG}",
+        "docker tag ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:${SCCI_REVISION_TAG} ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_RELEASE_IMAGE}:${SCCI_TAG}",
         "docker push ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_RELEASE_IMAGE}:${SCCI_TAG}",
     ]
 
 
+def registry_auth_variable(registry_name: str) -> str:
+    return REGISTRY_AUTH_VARIABLE_PREFIX + re.sub(
+        r"[^A-Z0-9]+", "_", registry_name.upper()
+    ).strip("_")
+
+
+def docker_auth_config(registry: RegistryEndpointModel) -> str:
+    """content of a docker `config.json`, same format as `DOCKER_AUTH_CONFIG`"""
+    credentials = f"{registry.user}:{registry.password.get_secret_value()}"
+    auth = base64.b64encode(credentials.encode()).decode()
+    return json.dumps({"auths": {registry.address: {"auth": auth}}})
+
+
+def registry_auth_variables(
+    registries: Dict[str, RegistryEndpointModel], repositories: Iterable[RepoModel]
+) -> Dict[str, str]:
+    """one docker config per registry targeted by `repositories`"""
+    registries_by_variable: Dict[str, List[str]] = {}
+    for name in sorted(registries):
+        registries_by_variable.setdefault(registry_auth_variable(name), []).append(name)
+    for variable, names in registries_by_variable.items():
+        if len(names) > 1:
+            raise RegistryAuthVariableCollisionError(variable, names)
+
+    targets = sorted({repo_model.registry.target for repo_model in repositories})
+    return {
+        registry_auth_variable(target): docker_auth_config(registries[target])
+        for target in targets
+    }
+
+
 def assemble_env_vars(
     repo_model: RepoModel,
     registries: Dict[str, RegistryEndpointModel],
     image_name: str,
     tag: str,
+    revision_tag: str,
 ) -> Dict[str, str]:
-    clone_directory: Path = Path(TemporaryDirectory().name)
-
     registry: RegistryEndpointModel = registries[repo_model.registry.target]
     test_image = repo_model.registry.local_to_test[image_name]
     release_image = repo_model.registry.test_to_release[test_image]
 
-    return {
+    env_vars = {
         "SCCI_BRANCH": repo_model.branch,
         "SCCI_REPO": repo_model.escaped_repo,
-        "SCCI_CLONE_DIR": f"{clone_directory}",
+        "SCCI_CLONE_DIR": CI_CLONE_DIR,
         "SCCI_IMAGE_NAME": image_name,
         "SCCI_TAG": tag,
+        "SCCI_REVISION_TAG": revision_tag,
         "SCCI_TEST_IMAGE": test_image,
         "SCCI_RELEASE_IMAGE": release_image,
         "SCCI_TARGET_REGISTRY_ADDRESS": registry.address,
-        "SCCI_TARGET_REGISTRY_PASSWORD": registry.password.get_secret_value(),
-        "SCCI_TARGET_REGISTRY_USER": registry.user,
+        REGISTRY_AUTH_VARIABLE: registry_auth_variable(repo_model.registry.target),
     }
+    return env_vars
 
 
 def validate_commands_list(
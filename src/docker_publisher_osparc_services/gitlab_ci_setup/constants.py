@@ -2,3 +2,6 @@ from pathlib import Path
 
 PIPELINE_CONFIGS = Path("pipeline-configs")
 GENERATED_PIPELINE_PATH = Path("child-pipeline-gitlab-ci.yml")
+
+EXECUTOR_GITLAB = "gitlab"
+EXECUTOR_LOCAL = "local"
@@ -1,25 +1,51 @@
 import json
+import os
+import tempfile
 from asyncio import Lock
-from collections import deque
 from io import TextIOWrapper
+from pathlib import Path
 from types import TracebackType
-from typing import Deque, Dict, Optional, Tuple, Type
+from typing import Dict, List, Optional, Type
 
 from pydantic import field_validator, BaseModel, Field
 
-from .commands import CommandList
+from ..exceptions import InvalidPipelineError
+from ..yaml_utils import safe_load
+from .ci_schema import PipelineValidator, validate_header, validate_pipeline
+from .commands import REGISTRY_AUTH_VARIABLE, CommandList
 from .constants import GENERATED_PIPELINE_PATH, PIPELINE_CONFIGS
-from .pipeline_writer import PipelineWriter
+from .pipeline_merge import merge_pipelines
+from .pipeline_writer import (
+    CompactPipelineWriter,
+    Pipeline,
+    PipelineWriter,
+    dump_pipeline,
+)
 
 HEADER = "=" * 50
 
 
+def _get_umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
 class PipelineConfig(BaseModel):
     target: str
-    build: CommandList = Field(..., description="commands used to build the image")
+    build: Optional[CommandList] = Field(
+        ...,
+        description=(
+            "commands used to build the image, None if the test image was "
+            "already pushed"
+        ),
+    )
     test: Optional[CommandList] = Field(
         None, description="optional stage where to add all tests and checks"
     )
+    test_parallel: Optional[int] = Field(
+        None, description="amount of parallel jobs the test stage is split into"
+    )
     push: CommandList = Field(..., description="commands used to push the image")
 
     @field_validator("target")
@@ -34,16 +60,62 @@ class PipelineConfig(BaseModel):
 
 
 class PipelineGenerator:
-    def __init__(self) -> None:
+    """
+    Writes the child pipeline while jobs are added. Each job is validated
+    against the GitLab CI schema before being written. The output is written
+    to a temporary file and moved in place only if generation succeeds.
+
+    In compact mode jobs are grouped by shape, so they are written on exit.
+    `variables` are shared by all jobs via `.basic`, they must define the
+    registry credentials referenced by the jobs.
+    """
+
+    def __init__(
+        self,
+        compact: bool = False,
+        print_pipeline: bool = False,
+        output_path: Path = GENERATED_PIPELINE_PATH,
+        variables: Optional[Dict[str, str]] = None,
+    ) -> None:
         self.child_gitlab_config: Optional[TextIOWrapper] = None
+        self.compact = compact
+        self.print_pipeline = print_pipeline
+        self.output_path = output_path
 
         self._lock = Lock()
-        self._pipeline_info: Deque[Tuple[PipelineConfig, Dict[str, str]]] = deque()
+        self._tmp_path: Optional[Path] = None
+        self.variables = variables or {}
+        self._header = PipelineWriter.parent_job_template(self.variables)
+        self._validator: PipelineValidator = validate_header(self._header)
+        self._compact_writer = CompactPipelineWriter(self.variables)
 
     async def __aenter__(self):
-        self.child_gitlab_config = open(GENERATED_PIPELINE_PATH, "w+")
+        output_dir = self.output_path.absolute().parent
+        output_dir.mkdir(parents=True, exist_ok=True)
+        file_descriptor, tmp_path = tempfile.mkstemp(
+            dir=output_dir, prefix=f".{self.output_path.name}.", suffix=".tmp"
+        )
+        self._tmp_path = Path(tmp_path)
+        self.child_gitlab_config = os.fdopen(file_descriptor, "w")
         return self
 
+    def _write(self, pipeline: Pipeline) -> None:
+        assert self.child_gitlab_config
+        self.child_gitlab_config.write(dump_pipeline(pipeline))
+
+    def _write_remaining(self) -> None:
+        if self.compact and len(self._compact_writer) > 0:
+            pipeline = self._compact_writer.pipeline()
+            self._validator = validate_pipeline(pipeline)
+            self._write(pipeline)
+        elif self._validator.job_count > 0:
+            self._validator.finalize()
+        else:
+            # write empty pipeline with a job that says ok
+            pipeline = PipelineWriter.nothing_to_do_pipeline()
+            self._validator = validate_pipeline(pipeline)
+            self._write(pipeline)
+
     async def __aexit__(
         self,
         exc_type: Optional[Type[BaseException]],
@@ -53,32 +125,74 @@ class PipelineGenerator:
         if not self.child_gitlab_config:
             return None
 
-        if len(self._pipeline_info) == 0:
-            # write empty pipeline with a job that says ok
-            self.child_gitlab_config.write(PipelineWriter.nothing_to_do_pipeline())
-        else:
-            self.child_gitlab_config.write(PipelineWriter.parent_job_template())
-            for pipeline_config, env_vars in self._pipeline_info:
-                pipeline_writer = PipelineWriter(pipeline_config, env_vars)
-
-                assert self.child_gitlab_config
-
-                self.child_gitlab_config.write(pipeline_writer.build_stage())
-
-                if pipeline_config.test is not None:
-                    self.child_gitlab_config.write(pipeline_writer.test_stage())
-
-                self.child_gitlab_config.write(pipeline_writer.push_stage())
+        assert self._tmp_path
+        try:
+            if exc_type is None:
+                self._write_remaining()
+                self.child_gitlab_config.close()
+                # mkstemp creates files only readable by the owner
+                os.chmod(self._tmp_path, 0o666 & ~_get_umask())
+                os.replace(self._tmp_path, self.output_path)
+        finally:
+            self.child_gitlab_config.close()
+            self._tmp_path.unlink(missing_ok=True)
+
+        if exc_type is not None:
+            return None
 
-        self.child_gitlab_config.close()
-        print(HEADER)
-        print("GENERATED PIPELINE")
         print(HEADER)
-        print(GENERATED_PIPELINE_PATH.read_text())
+        print(
+            f"GENERATED PIPELINE '{self.output_path}' "
+            f"({self._validator.job_count} jobs, "
+            f"{self.output_path.stat().st_size} bytes)"
+        )
         print(HEADER)
+        if self.print_pipeline:
+            print(self.output_path.read_text())
+            print(HEADER)
 
     async def add_pipeline_from(
         self, pipeline_config: PipelineConfig, env_vars: Dict[str, str]
     ) -> None:
+        auth_variable = env_vars.get(REGISTRY_AUTH_VARIABLE)
+        if auth_variable is not None and auth_variable not in self.variables:
+            raise InvalidPipelineError(
+                pipeline_config.target,
+                f"registry credentials '{auth_variable}' are not defined",
+            )
+
         async with self._lock:
-            self._pipeline_info.append((pipeline_config, env_vars))
+            if self.compact:
+                self._compact_writer.add(pipeline_config, env_vars)
+                return
+
+            if self._validator.job_count == 0:
+                self._write(self._header)
+
+            jobs = PipelineWriter(pipeline_config, env_vars).jobs()
+            self._write(
+                {
+                    name: self._validator.add_job(name, job).to_dict()
+                    for name, job in jobs.items()
+                }
+            )
+
+
+def merge_pipeline_files(inputs: List[Path], output: Path) -> int:
+    """merges the partial pipelines written by the shards, returns the job count"""
+    pipeline = merge_pipelines([safe_load(path.read_text()) for path in inputs])
+    job_count = validate_pipeline(pipeline).job_count
+
+    output_dir = output.absolute().parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    file_descriptor, tmp_path = tempfile.mkstemp(
+        dir=output_dir, prefix=f".{output.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(file_descriptor, "w") as file:
+            file.write(dump_pipeline(pipeline))
+        os.chmod(tmp_path, 0o666 & ~_get_umask())
+        os.replace(tmp_path, output)
+    finally:
+        Path(tmp_path).unlink(missing_ok=True)
+    return job_count
@@ -0,0 +1,92 @@
+"""
+Combines the partial child pipelines written by each shard into the single
+pipeline triggered by GitLab.
+"""
+
+from typing import Dict, Iterable, Sequence
+
+from ..exceptions import InvalidPipelineError
+from .ci_schema import RESERVED_KEYWORDS
+from .commands import REGISTRY_AUTH_VARIABLE_PREFIX
+from .pipeline_writer import NOTHING_TO_DO_JOB, Job, Pipeline, PipelineWriter
+
+
+def _with_variables(job: Job, variables: Dict[str, str]) -> Job:
+    """replaces the job variables, keeping the usual key order"""
+    result: Job = {}
+    for key, value in job.items():
+        if key == "script" and variables and "variables" not in job:
+            result["variables"] = variables
+        if key == "variables":
+            if variables:
+                result[key] = variables
+            continue
+        result[key] = value
+    return result
+
+
+def _jobs_with_own_variables(pipeline: Pipeline) -> Dict[str, Job]:
+    """moves the variables shared via `.basic` into each job"""
+    basic_variables = pipeline.get(".basic", {}).get("variables", {})
+    jobs: Dict[str, Job] = {}
+    for name, job in pipeline.items():
+        if name in RESERVED_KEYWORDS or name.startswith("."):
+            continue
+        if name == NOTHING_TO_DO_JOB:
+            continue
+        jobs[name] = _with_variables(
+            job, {**basic_variables, **job.get("variables", {})}
+        )
+    return jobs
+
+
+def _common_variables(jobs: Iterable[Job]) -> Dict[str, str]:
+    all_variables = [job.get("variables", {}) for job in jobs]
+    common = dict(all_variables[0])
+    for variables in all_variables[1:]:
+        common = {k: v for k, v in common.items() if variables.get(k) == v}
+    return common
+
+
+def _registry_auth_variables(jobs: Iterable[Job]) -> Dict[str, str]:
+    """registry credentials always go to `.basic`, even if not used by all jobs"""
+    auth_variables: Dict[str, str] = {}
+    for job in jobs:
+        for key, value in job.get("variables", {}).items():
+            if not key.startswith(REGISTRY_AUTH_VARIABLE_PREFIX):
+                continue
+            if auth_variables.setdefault(key, value) != value:
+                raise InvalidPipelineError(
+                    ".basic", f"'{key}' differs between partial pipelines"
+                )
+    return auth_variables
+
+
+def merge_pipelines(pipelines: Sequence[Pipeline]) -> Pipeline:
+    """
+    Jobs are de-duplicated by name, which is derived from the target image.
+    The same name with a different definition is an error.
+    """
+    jobs: Dict[str, Job] = {}
+    for pipeline in pipelines:
+        for name, job in _jobs_with_own_variables(pipeline).items():
+            if name in jobs and jobs[name] != job:
+                raise InvalidPipelineError(
+                    name, "defined differently by two partial pipelines"
+                )
+            jobs[name] = job
+
+    if not jobs:
+        return PipelineWriter.nothing_to_do_pipeline()
+
+    common = {
+        **_registry_auth_variables(jobs.values()),
+        **_common_variables(jobs.values()),
+    }
+    merged = PipelineWriter.parent_job_template(common)
+    for name, job in jobs.items():
+        variables = {
+            k: v for k, v in job.get("variables", {}).items() if k not in common
+        }
+        merged[name] = _with_variables(job, variables)
+    return merged
@@ -1,13 +1,45 @@
-from textwrap import dedent
-from typing import Dict
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
 
-from .commands import CommandList
+import yaml
 
-TAB_SPACE = "                    "
+Job = Dict[str, Any]
+Pipeline = Dict[str, Any]
 
+STAGE_BUILD = "build-image"
+STAGE_TEST = "test-image"
+STAGE_DEPLOY = "deploy-image"
 
-def _format_template(template: str) -> str:
-    return dedent(template)
+# limits imposed by GitLab on `parallel:matrix` jobs
+MAX_MATRIX_ENTRIES = 200
+MAX_JOB_NAME_LENGTH = 255
+
+NOTHING_TO_DO_JOB = "no-further-action-required"
+
+# in compact mode these stay on the job, everything else ends up in the matrix
+# NOTE: credentials must never be part of the matrix since its values are
+# rendered in the job names visible in the GitLab UI
+_SHAPE_VARIABLES = (
+    "SCCI_BRANCH",
+    "SCCI_REPO",
+    "SCCI_TARGET_REGISTRY_ADDRESS",
+    "SCCI_TARGET_REGISTRY_AUTH_VARIABLE",
+)
+
+
+class _NoAliasDumper(yaml.SafeDumper):
+    def ignore_aliases(self, data: Any) -> bool:
+        return True
+
+
+def dump_pipeline(pipeline: Pipeline) -> str:
+    return yaml.dump(
+        pipeline,
+        Dumper=_NoAliasDumper,
+        sort_keys=False,
+        default_flow_style=False,
+        width=float("inf"),
+    )
 
 
 class PipelineWriter:
@@ -29,90 +61,192 @@ class PipelineWriter:
     def push_name(self) -> str:
         return f"{self.pipeline_config.target}-push"
 
-    @property
-    def formatted_env(self) -> str:
-        return "\n".join(
-            [""] + [f"{TAB_SPACE}{k}: {v}" for k, v in self.env_vars.items()]
-        )
-
     @staticmethod
-    def _format_commands(commands: CommandList) -> str:
-        return "\n".join([""] + [f"{TAB_SPACE}- {command}" for command in commands])
-
-    @staticmethod
-    def nothing_to_do_pipeline() -> str:
+    def nothing_to_do_pipeline() -> Pipeline:
         """Used when no checks are requured"""
-        return _format_template(
-            """
-            stages:
-                - info
-
-            no-further-action-required:
-                image: $CI_SERVICE_INTEGRATION_LIBRARY
-                stage: info
-                tags:
-                    - DOCKER
-                    - LINUX
-                script:
-                    - echo "Nothing required updates. No builds scheduled."
-            """
-        )
+        return {
+            "stages": ["info"],
+            NOTHING_TO_DO_JOB: {
+                "image": "$CI_SERVICE_INTEGRATION_LIBRARY",
+                "stage": "info",
+                "tags": ["DOCKER", "LINUX"],
+                "script": ['echo "Nothing required updates. No builds scheduled."'],
+            },
+        }
 
     @staticmethod
-    def parent_job_template() -> str:
+    def parent_job_template(variables: Optional[Dict[str, str]] = None) -> Pipeline:
         """This is globally shared between all jobs"""
-        return _format_template(
-            """
-            stages:
-                - build-image
-                - test-image
-                - deploy-image
-            .basic:
-                image: $CI_SERVICE_INTEGRATION_LIBRARY
-                tags:
-                    - DOCKER
-                    - LINUX
-            """
-        )
-
-    def build_stage(self) -> str:
-        formatted_commands = self._format_commands(self.pipeline_config.build)
-        return _format_template(
-            f"""
-            {self.build_name}:
-                extends: .basic
-                stage: build-image
-                variables: {self.formatted_env}
-                script: {formatted_commands}
-            """
-        )
-
-    def test_stage(self) -> str:
+        basic: Job = {
+            "image": "$CI_SERVICE_INTEGRATION_LIBRARY",
+            "tags": ["DOCKER", "LINUX"],
+        }
+        if variables:
+            basic["variables"] = dict(variables)
+        return {"stages": [STAGE_BUILD, STAGE_TEST, STAGE_DEPLOY], ".basic": basic}
+
+    def build_stage(self) -> Dict[str, Job]:
+        assert self.pipeline_config.build
+        return {
+            self.build_name: {
+                "extends": ".basic",
+                "stage": STAGE_BUILD,
+                "variables": dict(self.env_vars),
+                "script": list(self.pipeline_config.build),
+            }
+        }
+
+    def test_stage(self) -> Dict[str, Job]:
         assert self.pipeline_config.test
-        formatted_commands = self._format_commands(self.pipeline_config.test)
-        return _format_template(
-            f"""
-            {self.test_name}:
-                extends: .basic
-                stage: test-image
-                needs: [{self.build_name}]
-                variables: {self.formatted_env}
-                script: {formatted_commands}
-            """
+        job: Job = {
+            "extends": ".basic",
+            "stage": STAGE_TEST,
+            # without a build the test image exists, no need to wait for a stage
+            "needs": [] if self.pipeline_config.build is None else [self.build_name],
+            "variables": dict(self.env_vars),
+            "script": list(self.pipeline_config.test),
+        }
+        if self.pipeline_config.test_parallel is not None:
+            # GitLab provides CI_NODE_INDEX and CI_NODE_TOTAL to each shard
+            job["parallel"] = self.pipeline_config.test_parallel
+        return {self.test_name: job}
+
+    def push_stage(self) -> Dict[str, Job]:
+        job: Job = {"extends": ".basic", "stage": STAGE_DEPLOY}
+        # when the test job is sharded, `needs` waits for all of its shards
+        if self.pipeline_config.test is not None:
+            job["needs"] = [self.test_name]
+        elif self.pipeline_config.build is not None:
+            job["needs"] = [self.build_name]
+        else:
+            # already built test images do not wait for other images
+            job["needs"] = []
+        job["variables"] = dict(self.env_vars)
+        job["script"] = list(self.pipeline_config.push)
+        return {self.push_name: job}
+
+    def jobs(self) -> Dict[str, Job]:
+        # pushed test images are not rebuilt
+        jobs = {} if self.pipeline_config.build is None else self.build_stage()
+        if self.pipeline_config.test is not None:
+            jobs.update(self.test_stage())
+        jobs.update(self.push_stage())
+        return jobs
+
+
+_ShapeKey = Tuple[
+    Optional[Tuple[str, ...]],
+    Optional[Tuple[str, ...]],
+    Optional[int],
+    Tuple[str, ...],
+    Tuple[Tuple[str, str], ...],
+]
+
+
+def _matrix_job_name(name: str, entry: Dict[str, str]) -> str:
+    # mirrors the name GitLab renders for each job of a `parallel:matrix`
+    return f"{name}: [{', '.join(entry.values())}]"
+
+
+class CompactPipelineWriter:
+    """
+    Collapses all images sharing the same commands and repository into a
+    single job per stage, using `parallel:matrix` for the image specific
+    variables. Variables shared by all jobs are moved to `.basic`, next to
+    `variables` (e.g. the registry credentials).
+
+    Jobs rely on stage ordering instead of `needs`, since GitLab cannot link
+    single entries of two matrices. Sharded test jobs cannot be part of a
+    matrix and are emitted once per image.
+    """
+
+    def __init__(self, variables: Optional[Dict[str, str]] = None) -> None:
+        self.variables = variables or {}
+        self._shapes: Dict[_ShapeKey, List[Dict[str, str]]] = {}
+
+    def add(self, pipeline_config: "PipelineConfig", env_vars: Dict[str, str]) -> None:
+        shape_variables = tuple(
+            (k, env_vars[k]) for k in _SHAPE_VARIABLES if k in env_vars
         )
-
-    def push_stage(self) -> str:
-        needs_entry = (
-            self.build_name if self.pipeline_config.test is None else self.test_name
+        key: _ShapeKey = (
+            None if pipeline_config.build is None else tuple(pipeline_config.build),
+            None if pipeline_config.test is None else tuple(pipeline_config.test),
+            pipeline_config.test_parallel,
+            tuple(pipeline_config.push),
+            shape_variables,
         )
-        formatted_commands = self._format_commands(self.pipeline_config.push)
-        return _format_template(
-            f"""
-            {self.push_name}:
-                extends: .basic
-                stage: deploy-image
-                needs: [{needs_entry}]
-                variables: {self.formatted_env}
-                script: {formatted_commands}
-            """
+        self._shapes.setdefault(key, []).append(
+            {k: v for k, v in env_vars.items() if k not in _SHAPE_VARIABLES}
         )
+
+    def __len__(self) -> int:
+        return sum(len(entries) for entries in self._shapes.values())
+
+    def _shape_variables(self, key: _ShapeKey) -> Dict[str, str]:
+        return dict(key[4])
+
+    def _common_variables(self) -> Dict[str, str]:
+        all_variables = [
+            {**self._shape_variables(key), **entry}
+            for key, entries in self._shapes.items()
+            for entry in entries
+        ]
+        common = dict(all_variables[0])
+        for variables in all_variables[1:]:
+            common = {k: v for k, v in common.items() if variables.get(k) == v}
+        return common
+
+    def pipeline(self) -> Pipeline:
+        common = self._common_variables()
+        pipeline = PipelineWriter.parent_job_template({**self.variables, **common})
+
+        for key, entries in self._shapes.items():
+            build, test, test_parallel, push, _ = key
+            digest = hashlib.sha1(repr(key).encode()).hexdigest()[:8]
+            job_variables = {
+                k: v for k, v in self._shape_variables(key).items() if k not in common
+            }
+            matrix = [
+                {k: v for k, v in entry.items() if k not in common} for entry in entries
+            ]
+            stages = [] if build is None else [(STAGE_BUILD, "build", build)]
+            if test is not None:
+                stages.append((STAGE_TEST, "test", test))
+            stages.append((STAGE_DEPLOY, "push", push))
+
+            for stage, prefix, script in stages:
+                name = f"{prefix}-{digest}"
+                template: Job = {"extends": ".basic", "stage": stage}
+                if job_variables:
+                    template["variables"] = job_variables
+                template["script"] = list(script)
+
+                parallel = test_parallel if stage == STAGE_TEST else None
+                fits, standalone = [], []
+                for entry in matrix:
+                    if (
+                        parallel is None
+                        and entry
+                        and len(_matrix_job_name(name, entry)) <= MAX_JOB_NAME_LENGTH
+                    ):
+                        fits.append(entry)
+                    else:
+                        standalone.append(entry)
+
+                chunks = [
+                    fits[i : i + MAX_MATRIX_ENTRIES]
+                    for i in range(0, len(fits), MAX_MATRIX_ENTRIES)
+                ]
+                for k, chunk in enumerate(chunks):
+                    chunk_name = name if len(chunks) == 1 else f"{name}-{k}"
+                    pipeline[chunk_name] = {
+                        **template,
+                        "parallel": {"matrix": chunk},
+                    }
+                for k, entry in enumerate(standalone):
+                    job = {**template, "variables": {**job_variables, **entry}}
+                    if parallel is not None:
+                        job["parallel"] = parallel
+                    pipeline[f"{name}-single-{k}"] = job
+
+        return pipeline
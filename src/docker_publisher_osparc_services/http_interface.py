@@ -1,6 +1,15 @@
 import httpx
 from contextlib import asynccontextmanager
-from typing import Any, AsyncIterator, Dict, Mapping, Optional, Set, Tuple
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from httpx import AsyncClient, Response, codes
 from tenacity import (
@@ -19,14 +28,79 @@ from .exceptions import (
     RegistryRequestUnparseableJsonError,
 )
 from .models import RegistryEndpointModel, RepoModel
+from .tracing import CATEGORY_HTTP, is_enabled, record_retry, span
+
+
+class _TracingTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport) -> None:
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> Response:
+        with span(
+            f"{request.method} {request.url.host}",
+            CATEGORY_HTTP,
+            host=request.url.host,
+            path=request.url.path,
+        ) as request_span:
+            response = await self._transport.handle_async_request(request)
+            if request_span is not None:
+                request_span.args["status_code"] = response.status_code
+            return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+TransportFactory = Callable[[], httpx.AsyncBaseTransport]
+
+_transport_factory: Optional[TransportFactory] = None
+
+# set while `shared_client` is active, keeps connections alive between requests
+_shared_client: Optional[AsyncClient] = None
+
+# project ids never change, cached for the lifetime of the process
+_gitlab_project_ids: Dict[str, str] = {}
+
+
+def set_transport_factory(factory: Optional[TransportFactory]) -> None:
+    """replaces the transport of all clients, e.g. with in-process fakes"""
+    global _transport_factory
+    _transport_factory = factory
 
 
 @asynccontextmanager
 async def async_client(timeout: float = 30, **kwargs) -> AsyncIterator[AsyncClient]:
+    if _shared_client is not None and not kwargs:
+        yield _shared_client
+        return
+
+    if _transport_factory is not None and "transport" not in kwargs:
+        kwargs["transport"] = _transport_factory()
+    if is_enabled():
+        kwargs["transport"] = _TracingTransport(
+            kwargs.pop("transport", None) or httpx.AsyncHTTPTransport()
+        )
     async with AsyncClient(timeout=timeout, **kwargs) as client:
         yield client
 
 
+def clear_caches() -> None:
+    """forgets all cached lookups"""
+    _gitlab_project_ids.clear()
+
+
+@asynccontextmanager
+async def shared_client(timeout: float = 30) -> AsyncIterator[AsyncClient]:
+    """while active, `async_client` reuses a single connection pool"""
+    global _shared_client
+    async with async_client(timeout=timeout) as client:
+        _shared_client = client
+        try:
+            yield client
+        finally:
+            _shared_client = None
+
+
 class GreenCIMissingError(Exception):
     def __init__(self, *, repo_url: str, target_brach: str, branch_hash: str):
         super().__init__(
@@ -78,6 +152,7 @@ async def github_did_last_repo_run_pass(
     retry=retry_if_exception_type((GitlabRequestUnexpectedStatusCodeError, GitlabRequestUnparseableJsonError)),
     wait=wait_exponential(multiplier=1, min=1, max=30),
     stop=stop_after_attempt(5),
+    before_sleep=record_retry,
     reraise=True,
 )
 async def _gitlab_request(
@@ -104,6 +179,9 @@ async def _gitlab_request(
 
 
 async def _gitlab_get_project_id(repo_model: RepoModel) -> str:
+    if repo_model.http_url_to_repo in _gitlab_project_ids:
+        return _gitlab_project_ids[repo_model.http_url_to_repo]
+
     parsed_url = URL(repo_model.address)
     repo_name = parsed_url.path.split("/")[-1].replace(".git", "")
     host = parsed_url.host
@@ -117,6 +195,7 @@ async def _gitlab_get_project_id(repo_model: RepoModel) -> str:
     # check for http_url_to_repo
     for repo in found_repos:
         if repo_model.http_url_to_repo == repo["http_url_to_repo"]:
+            _gitlab_project_ids[repo_model.http_url_to_repo] = repo["id"]
             return repo["id"]
 
     message = f"Searching for {repo_name} did not yield the deisired result {found_repos} {parsed_url}"
@@ -156,6 +235,7 @@ async def gitlab_did_last_repo_run_pass(
     )),
     wait=wait_exponential(multiplier=1, min=1, max=30),
     stop=stop_after_attempt(5),
+    before_sleep=record_retry,
     reraise=True,
 )
 async def _registry_raw_get(
@@ -193,8 +273,9 @@ async def _registry_request(
     auth = (registry_model.user, registry_model.password.get_secret_value())
     async with async_client() as client:
         url = f"https://{registry_model.address}{url_path}"
+        # 404 is the answer for a repository which was never pushed, no retries
         body, response_headers = await _registry_raw_get(
-            url, client=client, auth=auth, acceptable_statuses={200, 401}
+            url, client=client, auth=auth, acceptable_statuses={200, 401, 404}
         )
 
         # in case of connection to Portus registry
@@ -224,7 +305,10 @@ async def _registry_request(
             auth_headers = {"Authorization": f"Bearer {token}"}
 
             body, _ = await _registry_raw_get(
-                url, client=client, headers=auth_headers, acceptable_statuses={200}
+                url,
+                client=client,
+                headers=auth_headers,
+                acceptable_statuses={200, 404},
             )
             return body or {}
 
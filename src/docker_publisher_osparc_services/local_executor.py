@@ -0,0 +1,191 @@
+import asyncio
+import os
+import shlex
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from types import TracebackType
+from typing import Awaitable, Callable, Dict, List, Optional, Type
+
+from pydantic import BaseModel
+
+from .exceptions import CommandFailedException
+from .gitlab_ci_setup.commands import CommandList
+from .gitlab_ci_setup.pipeline_config import PipelineConfig
+from .gitlab_ci_setup.pipeline_writer import PipelineWriter
+from .utils import kill_process_group
+
+LOCAL_EXECUTOR_LOGS = Path("local-executor-logs")
+
+
+class LocalJob(BaseModel):
+    name: str
+    commands: CommandList
+    env: Dict[str, str]
+    work_dir: Path
+    log_path: Path
+
+
+CommandRunner = Callable[[LocalJob], Awaitable[int]]
+
+
+def _assemble_script(commands: CommandList) -> str:
+    # same behaviour as the GitLab shell executor: echo and stop at first error
+    lines = ["set -eo pipefail"]
+    for command in commands:
+        lines.append(f"printf '%s\\n' {shlex.quote(f'$ {command}')}")
+        lines.append(command)
+    return "\n".join(lines)
+
+
+async def run_in_shell(job: LocalJob) -> int:
+    """runs the job's commands in bash, returns the exit code"""
+    with job.log_path.open("wb") as log_file:
+        proc = await asyncio.create_subprocess_exec(
+            "bash",
+            "-c",
+            _assemble_script(job.commands),
+            stdout=log_file,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=job.work_dir,
+            env={**os.environ, **job.env},
+            # own process group, so docker and the other children are killed too
+            start_new_session=True,
+        )
+        try:
+            return await proc.wait()
+        except asyncio.CancelledError:
+            kill_process_group(proc)
+            await proc.wait()
+            raise
+
+
+class LocalExecutor:
+    """
+    Runs the jobs which would end up in the child pipeline directly on this
+    host. Jobs start as soon as they are added and the jobs they need
+    succeeded. The first failing job cancels all the others.
+
+    `variables` are the ones shared via `.basic` in the child pipeline. Each
+    job gets its own DOCKER_CONFIG, the one of this host is never modified.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 1,
+        logs_dir: Path = LOCAL_EXECUTOR_LOGS,
+        runner: CommandRunner = run_in_shell,
+        work_root: Optional[Path] = None,
+        variables: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.logs_dir = logs_dir
+        self.variables = variables or {}
+        self.runner = runner
+        self.work_root = work_root
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._work_dir: Optional[Path] = None
+        self._failed_job: Optional[LocalJob] = None
+
+    async def __aenter__(self):
+        self.logs_dir.mkdir(parents=True, exist_ok=True)
+        self._work_dir = Path(
+            tempfile.mkdtemp(prefix="dpos-local-", dir=self.work_root)
+        )
+        return self
+
+    async def __aexit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ):
+        try:
+            if exc_type is not None:
+                self._cancel_all()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        finally:
+            if self._work_dir:
+                shutil.rmtree(self._work_dir, ignore_errors=True)
+
+        if exc_type is None:
+            self._raise_if_failed()
+            print(f"[local] all {len(self._tasks)} jobs completed")
+
+    def _cancel_all(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+    def _raise_if_failed(self) -> None:
+        if self._failed_job is not None:
+            raise CommandFailedException(
+                f"Job '{self._failed_job.name}' failed, "
+                f"check logs in '{self._failed_job.log_path}'"
+            )
+
+    async def _run_job(self, job: LocalJob) -> None:
+        async with self._semaphore:
+            job.work_dir.mkdir(parents=True, exist_ok=True)
+            start = time.perf_counter()
+            print(f"[local] starting '{job.name}'")
+            returncode = await self.runner(job)
+            elapsed = time.perf_counter() - start
+
+        if returncode != 0:
+            print(f"[local] FAILED '{job.name}' ({elapsed:.1f}s) log: {job.log_path}")
+            if self._failed_job is None:
+                self._failed_job = job
+                self._cancel_all()
+            raise CommandFailedException(f"Job '{job.name}' failed")
+
+        print(f"[local] OK '{job.name}' ({elapsed:.1f}s)")
+
+    async def _run_gitlab_job(self, needs: List[str], shards: List[LocalJob]) -> None:
+        # a failure in the needed jobs propagates and stops this job
+        await asyncio.gather(*(self._tasks[n] for n in needs))
+        await asyncio.gather(*(self._run_job(shard) for shard in shards))
+
+    def _shards_for(
+        self, name: str, variables: Dict[str, str], commands: CommandList, parallel: int
+    ) -> List[LocalJob]:
+        assert self._work_dir
+        shards = []
+        for index in range(1, parallel + 1):
+            shard_name = name if parallel == 1 else f"{name} {index}/{parallel}"
+            job_dir = self._work_dir / shard_name.replace(" ", "-").replace("/", "-of-")
+            env = {
+                **self.variables,
+                **variables,
+                # each job clones in its own directory as on separate runners
+                "SCCI_CLONE_DIR": f"{job_dir / 'clone'}",
+                "DOCKER_CONFIG": f"{job_dir / 'docker-config'}",
+                "CI_JOB_NAME": name,
+            }
+            if parallel > 1:
+                env["CI_NODE_INDEX"] = f"{index}"
+                env["CI_NODE_TOTAL"] = f"{parallel}"
+            shards.append(
+                LocalJob(
+                    name=shard_name,
+                    commands=commands,
+                    env=env,
+                    work_dir=job_dir,
+                    log_path=self.logs_dir / f"{job_dir.name}.log",
+                )
+            )
+        return shards
+
+    async def add_pipeline_from(
+        self, pipeline_config: PipelineConfig, env_vars: Dict[str, str]
+    ) -> None:
+        self._raise_if_failed()
+
+        for name, job in PipelineWriter(pipeline_config, env_vars).jobs().items():
+            shards = self._shards_for(
+                name, job["variables"], job["script"], job.get("parallel", 1)
+            )
+            self._tasks[name] = asyncio.create_task(
+                self._run_gitlab_job(job.get("needs", []), shards)
+            )
@@ -0,0 +1,227 @@
+"""
+Prometheus metrics for a sweep, collected from the same spans used for
+tracing. Exported in the text exposition format, either to a file for the
+node_exporter textfile collector or to a pushgateway.
+"""
+
+import os
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .http_interface import async_client
+from .tracing import (
+    CATEGORY_EVENT,
+    CATEGORY_HTTP,
+    CATEGORY_PHASE,
+    CATEGORY_REPO,
+    CATEGORY_RETRY,
+    CATEGORY_SUBPROCESS,
+    Span,
+)
+
+BUCKETS: Tuple[float, ...] = (
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+    600,
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = [
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    ]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class _Histogram:
+    def __init__(self) -> None:
+        self.bucket_counts: List[int] = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        for k, upper_bound in enumerate(BUCKETS):
+            if value <= upper_bound:
+                self.bucket_counts[k] += 1
+
+
+class MetricsRecorder:
+    """span listener aggregating counters and histograms for a sweep"""
+
+    def __init__(self, prefix: str = "dpos") -> None:
+        self.prefix = prefix
+        self.counters: Dict[str, Dict[Labels, float]] = defaultdict(
+            lambda: defaultdict(float)
+        )
+        self.gauges: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self.histograms: Dict[str, Dict[Labels, _Histogram]] = defaultdict(
+            lambda: defaultdict(_Histogram)
+        )
+        self._help: Dict[str, str] = {}
+
+    def inc(self, name: str, help_text: str, value: float = 1, **labels: str) -> None:
+        self._help[name] = help_text
+        self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def set(self, name: str, help_text: str, value: float, **labels: str) -> None:
+        self._help[name] = help_text
+        self.gauges[name][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, help_text: str, value: float, **labels: str) -> None:
+        self._help[name] = help_text
+        self.histograms[name][tuple(sorted(labels.items()))].observe(value)
+
+    def __call__(self, span: Span) -> None:
+        if span.category == CATEGORY_HTTP:
+            host = f"{span.args.get('host', '')}"
+            self.observe(
+                "http_request_duration_seconds",
+                "HTTP request latency",
+                span.duration,
+                host=host,
+            )
+            status = span.args.get("status_code")
+            if "error" in span.args or (status is not None and status >= 400):
+                self.inc("http_errors_total", "failed HTTP requests", host=host)
+        elif span.category == CATEGORY_SUBPROCESS:
+            self.observe(
+                "subprocess_duration_seconds",
+                "subprocess duration per command kind",
+                span.duration,
+                kind=span.name,
+            )
+            if "error" in span.args:
+                self.inc(
+                    "subprocess_errors_total", "failed subprocesses", kind=span.name
+                )
+        elif span.category == CATEGORY_RETRY:
+            self.inc(
+                "retries_total",
+                "retried requests",
+                function=f"{span.args.get('function', '')}",
+            )
+        elif span.category == CATEGORY_REPO:
+            self.observe(
+                "repository_duration_seconds",
+                "time spent evaluating a repository",
+                span.duration,
+            )
+        elif span.category == CATEGORY_PHASE:
+            if span.name == "sweep":
+                self.set("sweep_duration_seconds", "sweep duration", span.duration)
+                self.set(
+                    "sweep_success",
+                    "1 if the last sweep succeeded",
+                    0 if "error" in span.args else 1,
+                )
+                self.set(
+                    "sweep_last_run_timestamp_seconds",
+                    "end of the last sweep",
+                    time.time(),
+                )
+            else:
+                self.observe(
+                    "phase_duration_seconds",
+                    "evaluation phase duration",
+                    span.duration,
+                    phase=span.name,
+                )
+        elif span.category == CATEGORY_EVENT:
+            self._on_event(span)
+
+    def _on_event(self, span: Span) -> None:
+        if span.name == "tag-lookup":
+            self.inc(
+                "tag_lookups_total",
+                "registry tag lookups by result",
+                result=f"{span.args['result']}",
+            )
+        elif span.name == "repo-outcome":
+            self.inc(
+                "repositories_total",
+                "evaluated repositories by outcome",
+                outcome=f"{span.args['outcome']}",
+            )
+        elif span.name == "clone":
+            self.inc("cloned_bytes_total", "bytes cloned", value=span.args["bytes"])
+
+    def exposition(self) -> str:
+        lines: List[str] = []
+        for name, series in self.counters.items():
+            full_name = f"{self.prefix}_{name}"
+            lines += [
+                f"# HELP {full_name} {self._help[name]}",
+                f"# TYPE {full_name} counter",
+            ]
+            for labels, value in series.items():
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        for name, series in self.gauges.items():
+            full_name = f"{self.prefix}_{name}"
+            lines += [
+                f"# HELP {full_name} {self._help[name]}",
+                f"# TYPE {full_name} gauge",
+            ]
+            for labels, value in series.items():
+                lines.append(f"{full_name}{_format_labels(labels)} {value}")
+        for name, series in self.histograms.items():
+            full_name = f"{self.prefix}_{name}"
+            lines += [
+                f"# HELP {full_name} {self._help[name]}",
+                f"# TYPE {full_name} histogram",
+            ]
+            for labels, histogram in series.items():
+                for upper_bound, count in zip(BUCKETS, histogram.bucket_counts):
+                    bucket_labels = labels + (("le", f"{upper_bound}"),)
+                    lines.append(
+                        f"{full_name}_bucket{_format_labels(bucket_labels)} {count}"
+                    )
+                inf_labels = labels + (("le", "+Inf"),)
+                lines.append(
+                    f"{full_name}_bucket{_format_labels(inf_labels)} {histogram.count}"
+                )
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(
+                    f"{full_name}_count{_format_labels(labels)} {histogram.count}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Path) -> None:
+        # the textfile collector may read at any time, replace atomically
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file_descriptor, tmp_path = tempfile.mkstemp(
+            dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+        )
+        with os.fdopen(file_descriptor, "w") as file:
+            file.write(self.exposition())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+
+    async def push(self, pushgateway_url: str, job: str = "dpos") -> None:
+        async with async_client() as client:
+            response = await client.put(
+                f"{pushgateway_url.rstrip('/')}/metrics/job/{job}",
+                content=self.exposition().encode(),
+                headers={"Content-Type": "text/plain; version=0.0.4"},
+            )
+            response.raise_for_status()
@@ -2,9 +2,10 @@ from enum import Enum
 from pathlib import Path
 from typing import Dict, List, Optional
 
-from envyaml import EnvYAML
 from pydantic import BaseModel, Field, SecretStr, model_validator
 
+from .config_loader import load_config_dict
+
 
 class HostType(str, Enum):
     GITHUB = "github"
@@ -91,6 +92,23 @@ class RepoModel(BaseModel):
             "clone location"
         ),
     )
+    ci_stage_test_parallel: Optional[int] = Field(
+        None,
+        ge=2,
+        le=200,
+        description=(
+            "if present the test stage is split in this amount of parallel jobs. "
+            "Each job can use `CI_NODE_INDEX` and `CI_NODE_TOTAL` to pick its shard"
+        ),
+    )
+    content_addressed: bool = Field(
+        False,
+        description=(
+            "if enabled, the test image is tagged with the hash of its build "
+            "context instead of the commit, a pushed test image is reused by "
+            "commits which did not change it"
+        ),
+    )
     pre_docker_build_hooks: list[str] = Field(
         default_factory=list,
         description="a list of commands to execute before running the docker build command",
@@ -169,6 +187,7 @@ class ConfigModel(BaseModel):
         return values
 
     @classmethod
-    def from_cfg_path(cls, config_path: Path) -> "ConfigModel":
-        config_dict = EnvYAML(config_path)
-        return cls.parse_obj(dict(config_dict))
+    def from_cfg_path(
+        cls, config_path: Path, cache_dir: Optional[Path] = None
+    ) -> "ConfigModel":
+        return cls.parse_obj(load_config_dict(config_path, cache_dir))
@@ -1,13 +1,20 @@
+import hashlib
+import json
+import os
 from pathlib import Path
-from tempfile import TemporaryDirectory
-from typing import List
+from typing import Any, Dict, List, Optional
 
-import yaml
+from pydantic import BaseModel, Field
 
 from .exceptions import BaseAppException, GITCommitHashInvalid
 from .http_interface import github_did_last_repo_run_pass, gitlab_did_last_repo_run_pass
 from .models import HostType, RepoModel
-from .utils import command_output
+from .tracing import is_enabled, record_event
+from .utils import command_output, directory_size
+from .yaml_utils import read_compose_builds, read_compose_services
+
+# their content is not part of the compose spec, such builds are not hashed
+_UNHASHED_BUILD_KEYS = {"additional_contexts", "secrets", "ssh"}
 
 
 async def get_branch_hash(repo_model: RepoModel) -> str:
@@ -22,13 +29,14 @@ async def get_branch_hash(repo_model: RepoModel) -> str:
     return commit_hash
 
 
-async def clone_repo(repo_model: RepoModel) -> None:
+async def clone_repo(repo_model: RepoModel, target_dir: Path) -> None:
     """clones and stores the cloned_dir"""
-    target_dir: Path = Path(TemporaryDirectory().name)
     await command_output(
         f"git clone --single-branch --branch {repo_model.branch} {repo_model.escaped_repo} {target_dir}"
     )
     repo_model.clone_path = target_dir
+    if is_enabled():
+        record_event("clone", bytes=directory_size(target_dir))
 
 
 async def assemble_compose(repo_model: RepoModel) -> None:
@@ -39,9 +47,82 @@ async def assemble_compose(repo_model: RepoModel) -> None:
 def fetch_images_from_compose_spec(repo_model: RepoModel) -> List[str]:
     assert repo_model.clone_path
     compose_file = repo_model.clone_path / "docker-compose.yml"
-    parsed_spec = yaml.safe_load(compose_file.read_text())
+    return [service.image for service in read_compose_services(compose_file)]
+
+
+class BuildSpec(BaseModel):
+    context: str = Field(..., description="relative to the repository root")
+    dockerfile: Optional[str] = Field(
+        None,
+        description="relative to the repository root, only if outside the context",
+    )
+    section: Dict[str, Any] = Field(
+        ..., description="build section as rendered by ooil: labels, args, ..."
+    )
+
+
+def _repo_path(path: str) -> Optional[str]:
+    """normalized path relative to the repository root, None if outside"""
+    if "://" in path or os.path.isabs(path):
+        return None
+    path = os.path.normpath(path)
+    if path.startswith(".."):
+        return None
+    return "" if path == "." else path
+
+
+def _build_spec(section: Dict[str, Any]) -> Optional[BuildSpec]:
+    if _UNHASHED_BUILD_KEYS & set(section):
+        return None
+    context = _repo_path(f"{section.get('context', '.')}")
+    if context is None:
+        return None
+
+    dockerfile = None
+    if "dockerfile" in section:
+        dockerfile = _repo_path(os.path.join(context, f"{section['dockerfile']}"))
+        if dockerfile is None:
+            return None
+        if context == "" or dockerfile.startswith(f"{context}/"):
+            # already part of the context tree
+            dockerfile = None
+    return BuildSpec(context=context, dockerfile=dockerfile, section=section)
+
+
+def fetch_build_specs_from_compose_spec(
+    repo_model: RepoModel,
+) -> Dict[str, Optional[BuildSpec]]:
+    """
+    image -> what its build depends on, None if it cannot be hashed (e.g.
+    the build context is not a directory of this repository)
+    """
+    assert repo_model.clone_path
+    compose_file = repo_model.clone_path / "docker-compose.yml"
+    return {
+        image: _build_spec(section)
+        for image, section in read_compose_builds(compose_file).items()
+    }
 
-    return [service_data["image"] for service_data in parsed_spec["services"].values()]
+
+async def get_tree_hash(repo_model: RepoModel, path: str) -> str:
+    """hash of the git object, for a tree it changes only if a file below `path` changes"""
+    result = await command_output(
+        f"git rev-parse HEAD:{path}", cwd=f"{repo_model.clone_path}"
+    )
+    return result.strip()
+
+
+async def get_content_hash(repo_model: RepoModel, build_spec: BuildSpec) -> str:
+    """
+    changes if the image built from `build_spec` can differ: files of the
+    context, a Dockerfile outside of it, labels (e.g. the `.osparc` version),
+    args or any other build option
+    """
+    parts = [await get_tree_hash(repo_model, build_spec.context)]
+    if build_spec.dockerfile is not None:
+        parts.append(await get_tree_hash(repo_model, build_spec.dockerfile))
+    parts.append(json.dumps(build_spec.section, sort_keys=True, default=str))
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()
 
 
 async def did_ci_pass(repo_model: RepoModel, branch_hash: str) -> bool:
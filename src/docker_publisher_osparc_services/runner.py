@@ -0,0 +1,392 @@
+"""
+Implementation of the `dpos` commands. Kept apart from `cli` which must
+start fast: it is only imported once a command actually runs.
+"""
+
+import contextlib
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+
+from .evaluation import (
+    RepoEvaluation,
+    Timeouts,
+    evaluate_repositories,
+    repo_span_name,
+)
+from .exceptions import InvalidPipelineError
+from .gitlab_ci_setup.commands import (
+    assemble_env_vars,
+    get_commands_build_base,
+    get_commands_push,
+    get_commands_test_base,
+    registry_auth_variables,
+    validate_commands_list,
+)
+from .gitlab_ci_setup.constants import (
+    EXECUTOR_GITLAB,
+    EXECUTOR_LOCAL,
+    GENERATED_PIPELINE_PATH,
+)
+from .gitlab_ci_setup.pipeline_config import (
+    HEADER,
+    PipelineConfig,
+    PipelineGenerator,
+)
+from .local_executor import LocalExecutor
+from .metrics import MetricsRecorder
+from .models import ConfigModel, RepoModel
+from .scheduling import History, plan_schedule
+from .serve import WebhookServer, repo_slug
+from .sharding import Shard
+from .tracing import ChromeTraceRecorder, add_listener, remove_listener, span
+from .workspace import Workspace
+
+
+async def _add_pipelines(
+    cfg: ConfigModel,
+    evaluation: RepoEvaluation,
+    pipeline_generator: Union[PipelineGenerator, LocalExecutor],
+    legacy_escape: bool,
+) -> None:
+    repo_model = evaluation.repo_model
+    if evaluation.error is not None:
+        return
+
+    # all images are validated first, a repository is either complete or absent
+    pipelines: List[Tuple[PipelineConfig, Dict[str, str]]] = []
+    for image in evaluation.images:
+        if image.release_tag_exists:
+            print(
+                f"No pipline will be generated, tag '{image.tag}' for image "
+                f"'{image.image_name}:{image.tag}' already present."
+            )
+            continue
+
+        print(f"Assembling pipeline for image {image.image_name}:{image.tag}")
+        # write pipeline configuration here in the folder or append it as a result of this job
+        # just have some scripts to be generated with commands or something!
+        # how do I determine if there is a test stage?
+
+        # build commands validation
+        env_vars = assemble_env_vars(
+            repo_model=repo_model,
+            image_name=image.image_name,
+            registries=cfg.registries,
+            tag=image.tag,
+            revision_tag=image.revision_tag,
+        )
+
+        build_commands: Optional[List[str]] = None
+        test_commands: Optional[List[str]] = None
+        if image.test_tag_exists:
+            print(
+                f"Test image '{image.test_image}:{image.revision_tag}' already "
+                f"present, only testing and pushing {image.image_name}"
+            )
+        else:
+            build_commands = get_commands_build_base(
+                repo_model.pre_docker_build_hooks, legacy_escape
+            )
+            validate_commands_list(build_commands, env_vars)
+
+        # check if test stage is required
+        if repo_model.ci_stage_test_script is not None:
+            # test commands assembly and validation
+            test_commands = get_commands_test_base() + repo_model.ci_stage_test_script
+            validate_commands_list(test_commands, env_vars)
+
+        push_commands = get_commands_push()
+
+        # deploy stage validation
+        validate_commands_list(push_commands, env_vars)
+
+        pipeline_config = PipelineConfig(
+            target=image.image_name,
+            build=build_commands,
+            test=test_commands,
+            test_parallel=(
+                repo_model.ci_stage_test_parallel if test_commands is not None else None
+            ),
+            push=push_commands,
+        )
+        pipelines.append((pipeline_config, env_vars))
+
+    for pipeline_config, env_vars in pipelines:
+        with span("pipeline-write", image=pipeline_config.target):
+            pipeline_config.write_config()
+            await pipeline_generator.add_pipeline_from(pipeline_config, env_vars)
+
+
+async def run_command(
+    config: Path,
+    legacy_escape: bool,
+    compact_pipeline: bool = False,
+    print_pipeline: bool = False,
+    executor: str = EXECUTOR_GITLAB,
+    jobs: int = 1,
+    trace: Optional[Path] = None,
+    metrics_textfile: Optional[Path] = None,
+    metrics_pushgateway: Optional[str] = None,
+    shard: Optional[Shard] = None,
+    workspace: Optional[Workspace] = None,
+    timeouts: Optional[Timeouts] = None,
+    concurrency: int = 1,
+    history_path: Optional[Path] = None,
+    print_schedule: bool = False,
+    config_cache_dir: Optional[Path] = None,
+) -> List[RepoEvaluation]:
+    """
+    returns the repositories which were skipped because of an error,
+    without `history_path` repositories are evaluated in configuration order
+    """
+    workspace = workspace or Workspace()
+    skipped: List[RepoEvaluation] = []
+    trace_recorder: Optional[ChromeTraceRecorder] = None
+    if trace is not None:
+        trace_recorder = ChromeTraceRecorder()
+        add_listener(trace_recorder)
+
+    metrics_recorder: Optional[MetricsRecorder] = None
+    if metrics_textfile is not None or metrics_pushgateway is not None:
+        metrics_recorder = MetricsRecorder()
+        add_listener(metrics_recorder)
+
+    try:
+        with span("load-config"):
+            cfg = ConfigModel.from_cfg_path(config, config_cache_dir)
+        print(cfg)
+
+        repositories = cfg.repositories
+        output_path = GENERATED_PIPELINE_PATH
+        if shard is not None:
+            repositories = shard.select(cfg.repositories)
+            output_path = shard.pipeline_path(GENERATED_PIPELINE_PATH)
+            print(
+                f"Shard {shard}: {len(repositories)} of "
+                f"{len(cfg.repositories)} repositories"
+            )
+
+        history = History.load(history_path) if history_path is not None else None
+        if history is not None or print_schedule:
+            schedule = plan_schedule(repositories, history or History(), concurrency)
+            repositories = schedule.order
+            if print_schedule:
+                print(schedule.describe())
+
+        auth_variables = registry_auth_variables(cfg.registries, repositories)
+        with span("sweep"), workspace:
+            pipeline_generator: Union[PipelineGenerator, LocalExecutor] = (
+                LocalExecutor(
+                    concurrency=jobs,
+                    work_root=workspace.path,
+                    variables=auth_variables,
+                )
+                if executor == EXECUTOR_LOCAL
+                else PipelineGenerator(
+                    compact=compact_pipeline,
+                    print_pipeline=print_pipeline,
+                    output_path=output_path,
+                    variables=auth_variables,
+                )
+            )
+            async with pipeline_generator:
+                async for evaluation in evaluate_repositories(
+                    cfg, repositories, workspace, concurrency, timeouts
+                ):
+                    if history is not None:
+                        history.record(evaluation)
+                    try:
+                        await _add_pipelines(
+                            cfg, evaluation, pipeline_generator, legacy_escape
+                        )
+                    except (ValueError, InvalidPipelineError) as exc:
+                        evaluation.error = f"{exc.__class__.__name__}: {exc}"
+                    if evaluation.error is not None:
+                        skipped.append(evaluation)
+        _print_skipped(skipped, len(repositories))
+        if history is not None:
+            assert history_path
+            history.save(history_path)
+    finally:
+        if trace_recorder is not None:
+            remove_listener(trace_recorder)
+            assert trace
+            trace_recorder.write(trace)
+            print(trace_recorder.summary())
+            print(f"Trace written to '{trace}'")
+
+        if metrics_recorder is not None:
+            remove_listener(metrics_recorder)
+            if metrics_textfile is not None:
+                metrics_recorder.write_textfile(metrics_textfile)
+                print(f"Metrics written to '{metrics_textfile}'")
+            if metrics_pushgateway is not None:
+                try:
+                    await metrics_recorder.push(metrics_pushgateway)
+                except httpx.HTTPError as exc:
+                    print(f"[WARNING] could not push metrics: {exc}")
+    return skipped
+
+
+def _print_skipped(skipped: List[RepoEvaluation], total: int) -> None:
+    if not skipped:
+        return
+    print(HEADER)
+    print(f"{len(skipped)} of {total} repositories skipped, no pipeline generated:")
+    for evaluation in skipped:
+        verdict = "TIMED OUT" if evaluation.timed_out else "FAILED"
+        print(
+            f"  {verdict:<9} {repo_span_name(evaluation.repo_model)}: "
+            f"{evaluation.error}"
+        )
+    print(HEADER)
+
+
+async def serve_command(
+    config: Path,
+    host: str,
+    port: int,
+    webhook_secret: Optional[str],
+    reconcile_interval: float,
+    concurrency: int,
+    output_dir: Path,
+    compact_pipeline: bool,
+    legacy_escape: bool,
+    workspace: Optional[Workspace] = None,
+    timeouts: Optional[Timeouts] = None,
+    config_cache_dir: Optional[Path] = None,
+) -> None:
+    async def _emit_pipeline(cfg: ConfigModel, evaluation: RepoEvaluation) -> None:
+        assert evaluation.branch_hash
+        output_path = (
+            output_dir
+            / f"child-pipeline-{repo_slug(evaluation.repo_model)}-{evaluation.branch_hash[:8]}.yml"
+        )
+        async with PipelineGenerator(
+            compact=compact_pipeline,
+            output_path=output_path,
+            variables=registry_auth_variables(cfg.registries, [evaluation.repo_model]),
+        ) as pipeline_generator:
+            await _add_pipelines(cfg, evaluation, pipeline_generator, legacy_escape)
+
+    if webhook_secret is None:
+        print("[WARNING] no webhook secret configured, all webhooks are accepted")
+    server = WebhookServer(
+        config,
+        emit=_emit_pipeline,
+        secret=webhook_secret,
+        reconcile_interval=reconcile_interval,
+        concurrency=concurrency,
+        workspace=workspace,
+        timeouts=timeouts,
+        config_cache_dir=config_cache_dir,
+    )
+    await server.serve(host, port)
+
+
+def _filter_repositories(
+    repositories: List[RepoModel], repo_filters: Sequence[str]
+) -> List[RepoModel]:
+    if not repo_filters:
+        return repositories
+    return [
+        repo_model
+        for repo_model in repositories
+        if any(
+            repo_filter in f"{repo_model.http_url_to_repo}@{repo_model.branch}"
+            for repo_filter in repo_filters
+        )
+    ]
+
+
+def _plan_records(evaluation: RepoEvaluation) -> List[Dict[str, Any]]:
+    repo_record: Dict[str, Any] = {
+        "repo": evaluation.repo_model.http_url_to_repo,
+        "branch": evaluation.repo_model.branch,
+        "hash": evaluation.branch_hash,
+        "ci_passed": evaluation.ci_passed,
+        "timings": {k: round(v, 3) for k, v in evaluation.timings.items()},
+    }
+    if evaluation.error is not None:
+        return [
+            {
+                **repo_record,
+                "image": None,
+                "error": evaluation.error,
+                "timed_out": evaluation.timed_out,
+            }
+        ]
+    if not evaluation.images:
+        return [{**repo_record, "image": None}]
+    return [
+        {
+            **repo_record,
+            "image": image.image_name,
+            "tag": image.tag,
+            "release_image": image.release_image,
+            "exists_in_registry": image.release_tag_exists,
+            "build_required": not image.release_tag_exists
+            and not image.test_tag_exists,
+            "test_image_exists": image.test_tag_exists,
+            "tree_hash": image.tree_hash,
+        }
+        for image in evaluation.images
+    ]
+
+
+def _plan_verdict(record: Dict[str, Any]) -> str:
+    """what `run` would do for a plan record"""
+    if record.get("timed_out"):
+        return "timed-out"
+    if record.get("error"):
+        return "failed"
+    if not record["ci_passed"]:
+        return "ci-failed"
+    if record.get("build_required"):
+        return "build"
+    if record.get("test_image_exists"):
+        # the test image of this revision was pushed, it is tested and pushed
+        return "test-and-push"
+    return "up-to-date"
+
+
+async def plan_command(
+    config: Path,
+    repo_filters: Sequence[str],
+    concurrency: int,
+    as_json: bool,
+    workspace: Optional[Workspace] = None,
+    timeouts: Optional[Timeouts] = None,
+    config_cache_dir: Optional[Path] = None,
+) -> List[RepoEvaluation]:
+    """
+    evaluates repositories without writing to the working tree, returns
+    the ones which could not be evaluated
+    """
+    skipped: List[RepoEvaluation] = []
+    output = sys.stdout
+    # progress messages from the evaluation must not end up in the JSON output
+    with contextlib.redirect_stdout(sys.stderr), workspace or Workspace() as workspace:
+        cfg = ConfigModel.from_cfg_path(config, config_cache_dir)
+        repositories = _filter_repositories(cfg.repositories, repo_filters)
+        async for evaluation in evaluate_repositories(
+            cfg, repositories, workspace, concurrency, timeouts
+        ):
+            if evaluation.error is not None:
+                skipped.append(evaluation)
+            for record in _plan_records(evaluation):
+                if as_json:
+                    output.write(json.dumps(record) + "\n")
+                else:
+                    verdict = _plan_verdict(record)
+                    output.write(
+                        f"{verdict:<13} {record['repo']}@{record['branch']} "
+                        f"{record['image'] or ''}:{record.get('tag') or ''}\n"
+                    )
+                output.flush()
+        _print_skipped(skipped, len(repositories))
+    return skipped
@@ -0,0 +1,170 @@
+"""
+Orders the repositories of a sweep using the durations measured by the
+previous runs: longest processing time first, so a huge repository does
+not start last and dominate the sweep. Repositories which were green and
+unchanged for a few runs go after all the others.
+"""
+
+import heapq
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from pydantic import BaseModel, Field, ValidationError
+
+from .config_loader import default_cache_dir
+from .evaluation import RepoEvaluation, repo_span_name
+from .models import RepoModel
+
+# weight of the latest measurement in the moving average of each phase
+SMOOTHING = 0.5
+# green and unchanged for this many runs in a row: evaluated last
+STABLE_RUNS = 3
+
+
+def default_history_path() -> Path:
+    return default_cache_dir() / "history.json"
+
+
+class RepoHistory(BaseModel):
+    phases: Dict[str, float] = Field(
+        default_factory=dict, description="moving average of each phase, seconds"
+    )
+    branch_hash: Optional[str] = None
+    unchanged_runs: int = Field(
+        0, description="consecutive runs without new commits or images to build"
+    )
+
+    @property
+    def duration(self) -> float:
+        return sum(self.phases.values())
+
+    @property
+    def stable(self) -> bool:
+        return self.unchanged_runs >= STABLE_RUNS
+
+
+class History(BaseModel):
+    repositories: Dict[str, RepoHistory] = Field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: Path) -> "History":
+        """an empty history if the file is missing or unreadable"""
+        try:
+            return cls.model_validate_json(path.read_text())
+        except (OSError, ValidationError) as exc:
+            if path.exists():
+                print(f"[WARNING] ignoring history '{path}': {exc}")
+            return cls()
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file_descriptor, tmp_path = tempfile.mkstemp(
+            dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+        )
+        try:
+            with os.fdopen(file_descriptor, "w") as file:
+                file.write(self.model_dump_json(indent=1))
+            os.replace(tmp_path, path)
+        finally:
+            Path(tmp_path).unlink(missing_ok=True)
+
+    def get(self, repo_model: RepoModel) -> Optional[RepoHistory]:
+        return self.repositories.get(repo_span_name(repo_model))
+
+    def record(self, evaluation: RepoEvaluation) -> None:
+        key = repo_span_name(evaluation.repo_model)
+        repo_history = self.repositories.setdefault(key, RepoHistory())
+        for phase, seconds in evaluation.timings.items():
+            previous = repo_history.phases.get(phase)
+            repo_history.phases[phase] = (
+                seconds
+                if previous is None
+                else SMOOTHING * seconds + (1 - SMOOTHING) * previous
+            )
+
+        unchanged = (
+            evaluation.error is None
+            and evaluation.ci_passed
+            and not evaluation.outdated_images
+            and evaluation.branch_hash == repo_history.branch_hash
+        )
+        repo_history.unchanged_runs = (
+            repo_history.unchanged_runs + 1 if unchanged else 0
+        )
+        if evaluation.branch_hash is not None:
+            repo_history.branch_hash = evaluation.branch_hash
+
+
+class ScheduledRepo(BaseModel):
+    repo_model: RepoModel
+    predicted: float = Field(..., description="seconds, estimated if not measured")
+    measured: bool
+    stable: bool
+    start: float = 0.0
+
+
+class Schedule(BaseModel):
+    repositories: List[ScheduledRepo]
+    concurrency: int
+    makespan: float = Field(..., description="predicted duration of the sweep")
+
+    @property
+    def order(self) -> List[RepoModel]:
+        return [scheduled.repo_model for scheduled in self.repositories]
+
+    def describe(self) -> str:
+        lines = [
+            f"Schedule of {len(self.repositories)} repositories, "
+            f"{self.concurrency} at once, predicted makespan {self.makespan:.1f}s"
+            + (" (sequential, same in any order)" if self.concurrency == 1 else "")
+        ]
+        for index, scheduled in enumerate(self.repositories, start=1):
+            notes = [] if scheduled.measured else ["no history"]
+            if scheduled.stable:
+                notes.append("stable")
+            lines.append(
+                f"  {index:>4}. start {scheduled.start:>7.1f}s "
+                f"takes {scheduled.predicted:>7.1f}s "
+                f"{repo_span_name(scheduled.repo_model)}"
+                + (f" ({', '.join(notes)})" if notes else "")
+            )
+        return "\n".join(lines)
+
+
+def _simulate(repositories: List[ScheduledRepo], concurrency: int) -> float:
+    """start of each repository as evaluated by `concurrency` workers"""
+    workers = [0.0] * min(concurrency, len(repositories))
+    for scheduled in repositories:
+        scheduled.start = heapq.heappop(workers)
+        heapq.heappush(workers, scheduled.start + scheduled.predicted)
+    return max(workers, default=0.0)
+
+
+def plan_schedule(
+    repositories: Sequence[RepoModel], history: History, concurrency: int = 1
+) -> Schedule:
+    """
+    Longest first, stable repositories last. Repositories without history
+    are assumed as slow as the slowest known one, so they start early.
+    """
+    known = [h for h in map(history.get, repositories) if h is not None and h.phases]
+    fallback = max((h.duration for h in known), default=0.0)
+
+    scheduled = []
+    for repo_model in repositories:
+        repo_history = history.get(repo_model)
+        measured = repo_history is not None and bool(repo_history.phases)
+        scheduled.append(
+            ScheduledRepo(
+                repo_model=repo_model,
+                predicted=repo_history.duration if measured else fallback,
+                measured=measured,
+                stable=repo_history is not None and repo_history.stable,
+            )
+        )
+    # stable sort, ties keep the order of the configuration
+    scheduled.sort(key=lambda s: (s.stable, -s.predicted))
+    makespan = _simulate(scheduled, concurrency)
+    return Schedule(repositories=scheduled, concurrency=concurrency, makespan=makespan)
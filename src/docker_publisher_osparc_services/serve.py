@@ -0,0 +1,422 @@
+"""
+Long running mode: instead of sweeping the whole configuration on a
+schedule, a repository is re-evaluated when GitLab or GitHub report a push
+or a finished pipeline for it. A periodic full reconciliation catches
+webhooks which were lost or never configured.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import re
+import time
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Set, Tuple
+
+import yaml
+from pydantic import BaseModel
+from yarl import URL
+
+from .evaluation import RepoEvaluation, Timeouts, evaluate_repository
+from .exceptions import InvalidPipelineError, WebhookRejectedError
+from .http_interface import shared_client
+from .models import ConfigModel, HostType, RepoModel
+from .workspace import Workspace
+
+WEBHOOK_PATH = "/webhook"
+HEALTH_PATH = "/healthz"
+MAX_BODY_SIZE = 5 * 2**20
+_READ_TIMEOUT = 10
+
+EVENT_PUSH = "push"
+EVENT_PIPELINE = "pipeline"
+
+EmitCallback = Callable[[ConfigModel, RepoEvaluation], Awaitable[None]]
+
+
+class WebhookEvent(BaseModel):
+    host_type: HostType
+    kind: str
+    repo_url: str
+    branch: str
+
+
+def normalize_repo_url(url: str) -> str:
+    """comparable form of a clone address: no scheme, credentials or `.git`"""
+    parsed = URL(url)
+    path = parsed.path.rstrip("/")
+    if path.endswith(".git"):
+        path = path[: -len(".git")]
+    return f"{(parsed.host or '').lower()}{path}"
+
+
+def entry_key(repo_model: RepoModel) -> str:
+    """
+    identifies a configuration entry, the same repository and branch may
+    be published to several registries
+    """
+    return f"{repo_model.address}@{repo_model.branch}->{repo_model.registry.target}"
+
+
+def repo_slug(repo_model: RepoModel) -> str:
+    slug = (
+        f"{normalize_repo_url(repo_model.address)}-{repo_model.branch}-"
+        f"{repo_model.registry.target}"
+    )
+    return re.sub(r"[^a-zA-Z0-9]+", "-", slug).strip("-")
+
+
+def _branch_from_ref(ref: str) -> Optional[str]:
+    prefix = "refs/heads/"
+    return ref[len(prefix) :] if ref.startswith(prefix) else None
+
+
+def _load_payload(body: bytes) -> Dict[str, Any]:
+    try:
+        payload = json.loads(body)
+    except ValueError as exc:
+        raise WebhookRejectedError(400, "body is not JSON") from exc
+    if not isinstance(payload, dict):
+        raise WebhookRejectedError(400, "body is not a JSON object")
+    return payload
+
+
+def _gitlab_event(event: str, payload: Dict[str, Any]) -> Optional[WebhookEvent]:
+    if event == "Push Hook":
+        branch = _branch_from_ref(payload["ref"])
+        kind = EVENT_PUSH
+    elif event == "Pipeline Hook":
+        attributes = payload["object_attributes"]
+        if attributes["status"] != "success" or attributes.get("tag"):
+            return None
+        branch = attributes["ref"]
+        kind = EVENT_PIPELINE
+    else:
+        return None
+    if branch is None:
+        return None
+    return WebhookEvent(
+        host_type=HostType.GITLAB,
+        kind=kind,
+        repo_url=payload["project"]["git_http_url"],
+        branch=branch,
+    )
+
+
+def _github_event(event: str, payload: Dict[str, Any]) -> Optional[WebhookEvent]:
+    if event == "push":
+        branch = _branch_from_ref(payload["ref"])
+        kind = EVENT_PUSH
+    elif event == "workflow_run":
+        run = payload["workflow_run"]
+        if payload["action"] != "completed" or run["conclusion"] != "success":
+            return None
+        branch = run["head_branch"]
+        kind = EVENT_PIPELINE
+    else:
+        return None
+    if branch is None:
+        return None
+    return WebhookEvent(
+        host_type=HostType.GITHUB,
+        kind=kind,
+        repo_url=payload["repository"]["clone_url"],
+        branch=branch,
+    )
+
+
+def parse_webhook(
+    headers: Mapping[str, str], body: bytes, secret: Optional[str]
+) -> Optional[WebhookEvent]:
+    """
+    `headers` names are lower case. Returns None for events which do not
+    require an evaluation (e.g. tags, failed pipelines, pings).
+    """
+    if "x-gitlab-event" in headers:
+        if secret is not None and not hmac.compare_digest(
+            headers.get("x-gitlab-token", ""), secret
+        ):
+            raise WebhookRejectedError(401, "invalid X-Gitlab-Token")
+        event, parse_event = headers["x-gitlab-event"], _gitlab_event
+    elif "x-github-event" in headers:
+        if secret is not None:
+            signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(
+                headers.get("x-hub-signature-256", ""), f"sha256={signature}"
+            ):
+                raise WebhookRejectedError(401, "invalid X-Hub-Signature-256")
+        event, parse_event = headers["x-github-event"], _github_event
+    else:
+        raise WebhookRejectedError(400, "neither a GitLab nor a GitHub webhook")
+
+    payload = _load_payload(body)
+    try:
+        return parse_event(event, payload)
+    except (KeyError, TypeError) as exc:
+        raise WebhookRejectedError(
+            400, f"unexpected '{event}' payload, missing {exc}"
+        ) from exc
+
+
+class WebhookServer:
+    """
+    Keeps the configuration and the HTTP connection pool warm. A repository
+    is evaluated by at most one task at a time, events arriving meanwhile
+    cause a single extra evaluation once the current one is done.
+
+    Pipelines are emitted once per image and tag, a reconciliation emits
+    again the ones which were not pushed in the meantime.
+    """
+
+    def __init__(
+        self,
+        config_path: Path,
+        emit: EmitCallback,
+        secret: Optional[str] = None,
+        reconcile_interval: float = 3600,
+        concurrency: int = 4,
+        workspace: Optional[Workspace] = None,
+        timeouts: Optional[Timeouts] = None,
+        config_cache_dir: Optional[Path] = None,
+    ) -> None:
+        self.config_path = config_path
+        self.config_cache_dir = config_cache_dir
+        self.emit = emit
+        self.workspace = workspace or Workspace()
+        self.timeouts = timeouts or Timeouts()
+        self.secret = secret
+        self.reconcile_interval = reconcile_interval
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cfg: Optional[ConfigModel] = None
+        self._config_mtime: Optional[float] = None
+        self._config_error: Optional[str] = None
+        self._running: Dict[str, "asyncio.Task[None]"] = {}
+        self._dirty: Set[str] = set()
+        self._emitted: Dict[str, Set[Tuple[str, str]]] = {}
+        self._evaluations = 0
+        self._last_reconcile: Optional[float] = None
+
+    @property
+    def cfg(self) -> ConfigModel:
+        assert self._cfg
+        return self._cfg
+
+    def reload_config(self) -> None:
+        """
+        reloads the configuration if the file changed, keeps the last valid
+        one if it is missing, unreadable or invalid (e.g. while deployed)
+        """
+        try:
+            mtime = self.config_path.stat().st_mtime
+            if mtime == self._config_mtime:
+                return
+            self._cfg = ConfigModel.from_cfg_path(
+                self.config_path, self.config_cache_dir
+            )
+        except (OSError, ValueError, yaml.YAMLError) as exc:
+            if self._cfg is None:
+                raise
+            self._config_error = f"{exc}"
+            print(f"[WARNING] keeping previous configuration: {exc}")
+            return
+        self._config_mtime = mtime
+        self._config_error = None
+        print(
+            f"Loaded {len(self._cfg.repositories)} repositories "
+            f"from '{self.config_path}'"
+        )
+
+    def repositories_for(self, event: WebhookEvent) -> List[RepoModel]:
+        repo_url = normalize_repo_url(event.repo_url)
+        return [
+            repo_model
+            for repo_model in self.cfg.repositories
+            if repo_model.host_type == event.host_type
+            and repo_model.branch == event.branch
+            and normalize_repo_url(repo_model.address) == repo_url
+        ]
+
+    def schedule(self, repo_model: RepoModel) -> "asyncio.Task[None]":
+        key = entry_key(repo_model)
+        if key in self._running:
+            self._dirty.add(key)
+            return self._running[key]
+        task = asyncio.create_task(self._evaluate_until_clean(key, repo_model))
+        self._running[key] = task
+        return task
+
+    async def _evaluate_until_clean(self, key: str, repo_model: RepoModel) -> None:
+        try:
+            while True:
+                self._dirty.discard(key)
+                await self._evaluate(key, repo_model)
+                if key not in self._dirty:
+                    return
+        finally:
+            self._running.pop(key, None)
+
+    async def _evaluate(self, key: str, repo_model: RepoModel) -> None:
+        async with self._semaphore:
+            # errors and timeouts are reported by the evaluation itself
+            evaluation = await evaluate_repository(
+                self.cfg, repo_model, self.workspace, self.timeouts
+            )
+            self._evaluations += 1
+            if evaluation.error is not None:
+                return
+
+            emitted = self._emitted.setdefault(key, set())
+            images = [
+                image
+                for image in evaluation.outdated_images
+                if (image.image_name, image.tag) not in emitted
+            ]
+            if not images:
+                return
+            try:
+                await self.emit(
+                    self.cfg, evaluation.model_copy(update={"images": images})
+                )
+            except (ValueError, InvalidPipelineError) as exc:
+                print(f"[WARNING] no pipeline emitted for '{key}': {exc}")
+                return
+            except Exception as exc:  # pylint: disable=broad-except
+                # e.g. a full disk, retried by the next event or reconciliation
+                print(
+                    f"[ERROR] no pipeline emitted for '{key}': "
+                    f"{exc.__class__.__name__}: {exc}"
+                )
+                return
+            emitted.update((image.image_name, image.tag) for image in images)
+
+    async def reconcile(self) -> None:
+        self.reload_config()
+        self._emitted.clear()
+        # webhooks may reload the configuration meanwhile
+        repositories = self.cfg.repositories
+        results = await asyncio.gather(
+            *(self.schedule(repo_model) for repo_model in repositories),
+            return_exceptions=True,
+        )
+        for repo_model, result in zip(repositories, results):
+            if isinstance(result, Exception):
+                print(
+                    f"[ERROR] reconciliation of '{entry_key(repo_model)}' failed: "
+                    f"{result.__class__.__name__}: {result}"
+                )
+        self._last_reconcile = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "repositories": len(self.cfg.repositories),
+            "running": sorted(self._running),
+            "evaluations": self._evaluations,
+            "last_reconcile": self._last_reconcile,
+        }
+
+    def handle_webhook(self, headers: Mapping[str, str], body: bytes) -> Dict[str, Any]:
+        event = parse_webhook(headers, body, self.secret)
+        if event is None:
+            return {"status": "ignored"}
+
+        try:
+            self.reload_config()
+        except (OSError, ValueError, yaml.YAMLError) as exc:
+            raise WebhookRejectedError(503, f"no valid configuration: {exc}") from exc
+        if self._config_error is not None:
+            # the sender retries, the reconciliation uses the last valid one
+            raise WebhookRejectedError(
+                503, f"configuration unavailable: {self._config_error}"
+            )
+        repo_models = self.repositories_for(event)
+        for repo_model in repo_models:
+            self.schedule(repo_model)
+        print(
+            f"Webhook {event.host_type.value} {event.kind} for "
+            f"'{event.repo_url}@{event.branch}': {len(repo_models)} scheduled"
+        )
+        return {
+            "status": "scheduled" if repo_models else "not monitored",
+            "repositories": [entry_key(repo_model) for repo_model in repo_models],
+        }
+
+    async def _read_request(
+        self, reader: asyncio.StreamReader
+    ) -> Tuple[str, str, Dict[str, str], bytes]:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        if len(request_line) != 3:
+            raise WebhookRejectedError(400, "malformed request line")
+        method, target, _ = request_line
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = (await reader.readline()).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        body = b""
+        if method == "POST":
+            if not headers.get("content-length", "").isdigit():
+                raise WebhookRejectedError(411, "Content-Length is required")
+            length = int(headers["content-length"])
+            if length > MAX_BODY_SIZE:
+                raise WebhookRejectedError(413, "body too large")
+            body = await reader.readexactly(length)
+        return method, target, headers, body
+
+    def _route(
+        self, method: str, target: str, headers: Dict[str, str], body: bytes
+    ) -> Tuple[int, Dict[str, Any]]:
+        path = target.split("?")[0]
+        if method == "GET" and path == HEALTH_PATH:
+            return 200, self.status()
+        if method == "POST" and path == WEBHOOK_PATH:
+            result = self.handle_webhook(headers, body)
+            return (202 if result["status"] == "scheduled" else 200), result
+        return 404, {"error": f"no route for {method} {path}"}
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request = await asyncio.wait_for(self._read_request(reader), _READ_TIMEOUT)
+            status_code, response = self._route(*request)
+        except WebhookRejectedError as exc:
+            status_code, response = exc.status_code, {"error": f"{exc}"}
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            status_code, response = 408, {"error": "incomplete request"}
+        except Exception as exc:  # pylint: disable=broad-except
+            # the sender always gets an answer, and may retry
+            print(f"[ERROR] webhook failed: {exc.__class__.__name__}: {exc}")
+            status_code, response = 503, {"error": f"{exc.__class__.__name__}"}
+
+        content = json.dumps(response).encode()
+        writer.write(
+            (
+                f"HTTP/1.1 {status_code} {HTTPStatus(status_code).phrase}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(content)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+            + content
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        self.reload_config()
+        with self.workspace:
+            async with shared_client():
+                server = await asyncio.start_server(self._handle_connection, host, port)
+                print(f"Listening for webhooks on http://{host}:{port}{WEBHOOK_PATH}")
+                async with server:
+                    while True:
+                        await self.reconcile()
+                        await asyncio.sleep(self.reconcile_interval)
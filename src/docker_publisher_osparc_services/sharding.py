@@ -0,0 +1,54 @@
+"""
+Splits the monitored repositories across N parallel `dpos` jobs. The
+assignment only depends on address and branch, adding or removing
+repositories does not move the other ones to a different shard.
+"""
+
+import hashlib
+from pathlib import Path
+from typing import List
+
+from pydantic import BaseModel, Field, model_validator
+
+from .models import RepoModel
+
+
+def shard_key(repo_model: RepoModel) -> str:
+    return f"{repo_model.address}@{repo_model.branch}"
+
+
+class Shard(BaseModel):
+    index: int = Field(..., ge=1, description="1 based, same as CI_NODE_INDEX")
+    total: int = Field(..., ge=1, description="same as CI_NODE_TOTAL")
+
+    @model_validator(mode="after")
+    def index_in_range(self) -> "Shard":
+        if self.index > self.total:
+            raise ValueError(f"shard {self.index} is out of range 1..{self.total}")
+        return self
+
+    @classmethod
+    def parse(cls, value: str) -> "Shard":
+        """parses the `i/N` notation"""
+        index, separator, total = value.partition("/")
+        if not separator or not index.isdigit() or not total.isdigit():
+            raise ValueError(f"expected 'i/N', got '{value}'")
+        if not 1 <= int(index) <= int(total):
+            raise ValueError(f"expected 1 <= i <= N, got '{value}'")
+        return cls(index=int(index), total=int(total))
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.total}"
+
+    def owns(self, repo_model: RepoModel) -> bool:
+        digest = hashlib.sha256(shard_key(repo_model).encode()).digest()
+        return int.from_bytes(digest[:8], "big") % self.total == self.index - 1
+
+    def select(self, repositories: List[RepoModel]) -> List[RepoModel]:
+        return [repo_model for repo_model in repositories if self.owns(repo_model)]
+
+    def pipeline_path(self, path: Path) -> Path:
+        """partial pipeline written by this shard, next to `path`"""
+        return path.with_name(
+            f"{path.stem}.shard-{self.index}-of-{self.total}{path.suffix}"
+        )
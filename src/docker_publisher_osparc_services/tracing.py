@@ -0,0 +1,202 @@
+"""
+Lightweight timing spans for repositories, phases, HTTP requests and
+subprocesses. Spans are only recorded when at least one listener is
+registered, otherwise `span` returns a shared no-op context manager.
+"""
+
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional
+
+CATEGORY_REPO = "repo"
+CATEGORY_PHASE = "phase"
+CATEGORY_HTTP = "http"
+CATEGORY_SUBPROCESS = "subprocess"
+CATEGORY_RETRY = "retry"
+CATEGORY_EVENT = "event"
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "category",
+        "args",
+        "parent",
+        "lane",
+        "start_ns",
+        "end_ns",
+        "retries",
+    )
+
+    def __init__(
+        self, name: str, category: str, args: Dict[str, Any], parent: Optional["Span"]
+    ) -> None:
+        self.name = name
+        self.category = category
+        self.args = args
+        self.parent = parent
+        self.lane = _current_lane()
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = self.start_ns
+        self.retries = 0
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    @property
+    def repo(self) -> Optional[str]:
+        span: Optional[Span] = self
+        while span is not None:
+            if "repo" in span.args:
+                return span.args["repo"]
+            span = span.parent
+        return None
+
+
+SpanListener = Callable[[Span], None]
+
+_listeners: List[SpanListener] = []
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_lanes: Dict[int, int] = {}
+_NO_SPAN: ContextManager[None] = nullcontext()
+
+
+def _current_lane() -> int:
+    # every asyncio task gets its own lane, so concurrent spans never overlap
+    try:
+        task_id = id(asyncio.current_task())
+    except RuntimeError:
+        task_id = 0
+    return _lanes.setdefault(task_id, len(_lanes) + 1)
+
+
+def add_listener(listener: SpanListener) -> None:
+    _listeners.append(listener)
+
+
+def remove_listener(listener: SpanListener) -> None:
+    _listeners.remove(listener)
+
+
+def is_enabled() -> bool:
+    return len(_listeners) > 0
+
+
+@contextmanager
+def _recorded_span(name: str, category: str, args: Dict[str, Any]) -> Iterator[Span]:
+    span = Span(name, category, args, _current_span.get())
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.args["error"] = type(exc).__name__
+        raise
+    finally:
+        span.end_ns = time.perf_counter_ns()
+        _current_span.reset(token)
+        if span.retries:
+            span.args["retries"] = span.retries
+        for listener in _listeners:
+            listener(span)
+
+
+def span(name: str, category: str = CATEGORY_PHASE, **args: Any) -> ContextManager:
+    if not _listeners:
+        return _NO_SPAN
+    return _recorded_span(name, category, args)
+
+
+def record_retry(retry_state: Any) -> None:
+    """`before_sleep` hook for tenacity, counts retries on the enclosing span"""
+    if not _listeners:
+        return
+    parent = _current_span.get()
+    if parent is not None:
+        parent.retries += 1
+    fn_name = getattr(retry_state.fn, "__name__", "unknown")
+    with span(
+        f"retry {fn_name}",
+        CATEGORY_RETRY,
+        function=fn_name,
+        attempt=retry_state.attempt_number,
+    ):
+        pass
+
+
+def record_event(name: str, **args: Any) -> None:
+    """instant event carrying outcomes or sizes, e.g. tag hits and misses"""
+    if not _listeners:
+        return
+    with span(name, CATEGORY_EVENT, **args):
+        pass
+
+
+class ChromeTraceRecorder:
+    """collects spans and exports them in the Chrome trace-event format"""
+
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        self._origin_ns = time.perf_counter_ns()
+
+    def __call__(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def _event(self, span: Span) -> Dict[str, Any]:
+        event = {
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": (span.start_ns - self._origin_ns) / 1e3,
+            "dur": (span.end_ns - span.start_ns) / 1e3,
+            "pid": os.getpid(),
+            "tid": span.lane,
+            "args": span.args,
+        }
+        if span.category == CATEGORY_EVENT:
+            event["ph"] = "i"
+            event["s"] = "t"
+            del event["dur"]
+        return event
+
+    def write(self, path: Path) -> None:
+        trace = {
+            "traceEvents": [self._event(span) for span in self.spans],
+            "displayTimeUnit": "ms",
+        }
+        path.write_text(json.dumps(trace, default=str))
+
+    def summary(self, top: int = 10) -> str:
+        repos: Dict[str, float] = defaultdict(float)
+        phases: Dict[str, List[float]] = defaultdict(list)
+        retries: Dict[str, int] = defaultdict(int)
+        for span in self.spans:
+            if span.category == CATEGORY_REPO:
+                repos[span.name] += span.duration
+            elif span.category not in (CATEGORY_RETRY, CATEGORY_EVENT):
+                phases[f"{span.category}:{span.name}"].append(span.duration)
+            if span.retries:
+                retries[f"{span.category}:{span.name}"] += span.retries
+
+        lines = [f"{'SLOWEST REPOSITORIES':<60} {'total [s]':>10}"]
+        for name, duration in sorted(repos.items(), key=lambda x: -x[1])[:top]:
+            lines.append(f"{name:<60} {duration:>10.2f}")
+
+        lines.append("")
+        lines.append(
+            f"{'SLOWEST PHASES':<40} {'count':>6} {'total [s]':>10} "
+            f"{'max [s]':>8} {'retries':>8}"
+        )
+        by_total = sorted(phases.items(), key=lambda x: -sum(x[1]))
+        for name, durations in by_total[:top]:
+            lines.append(
+                f"{name:<40} {len(durations):>6} {sum(durations):>10.2f} "
+                f"{max(durations):>8.2f} {retries.get(name, 0):>8}"
+            )
+        return "\n".join(lines)
@@ -1,28 +1,56 @@
 import asyncio
+import os
+import signal
+from pathlib import Path
 
 from .exceptions import CommandFailedException
+from .tracing import CATEGORY_SUBPROCESS, span
+
+
+def command_kind(command: str) -> str:
+    """program and subcommand, never contains arguments like credentials"""
+    return " ".join(command.split(" ")[:2])
 
 
 async def _command(command: str, live_output: bool = False, **kwargs) -> str:
+    with span(command_kind(command), CATEGORY_SUBPROCESS):
+        return await _run(command, live_output, **kwargs)
+
+
+def kill_process_group(proc: asyncio.subprocess.Process) -> None:
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def _run(command: str, live_output: bool, **kwargs) -> str:
     print(f"$ '{command}'")
     proc = await asyncio.create_subprocess_exec(
         *command.split(" "),
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.STDOUT,
+        # own process group, so helpers (e.g. git-remote-https) are killed too
+        start_new_session=True,
         **kwargs,
     )
     decoded_stdout = ""
-    while True:
-        line = await proc.stdout.readline()
-        if not line:
-            break
+    try:
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
 
-        decoded_line = line.decode("utf-8")
-        if live_output:
-            print(decoded_line, end="")
-        decoded_stdout += decoded_line
+            decoded_line = line.decode("utf-8")
+            if live_output:
+                print(decoded_line, end="")
+            decoded_stdout += decoded_line
 
-    await proc.wait()
+        await proc.wait()
+    except asyncio.CancelledError:
+        kill_process_group(proc)
+        await proc.wait()
+        raise
 
     if proc.returncode != 0:
         print(f"STDOUT: {decoded_stdout}")
@@ -33,3 +61,14 @@ async def _command(command: str, live_output: bool = False, **kwargs) -> str:
 
 async def command_output(cmd: str, **kwargs) -> str:
     return await _command(cmd, **kwargs)
+
+
+def directory_size(path: Path) -> int:
+    """size in bytes of all files in the directory, symlinks are not followed"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            file_path = os.path.join(root, file_name)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+    return total
@@ -0,0 +1,94 @@
+"""
+Scratch space of a run. Each repository gets its own directory below the
+workspace, removed as soon as its evaluation is done, so clones do not pile
+up in `/tmp` during large sweeps or in a long running process.
+"""
+
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from types import TracebackType
+from typing import Iterator, Optional, Type
+
+from yarl import URL
+
+from .exceptions import WorkspaceQuotaExceededError
+from .models import RepoModel
+from .utils import directory_size
+
+_SIZE_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_size(value: str) -> int:
+    """bytes from a size like `512M` or `2G` (binary units)"""
+    match = re.fullmatch(r"\s*(\d+)\s*([KMGT]?)i?B?\s*", value.upper())
+    if match is None:
+        raise ValueError(f"expected a size like '512M' or '2G', got '{value}'")
+    return int(match.group(1)) * _SIZE_UNITS[match.group(2)]
+
+
+class Workspace:
+    """
+    Creates a `dpos-workspace-*` directory below `root` (the system temporary
+    directory by default). With `keep` nothing is removed, e.g. to inspect
+    the clones after a run. `quota` is the maximum amount of bytes used by
+    all the directories at once.
+    """
+
+    def __init__(
+        self,
+        root: Optional[Path] = None,
+        keep: bool = False,
+        quota: Optional[int] = None,
+    ) -> None:
+        self.root = root
+        self.keep = keep
+        self.quota = quota
+        self.path: Optional[Path] = None
+        self.peak_bytes = 0
+
+    def __enter__(self) -> "Workspace":
+        if self.root is not None:
+            self.root.mkdir(parents=True, exist_ok=True)
+        self.path = Path(tempfile.mkdtemp(prefix="dpos-workspace-", dir=self.root))
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        assert self.path
+        if self.keep:
+            print(
+                f"Workspace kept in '{self.path}' "
+                f"({directory_size(self.path)} bytes, peak {self.peak_bytes} bytes)"
+            )
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+            print(f"Workspace removed (peak {self.peak_bytes} bytes)")
+
+    @contextmanager
+    def repository_dir(self, repo_model: RepoModel) -> Iterator[Path]:
+        """an empty directory for this repository, removed on exit"""
+        assert self.path, "workspace not entered"
+        name = Path(URL(repo_model.address).path).stem
+        prefix = re.sub(r"[^a-zA-Z0-9]+", "-", f"{name}-{repo_model.branch}")
+        directory = Path(tempfile.mkdtemp(prefix=f"{prefix}-", dir=self.path))
+        try:
+            yield directory
+        finally:
+            if not self.keep:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def check_quota(self) -> int:
+        """returns the bytes in use, raises if they exceed the quota"""
+        assert self.path, "workspace not entered"
+        used = directory_size(self.path)
+        self.peak_bytes = max(self.peak_bytes, used)
+        if self.quota is not None and used > self.quota:
+            raise WorkspaceQuotaExceededError(self.path, used, self.quota)
+        return used
@@ -0,0 +1,129 @@
+"""
+YAML loading with libyaml when PyYAML was built with it. Compose specs are
+read selectively: only the image of each service is extracted from the
+event stream, nothing else is constructed.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import yaml
+from pydantic import BaseModel
+
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+MERGE_KEY = "<<"
+
+
+def safe_load(stream: Union[str, bytes]) -> Any:
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+class ComposeService(BaseModel):
+    image: str
+
+
+class _NotSelectable(Exception):
+    """the spec needs a full load, e.g. it uses aliases or merge keys"""
+
+
+def _skip_node(event: yaml.Event, events: Iterator[yaml.Event]) -> None:
+    if not isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+        return
+    depth = 1
+    while depth:
+        event = next(events)
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.MappingEndEvent, yaml.SequenceEndEvent)):
+            depth -= 1
+
+
+def _mapping_items(
+    events: Iterator[yaml.Event],
+) -> Iterator[Tuple[str, yaml.Event]]:
+    """
+    key and first event of the value of each entry, after a
+    MappingStartEvent; the caller consumes the value before the next entry
+    """
+    while True:
+        event = next(events)
+        if isinstance(event, yaml.MappingEndEvent):
+            return
+        if not isinstance(event, yaml.ScalarEvent):
+            raise _NotSelectable("complex mapping key")
+        if event.value == MERGE_KEY:
+            raise _NotSelectable("merge key")
+        yield event.value, next(events)
+
+
+def _scalar(event: yaml.Event, events: Iterator[yaml.Event]) -> Optional[str]:
+    if isinstance(event, yaml.AliasEvent):
+        raise _NotSelectable("alias")
+    if isinstance(event, yaml.ScalarEvent):
+        return event.value
+    _skip_node(event, events)
+    return None
+
+
+def _service(event: yaml.Event, events: Iterator[yaml.Event]) -> ComposeService:
+    if not isinstance(event, yaml.MappingStartEvent):
+        raise _NotSelectable("service is not a mapping")
+    fields = {}
+    for key, value in _mapping_items(events):
+        if key == "image":
+            fields["image"] = _scalar(value, events)
+        else:
+            _skip_node(value, events)
+    return ComposeService(**fields)
+
+
+def _select_services(text: str) -> List[ComposeService]:
+    events = iter(yaml.parse(text, Loader=SafeLoader))
+    for event in events:
+        if isinstance(event, yaml.MappingStartEvent):
+            break
+    else:
+        raise _NotSelectable("document is not a mapping")
+
+    services: Optional[List[ComposeService]] = None
+    for key, value in _mapping_items(events):
+        if key != "services":
+            _skip_node(value, events)
+            continue
+        if not isinstance(value, yaml.MappingStartEvent):
+            raise _NotSelectable("services is not a mapping")
+        services = [_service(service, events) for _, service in _mapping_items(events)]
+    if services is None:
+        raise _NotSelectable("no services")
+    return services
+
+
+def _load_services(text: str) -> List[ComposeService]:
+    return [
+        ComposeService(image=service_data["image"])
+        for service_data in safe_load(text)["services"].values()
+    ]
+
+
+def read_compose_services(compose_file: Path) -> List[ComposeService]:
+    """image of each service of a compose spec"""
+    text = compose_file.read_text()
+    try:
+        return _select_services(text)
+    except _NotSelectable:
+        # anchors and merge keys need the whole document
+        return _load_services(text)
+
+
+def read_compose_builds(compose_file: Path) -> Dict[str, Dict[str, Any]]:
+    """rendered build section of each service by image, fully loaded"""
+    builds: Dict[str, Dict[str, Any]] = {}
+    for service_data in safe_load(compose_file.read_text())["services"].values():
+        build = service_data.get("build")
+        if build is None:
+            continue
+        builds[service_data["image"]] = (
+            {"context": build} if isinstance(build, str) else build
+        )
+    return builds
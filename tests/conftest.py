@@ -0,0 +1,36 @@
+from typing import Any, Callable
+
+import pytest
+
+from docker_publisher_osparc_services.models import RepoModel
+
+
+@pytest.fixture
+def make_repo_model() -> Callable[..., RepoModel]:
+    def _make(
+        address: str = "https://gitlab.example.com/group/repo.git",
+        branch: str = "master",
+        **fields: Any,
+    ) -> RepoModel:
+        return RepoModel.model_validate(
+            {
+                "address": address,
+                "branch": branch,
+                "host_type": "gitlab",
+                "gitlab": {
+                    "personal_access_token": "token",
+                    "deploy_token_username": "deploy",
+                    "deploy_token_password": "password",
+                },
+                "registry": {
+                    "target": "registry",
+                    "local_to_test": {
+                        "simcore/services/dynamic/service": "ci/builder/service"
+                    },
+                    "test_to_release": {"ci/builder/service": "ci/service"},
+                },
+                **fields,
+            }
+        )
+
+    return _make
@@ -0,0 +1,75 @@
+from typing import Any, Dict
+
+import pytest
+
+from docker_publisher_osparc_services.exceptions import InvalidPipelineError
+from docker_publisher_osparc_services.gitlab_ci_setup.ci_schema import (
+    validate_header,
+    validate_pipeline,
+)
+from docker_publisher_osparc_services.gitlab_ci_setup.pipeline_writer import (
+    MAX_JOB_NAME_LENGTH,
+    STAGE_BUILD,
+    STAGE_DEPLOY,
+    PipelineWriter,
+)
+
+
+def _pipeline(**jobs: Dict[str, Any]) -> Dict[str, Any]:
+    return {**PipelineWriter.parent_job_template({"A": "B"}), **jobs}
+
+
+def _job(**fields: Any) -> Dict[str, Any]:
+    return {"extends": ".basic", "stage": STAGE_BUILD, "script": ["true"], **fields}
+
+
+def test_valid_pipeline():
+    validator = validate_pipeline(
+        _pipeline(
+            build=_job(),
+            push=_job(stage=STAGE_DEPLOY, needs=["build"]),
+            tests=_job(parallel=3),
+            matrix=_job(parallel={"matrix": [{"X": "1"}, {"X": ["2", "3"]}]}),
+        )
+    )
+    assert validator.job_count == 4
+
+
+def test_nothing_to_do_pipeline():
+    assert validate_pipeline(PipelineWriter.nothing_to_do_pipeline()).job_count == 1
+
+
+@pytest.mark.parametrize(
+    "jobs, reason",
+    [
+        ({"build": _job(unknown="x")}, "Extra inputs are not permitted"),
+        ({"build": _job(stage="nope")}, "stage 'nope' not in"),
+        ({"build": _job(extends=".missing")}, "extends unknown template"),
+        (
+            {"build": {"extends": ".basic", "stage": STAGE_BUILD}},
+            "'script' is required",
+        ),
+        ({"build": _job(script=[])}, "at least 1 item"),
+        ({"build": _job(parallel=1)}, "'parallel' must be between 2 and 200"),
+        ({"build": _job(parallel={"matrix": []})}, "at least 1 item"),
+        ({"build": _job(needs=["missing"])}, "needs unknown job 'missing'"),
+        ({"x" * (MAX_JOB_NAME_LENGTH + 1): _job()}, "name is longer than"),
+        ({}, "contains no jobs"),
+    ],
+)
+def test_invalid_pipeline(jobs: Dict[str, Any], reason: str):
+    with pytest.raises(InvalidPipelineError, match=reason):
+        validate_pipeline(_pipeline(**jobs))
+
+
+def test_job_defined_more_than_once():
+    validator = validate_header(_pipeline())
+    validator.add_job("build", _job())
+    with pytest.raises(InvalidPipelineError, match="defined more than once"):
+        validator.add_job("build", _job())
+
+
+def test_header_only_contains_templates():
+    assert validate_header(_pipeline()).job_count == 0
+    with pytest.raises(InvalidPipelineError, match="only templates"):
+        validate_header(_pipeline(build=_job()))
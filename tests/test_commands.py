@@ -0,0 +1,103 @@
+import base64
+import json
+import os
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import pytest
+
+from docker_publisher_osparc_services.exceptions import (
+    RegistryAuthVariableCollisionError,
+)
+from docker_publisher_osparc_services.gitlab_ci_setup.commands import (
+    DOCKER_AUTH_SETUP,
+    docker_auth_config,
+    registry_auth_variable,
+    registry_auth_variables,
+)
+from docker_publisher_osparc_services.models import RegistryEndpointModel, RepoModel
+
+REGISTRY = RegistryEndpointModel(
+    address="registry.example.com", user="user", password="pass"
+)
+
+
+@pytest.mark.parametrize(
+    "name, variable",
+    [
+        ("registry", "SCCI_REGISTRY_AUTH_REGISTRY"),
+        ("my-reg.example.com", "SCCI_REGISTRY_AUTH_MY_REG_EXAMPLE_COM"),
+        ("-reg-", "SCCI_REGISTRY_AUTH_REG"),
+    ],
+)
+def test_registry_auth_variable(name: str, variable: str):
+    assert registry_auth_variable(name) == variable
+
+
+def test_docker_auth_config():
+    config = json.loads(docker_auth_config(REGISTRY))
+    auth = config["auths"]["registry.example.com"]["auth"]
+    assert base64.b64decode(auth) == b"user:pass"
+
+
+def test_registry_auth_variables(make_repo_model: Callable[..., RepoModel]):
+    registries = {"registry": REGISTRY, "unused": REGISTRY}
+    assert registry_auth_variables(registries, [make_repo_model()]) == {
+        "SCCI_REGISTRY_AUTH_REGISTRY": docker_auth_config(REGISTRY)
+    }
+
+
+def test_registry_auth_variables_collision():
+    registries = {"my-reg": REGISTRY, "my_reg": REGISTRY}
+    with pytest.raises(
+        RegistryAuthVariableCollisionError, match="SCCI_REGISTRY_AUTH_MY_REG"
+    ):
+        registry_auth_variables(registries, [])
+
+
+def _docker_auth_setup(home: Path, tmp_path: Path) -> Dict[str, Any]:
+    script = "\n".join([*DOCKER_AUTH_SETUP, 'echo "${DOCKER_CONFIG}"'])
+    env = {
+        "PATH": os.environ["PATH"],
+        "HOME": f"{home}",
+        "TMPDIR": f"{tmp_path}",
+        "SCCI_TARGET_REGISTRY_AUTH_VARIABLE": "SCCI_REGISTRY_AUTH_REGISTRY",
+        "SCCI_REGISTRY_AUTH_REGISTRY": docker_auth_config(REGISTRY),
+    }
+    result = subprocess.run(
+        ["bash", "-e", "-c", script], env=env, check=True, capture_output=True
+    )
+    docker_config = Path(result.stdout.decode().strip())
+    assert docker_config.parent == tmp_path
+    return json.loads((docker_config / "config.json").read_text())
+
+
+@pytest.mark.skipif(shutil.which("jq") is None, reason="requires jq")
+def test_docker_auth_setup_keeps_existing_credentials(tmp_path: Path):
+    home = tmp_path / "home"
+    (home / ".docker").mkdir(parents=True)
+    existing = {
+        "auths": {
+            "https://index.docker.io/v1/": {"auth": "aHViOmh1Yg=="},
+            "registry.example.com": {"auth": "outdated"},
+        },
+        "credsStore": "desktop",
+    }
+    (home / ".docker" / "config.json").write_text(json.dumps(existing))
+
+    config = _docker_auth_setup(home, tmp_path)
+    assert config == {
+        "auths": {
+            "https://index.docker.io/v1/": {"auth": "aHViOmh1Yg=="},
+            **json.loads(docker_auth_config(REGISTRY))["auths"],
+        }
+    }
+    # the original is untouched
+    assert json.loads((home / ".docker" / "config.json").read_text()) == existing
+
+
+def test_docker_auth_setup_without_existing_config(tmp_path: Path):
+    config = _docker_auth_setup(tmp_path / "home", tmp_path)
+    assert config == json.loads(docker_auth_config(REGISTRY))
@@ -0,0 +1,145 @@
+from pathlib import Path
+
+import pytest
+
+from docker_publisher_osparc_services.config_loader import (
+    load_config_dict,
+    load_environment,
+    read_env_file,
+    substitute_env,
+)
+
+
+@pytest.fixture
+def cache_dir(tmp_path: Path) -> Path:
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def isolated_env(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> Path:
+    workdir = tmp_path / "workdir"
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    for name in ("ENV_FILE", "ENVYAML_STRICT_DISABLE"):
+        monkeypatch.delenv(name, raising=False)
+    return workdir
+
+
+@pytest.mark.parametrize(
+    "content, expected",
+    [
+        ("a: $NAME", "a: value"),
+        ("a: ${NAME}", "a: value"),
+        ("a: ${NAME|other}", "a: value"),
+        ("a: ${MISSING|other}", "a: other"),
+        ("a: $MISSING|other", "a: other"),
+        ("a: x$$y", "a: x$y"),
+        ("a: $$NAME", "a: $NAME"),
+        ("a: ${NAME}-${NAME_LONG}", "a: value-long"),
+        ("a: $NAME_LONG $NAME", "a: long value"),
+    ],
+)
+def test_substitute_env(content: str, expected: str):
+    environ = {"NAME": "value", "NAME_LONG": "long"}
+    assert substitute_env(content, environ) == expected
+
+
+def test_substitute_env_drops_comment_lines():
+    assert substitute_env("# $MISSING\na: 1\n", {}) == "a: 1\n"
+
+
+def test_substitute_env_undefined():
+    with pytest.raises(ValueError, match=r"\$A, \$B are not defined"):
+        substitute_env("a: $B\nb: ${A}\n", {})
+    assert substitute_env("a: $B\n", {}, strict=False) == "a: $B\n"
+
+
+def test_read_env_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setenv("HOME_DIR", "/home/me")
+    env_file = tmp_path / ".env"
+    env_file.write_text('USER=me\nPASSWORD="secret"\nDATA=$HOME_DIR/data\n')
+    assert read_env_file(env_file) == {
+        "USER": "me",
+        "PASSWORD": "secret",
+        "DATA": "/home/me/data",
+    }
+
+    env_file.write_text("USER=me\nUSER=you\n")
+    with pytest.raises(ValueError, match="defined several times"):
+        read_env_file(env_file)
+    assert read_env_file(env_file, strict=False) == {"USER": "you"}
+
+
+def test_load_environment_reads_dot_env(
+    isolated_env: Path, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+):
+    monkeypatch.setenv("FROM_ENVIRON", "1")
+    assert "FROM_DOT_ENV" not in load_environment()
+
+    (isolated_env / ".env").write_text("FROM_DOT_ENV=dot\n")
+    environ = load_environment()
+    assert environ["FROM_DOT_ENV"] == "dot"
+    assert environ["FROM_ENVIRON"] == "1"
+
+    other = tmp_path / "other.env"
+    other.write_text("FROM_DOT_ENV=other\n")
+    monkeypatch.setenv("ENV_FILE", f"{other}")
+    assert load_environment()["FROM_DOT_ENV"] == "other"
+
+
+def test_load_config_dict(
+    isolated_env: Path, monkeypatch: pytest.MonkeyPatch, cache_dir: Path
+):
+    monkeypatch.setenv("PORT", "8080")
+    (isolated_env / ".env").write_text("REGISTRY_USER=me\n")
+    config_path = isolated_env / "config.yml"
+    config_path.write_text("port: $PORT\nuser: ${REGISTRY_USER}\nprice: $$5\n")
+
+    expected = {"port": 8080, "user": "me", "price": "$5"}
+    assert load_config_dict(config_path, cache_dir) == expected
+    # from the cache
+    assert load_config_dict(config_path, cache_dir) == expected
+
+    monkeypatch.setenv("PORT", "9090")
+    assert load_config_dict(config_path, cache_dir)["port"] == 9090
+
+
+def test_load_config_dict_cache_is_private(isolated_env: Path, cache_dir: Path):
+    config_path = isolated_env / "config.yml"
+    config_path.write_text("a: 1\n")
+    load_config_dict(config_path, cache_dir, environ={})
+
+    assert cache_dir.stat().st_mode & 0o777 == 0o700
+    (cache_file,) = cache_dir.iterdir()
+    assert cache_file.stat().st_mode & 0o777 == 0o600
+
+
+def test_load_config_dict_strict(
+    isolated_env: Path, monkeypatch: pytest.MonkeyPatch, cache_dir: Path
+):
+    config_path = isolated_env / "config.yml"
+    config_path.write_text("a: $MISSING\n")
+    with pytest.raises(ValueError, match="not defined"):
+        load_config_dict(config_path, cache_dir)
+
+    monkeypatch.setenv("ENVYAML_STRICT_DISABLE", "")
+    assert load_config_dict(config_path, cache_dir) == {"a": "$MISSING"}
+
+
+def test_load_config_dict_not_a_mapping(isolated_env: Path, cache_dir: Path):
+    config_path = isolated_env / "config.yml"
+    config_path.write_text("- a\n- b\n")
+    with pytest.raises(ValueError, match="does not contain a mapping"):
+        load_config_dict(config_path, cache_dir, environ={})
+
+
+def test_load_config_dict_is_not_cached_by_default(
+    isolated_env: Path, monkeypatch: pytest.MonkeyPatch, cache_dir: Path
+):
+    monkeypatch.setenv("DPOS_CACHE_DIR", f"{cache_dir}")
+    config_path = isolated_env / "config.yml"
+    config_path.write_text("password: $PASSWORD\n")
+    assert load_config_dict(config_path, environ={"PASSWORD": "secret"}) == {
+        "password": "secret"
+    }
+    assert not cache_dir.exists()
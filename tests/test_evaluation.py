@@ -0,0 +1,243 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pytest
+
+from docker_publisher_osparc_services import evaluation
+from docker_publisher_osparc_services.evaluation import (
+    RepoEvaluation,
+    Timeouts,
+    _evaluate_images,
+)
+from docker_publisher_osparc_services.exceptions import CommandFailedException
+from docker_publisher_osparc_services.models import (
+    ConfigModel,
+    RegistryEndpointModel,
+    RepoModel,
+)
+from docker_publisher_osparc_services.operations import BuildSpec
+from docker_publisher_osparc_services.utils import command_output
+from docker_publisher_osparc_services.workspace import Workspace
+
+BRANCH_HASH = "0123456789abcdef0123456789abcdef01234567"
+
+
+def _config() -> ConfigModel:
+    return ConfigModel.model_validate(
+        {
+            "registries": {
+                "registry": {
+                    "address": "registry.example.com",
+                    "user": "u",
+                    "password": "p",
+                }
+            },
+            "repositories": [],
+        }
+    )
+
+
+def _evaluate(
+    repo_model: RepoModel,
+    monkeypatch: pytest.MonkeyPatch,
+    tags: Dict[str, List[str]],
+    build_specs: Optional[Dict[str, Optional[BuildSpec]]] = None,
+) -> RepoEvaluation:
+    async def _get_tags_for_repo(registry: RegistryEndpointModel, repo: str):
+        return tags.get(repo, [])
+
+    monkeypatch.setattr(evaluation, "get_tags_for_repo", _get_tags_for_repo)
+    cfg = _config()
+    repo_evaluation = RepoEvaluation(repo_model=repo_model, branch_hash=BRANCH_HASH)
+    asyncio.run(
+        _evaluate_images(
+            cfg,
+            repo_model,
+            repo_evaluation,
+            ["simcore/services/dynamic/service:1.0.0"],
+            build_specs or {},
+            Timeouts(),
+        )
+    )
+    return repo_evaluation
+
+
+@pytest.mark.parametrize(
+    "test_tags, test_tag_exists",
+    [
+        ([], False),
+        # pushed by an older commit with the same version
+        (["1.0.0", "rev-ffffffffffffffffffffffffffffffffffffffff"], False),
+        (["1.0.0", f"rev-{BRANCH_HASH}"], True),
+    ],
+)
+def test_test_image_built_from_the_same_revision(
+    make_repo_model: Callable[..., RepoModel],
+    monkeypatch: pytest.MonkeyPatch,
+    test_tags: List[str],
+    test_tag_exists: bool,
+):
+    repo_evaluation = _evaluate(
+        make_repo_model(), monkeypatch, {"ci/builder/service": test_tags}
+    )
+    (image,) = repo_evaluation.images
+    assert not image.release_tag_exists
+    assert image.revision_tag == f"rev-{BRANCH_HASH}"
+    assert image.test_tag_exists is test_tag_exists
+
+
+def test_released_image_skips_test_image_lookup(
+    make_repo_model: Callable[..., RepoModel], monkeypatch: pytest.MonkeyPatch
+):
+    repo_evaluation = _evaluate(
+        make_repo_model(),
+        monkeypatch,
+        {"ci/service": ["1.0.0"], "ci/builder/service": [f"rev-{BRANCH_HASH}"]},
+    )
+    (image,) = repo_evaluation.images
+    assert image.release_tag_exists
+    assert not image.test_tag_exists
+    assert repo_evaluation.outdated_images == []
+
+
+def test_revision_tag_is_the_tree_tag_in_content_addressed_mode(
+    make_repo_model: Callable[..., RepoModel],
+):
+    image = evaluation.ImageEvaluation(
+        image_name="simcore/services/dynamic/service",
+        tag="1.0.0",
+        test_image="ci/builder/service",
+        release_image="ci/service",
+        release_tag_exists=False,
+        revision=BRANCH_HASH,
+        tree_hash="abc",
+    )
+    assert image.revision_tag == image.tree_tag == "tree-abc"
+
+
+def test_content_addressed_images_are_built_for_a_new_version(
+    make_repo_model: Callable[..., RepoModel], monkeypatch: pytest.MonkeyPatch
+):
+    async def _get_content_hash(*_) -> str:
+        return "abc"
+
+    monkeypatch.setattr(evaluation, "get_content_hash", _get_content_hash)
+    build_spec = BuildSpec(context="service", section={"context": "service"})
+    repo_evaluation = _evaluate(
+        make_repo_model(content_addressed=True),
+        monkeypatch,
+        # the release repository holds no content tags, only versions
+        {"ci/service": ["0.9.0", "tree-abc"], "ci/builder/service": ["tree-abc"]},
+        {"simcore/services/dynamic/service:1.0.0": build_spec},
+    )
+    (image,) = repo_evaluation.images
+    assert not image.release_tag_exists
+    assert image.revision_tag == "tree-abc"
+    assert image.test_tag_exists
+    assert repo_evaluation.outdated_images == [image]
+
+
+def _evaluate_repository(
+    repo_model: RepoModel, tmp_path: Path, timeouts: Timeouts
+) -> RepoEvaluation:
+    async def _run() -> RepoEvaluation:
+        with Workspace(tmp_path / "workspace") as workspace:
+            return await evaluation.evaluate_repository(
+                _config(), repo_model, workspace, timeouts
+            )
+
+    return asyncio.run(_run())
+
+
+def test_evaluate_repository_never_raises(
+    make_repo_model: Callable[..., RepoModel],
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+):
+    async def _get_branch_hash(repo_model: RepoModel) -> str:
+        raise CommandFailedException("repository not found")
+
+    monkeypatch.setattr(evaluation, "get_branch_hash", _get_branch_hash)
+    repo_evaluation = _evaluate_repository(make_repo_model(), tmp_path, Timeouts())
+    assert repo_evaluation.error == "CommandFailedException: repository not found"
+    assert not repo_evaluation.timed_out
+    assert repo_evaluation.outdated_images == []
+
+
+@pytest.mark.parametrize(
+    "timeouts, scope",
+    [
+        (Timeouts(repository=0.2), "repository"),
+        (Timeouts(phase=0.2), "phase 'ls-remote'"),
+        (Timeouts(repository=60, phase=0.2), "phase 'ls-remote'"),
+    ],
+)
+def test_timeouts(
+    make_repo_model: Callable[..., RepoModel],
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+    timeouts: Timeouts,
+    scope: str,
+):
+    async def _get_branch_hash(repo_model: RepoModel) -> str:
+        await asyncio.sleep(30)
+        return BRANCH_HASH
+
+    monkeypatch.setattr(evaluation, "get_branch_hash", _get_branch_hash)
+    start = time.perf_counter()
+    repo_evaluation = _evaluate_repository(make_repo_model(), tmp_path, timeouts)
+    assert time.perf_counter() - start < 10
+    assert repo_evaluation.timed_out
+    assert repo_evaluation.error == f"{scope} exceeded its time budget of 0.2s"
+    assert "ls-remote" in repo_evaluation.timings
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except FileNotFoundError:
+        return False
+    return "\nState:\tZ" not in status
+
+
+@pytest.mark.skipif(not Path("/proc").is_dir(), reason="needs procfs")
+def test_timeout_kills_subprocesses(
+    make_repo_model: Callable[..., RepoModel],
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: Path,
+):
+    pid_file = tmp_path / "pid"
+    # a helper started by the command, as git-remote-https is by git
+    script = tmp_path / "clone.sh"
+    script.write_text(f"sleep 30 &\necho $! > {pid_file}\nwait\n")
+
+    async def _get_branch_hash(repo_model: RepoModel) -> str:
+        return BRANCH_HASH
+
+    async def _did_ci_pass(repo_model: RepoModel, branch_hash: str) -> bool:
+        return True
+
+    async def _clone_repo(repo_model: RepoModel, target_dir: Path) -> None:
+        await command_output(f"bash {script}")
+
+    monkeypatch.setattr(evaluation, "get_branch_hash", _get_branch_hash)
+    monkeypatch.setattr(evaluation, "did_ci_pass", _did_ci_pass)
+    monkeypatch.setattr(evaluation, "clone_repo", _clone_repo)
+    start = time.perf_counter()
+    repo_evaluation = _evaluate_repository(
+        make_repo_model(), tmp_path, Timeouts(phase=0.5)
+    )
+    assert time.perf_counter() - start < 10
+    assert repo_evaluation.timed_out
+    assert "phase 'clone'" in f"{repo_evaluation.error}"
+
+    pid = int(pid_file.read_text())
+    deadline = time.monotonic() + 5
+    while _is_running(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if _is_running(pid):
+        os.kill(pid, 9)
+        pytest.fail("the subprocess of the clone was not killed")
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pytest
+
+from docker_publisher_osparc_services.exceptions import CommandFailedException
+from docker_publisher_osparc_services.gitlab_ci_setup.pipeline_config import (
+    PipelineConfig,
+)
+from docker_publisher_osparc_services.local_executor import (
+    LocalExecutor,
+    LocalJob,
+    run_in_shell,
+)
+
+
+class _FakeRunner:
+    """records the jobs, `durations` and `returncodes` are looked up by job name"""
+
+    def __init__(
+        self,
+        durations: Optional[Dict[str, float]] = None,
+        returncodes: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.durations = durations or {}
+        self.returncodes = returncodes or {}
+        self.started: List[LocalJob] = []
+        self.finished: List[str] = []
+
+    async def __call__(self, job: LocalJob) -> int:
+        self.started.append(job)
+        await asyncio.sleep(self.durations.get(job.name, 0.01))
+        self.finished.append(job.name)
+        return self.returncodes.get(job.name, 0)
+
+
+def _pipeline_config(target: str, test_parallel: Optional[int] = None):
+    return PipelineConfig(
+        target=target,
+        build=["build"],
+        test=["test"],
+        test_parallel=test_parallel,
+        push=["push"],
+    )
+
+
+def _run(
+    tmp_path: Path, runner: _FakeRunner, pipeline_configs: List[PipelineConfig]
+) -> None:
+    async def _main() -> None:
+        async with LocalExecutor(
+            concurrency=4,
+            logs_dir=tmp_path / "logs",
+            runner=runner,
+            work_root=tmp_path,
+        ) as executor:
+            for pipeline_config in pipeline_configs:
+                await executor.add_pipeline_from(pipeline_config, {"SCCI_TAG": "1"})
+
+    asyncio.run(_main())
+
+
+def test_jobs_wait_for_the_jobs_they_need(tmp_path: Path):
+    runner = _FakeRunner(durations={"a-build": 0.1})
+    _run(tmp_path, runner, [_pipeline_config("a"), _pipeline_config("b")])
+
+    for target in ("a", "b"):
+        order = [name for name in runner.finished if name.startswith(target)]
+        assert order == [f"{target}-build", f"{target}-test", f"{target}-push"]
+    # the pipelines of other images do not wait for each other
+    assert runner.finished.index("b-push") < runner.finished.index("a-build")
+
+
+def test_parallel_test_shards(tmp_path: Path):
+    runner = _FakeRunner()
+    _run(tmp_path, runner, [_pipeline_config("a", test_parallel=3)])
+
+    shards = [job for job in runner.started if job.env["CI_JOB_NAME"] == "a-test"]
+    assert [(job.env["CI_NODE_INDEX"], job.env["CI_NODE_TOTAL"]) for job in shards] == [
+        ("1", "3"),
+        ("2", "3"),
+        ("3", "3"),
+    ]
+    assert len({job.work_dir for job in shards}) == 3
+    build = next(job for job in runner.started if job.name == "a-build")
+    assert "CI_NODE_INDEX" not in build.env
+    # the push job waits for all the shards
+    assert runner.finished[-1] == "a-push"
+
+
+def test_first_failure_cancels_the_other_jobs(tmp_path: Path):
+    runner = _FakeRunner(durations={"b-build": 30}, returncodes={"a-build": 1})
+    start = time.perf_counter()
+    with pytest.raises(CommandFailedException, match="'a-build' failed"):
+        _run(tmp_path, runner, [_pipeline_config("a"), _pipeline_config("b")])
+
+    assert time.perf_counter() - start < 10
+    assert runner.finished == ["a-build"]
+    assert [job.name for job in runner.started] == ["a-build", "b-build"]
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except FileNotFoundError:
+        return False
+    return "\nState:\tZ" not in status
+
+
+@pytest.mark.skipif(not Path("/proc").is_dir(), reason="needs procfs")
+def test_cancel_kills_the_children_of_the_shell(tmp_path: Path):
+    pid_file = tmp_path / "pid"
+    job = LocalJob(
+        name="job",
+        commands=[f"sleep 30 & echo $! > {pid_file}", "wait"],
+        env={},
+        work_dir=tmp_path,
+        log_path=tmp_path / "job.log",
+    )
+
+    async def _main() -> int:
+        task = asyncio.create_task(run_in_shell(job))
+        while not pid_file.exists() or not pid_file.read_text().strip():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return int(pid_file.read_text())
+
+    pid = asyncio.run(_main())
+    deadline = time.monotonic() + 5
+    while _is_running(pid) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    if _is_running(pid):
+        os.kill(pid, 9)
+        pytest.fail("the child of the shell was not killed")
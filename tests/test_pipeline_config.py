@@ -0,0 +1,74 @@
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import pytest
+
+from docker_publisher_osparc_services.exceptions import InvalidPipelineError
+from docker_publisher_osparc_services.gitlab_ci_setup.commands import (
+    REGISTRY_AUTH_VARIABLE,
+)
+from docker_publisher_osparc_services.gitlab_ci_setup.pipeline_config import (
+    PipelineConfig,
+    PipelineGenerator,
+)
+from docker_publisher_osparc_services.gitlab_ci_setup.pipeline_writer import (
+    NOTHING_TO_DO_JOB,
+)
+from docker_publisher_osparc_services.yaml_utils import safe_load
+
+AUTH_VARIABLES = {"SCCI_REGISTRY_AUTH_REG": '{"auths": {}}'}
+ENV_VARS = {"SCCI_TAG": "1.0.0", REGISTRY_AUTH_VARIABLE: "SCCI_REGISTRY_AUTH_REG"}
+
+
+def _generate(
+    output_path: Path, pipelines: List[Tuple[PipelineConfig, Dict[str, str]]]
+) -> None:
+    async def _run() -> None:
+        async with PipelineGenerator(
+            output_path=output_path, variables=AUTH_VARIABLES
+        ) as generator:
+            for pipeline_config, env_vars in pipelines:
+                await generator.add_pipeline_from(pipeline_config, env_vars)
+
+    asyncio.run(_run())
+
+
+def test_generator_writes_validated_jobs(tmp_path: Path):
+    output_path = tmp_path / "child-pipeline.yml"
+    config = PipelineConfig(
+        target="simcore/services/dynamic/a",
+        build=["build"],
+        test=["test"],
+        push=["push"],
+    )
+    _generate(output_path, [(config, ENV_VARS)])
+
+    pipeline = safe_load(output_path.read_text())
+    assert pipeline[".basic"]["variables"] == AUTH_VARIABLES
+    assert list(pipeline)[2:] == [
+        "simcore-services-dynamic-a-build",
+        "simcore-services-dynamic-a-test",
+        "simcore-services-dynamic-a-push",
+    ]
+    assert pipeline["simcore-services-dynamic-a-push"]["needs"] == [
+        "simcore-services-dynamic-a-test"
+    ]
+
+
+def test_generator_without_jobs(tmp_path: Path):
+    output_path = tmp_path / "child-pipeline.yml"
+    _generate(output_path, [])
+    assert NOTHING_TO_DO_JOB in safe_load(output_path.read_text())
+
+
+def test_generator_keeps_previous_output_on_error(tmp_path: Path):
+    output_path = tmp_path / "child-pipeline.yml"
+    output_path.write_text("previous")
+    config = PipelineConfig(target="a", build=["build"], push=["push"])
+    undefined_credentials = {**ENV_VARS, REGISTRY_AUTH_VARIABLE: "UNDEFINED"}
+
+    with pytest.raises(InvalidPipelineError, match="'UNDEFINED' are not defined"):
+        _generate(output_path, [(config, undefined_credentials)])
+    assert output_path.read_text() == "previous"
+    assert [p.name for p in tmp_path.iterdir()] == [output_path.name]
@@ -0,0 +1,87 @@
+from typing import Any, Dict
+
+import pytest
+
+from docker_publisher_osparc_services.exceptions import InvalidPipelineError
+from docker_publisher_osparc_services.gitlab_ci_setup.ci_schema import (
+    validate_pipeline,
+)
+from docker_publisher_osparc_services.gitlab_ci_setup.pipeline_merge import (
+    merge_pipelines,
+)
+from docker_publisher_osparc_services.gitlab_ci_setup.pipeline_writer import (
+    NOTHING_TO_DO_JOB,
+    STAGE_BUILD,
+    Pipeline,
+    PipelineWriter,
+)
+
+AUTH_A = {"SCCI_REGISTRY_AUTH_A": '{"auths": {"a": {}}}'}
+AUTH_B = {"SCCI_REGISTRY_AUTH_B": '{"auths": {"b": {}}}'}
+
+
+def _job(**variables: str) -> Dict[str, Any]:
+    return {
+        "extends": ".basic",
+        "stage": STAGE_BUILD,
+        "variables": variables,
+        "script": ["build"],
+    }
+
+
+def _partial(basic_variables: Dict[str, str], **jobs: Dict[str, Any]) -> Pipeline:
+    return {**PipelineWriter.parent_job_template(basic_variables), **jobs}
+
+
+def test_merge():
+    merged = merge_pipelines(
+        [
+            _partial(AUTH_A, a=_job(SCCI_TAG="1", SCCI_IMAGE_NAME="a")),
+            _partial(AUTH_B, b=_job(SCCI_TAG="1", SCCI_IMAGE_NAME="b")),
+        ]
+    )
+    validate_pipeline(merged)
+    # credentials are hoisted to `.basic` even if only used by some jobs
+    assert merged[".basic"]["variables"] == {**AUTH_A, **AUTH_B, "SCCI_TAG": "1"}
+    assert merged["a"]["variables"] == {"SCCI_IMAGE_NAME": "a"}
+    assert merged["b"]["variables"] == {"SCCI_IMAGE_NAME": "b"}
+    assert list(merged["a"]) == ["extends", "stage", "variables", "script"]
+
+
+def test_merge_without_own_variables():
+    merged = merge_pipelines(
+        [_partial(AUTH_A, a=_job(X="1")), _partial(AUTH_A, b=_job(X="1"))]
+    )
+    assert merged[".basic"]["variables"] == {**AUTH_A, "X": "1"}
+    assert "variables" not in merged["a"]
+
+
+def test_merge_identical_jobs():
+    partial = _partial(AUTH_A, a=_job(X="1"))
+    merged = merge_pipelines([partial, partial])
+    assert validate_pipeline(merged).job_count == 1
+
+
+def test_merge_conflicting_jobs():
+    with pytest.raises(InvalidPipelineError, match="defined differently"):
+        merge_pipelines(
+            [_partial(AUTH_A, a=_job(X="1")), _partial(AUTH_A, a=_job(X="2"))]
+        )
+
+
+def test_merge_conflicting_credentials():
+    with pytest.raises(InvalidPipelineError, match="differs between partial"):
+        merge_pipelines(
+            [
+                _partial(AUTH_A, a=_job()),
+                _partial({"SCCI_REGISTRY_AUTH_A": "other"}, b=_job()),
+            ]
+        )
+
+
+def test_merge_nothing_to_do():
+    nothing = PipelineWriter.nothing_to_do_pipeline()
+    assert merge_pipelines([nothing, nothing]) == nothing
+    merged = merge_pipelines([nothing, _partial(AUTH_A, a=_job())])
+    assert NOTHING_TO_DO_JOB not in merged
+    assert validate_pipeline(merged).job_count == 1
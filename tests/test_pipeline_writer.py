@@ -0,0 +1,180 @@
+from typing import Dict, Optional
+
+from docker_publisher_osparc_services.gitlab_ci_setup.ci_schema import (
+    validate_pipeline,
+)
+from docker_publisher_osparc_services.gitlab_ci_setup.pipeline_config import (
+    PipelineConfig,
+)
+from docker_publisher_osparc_services.gitlab_ci_setup.pipeline_writer import (
+    MAX_JOB_NAME_LENGTH,
+    MAX_MATRIX_ENTRIES,
+    STAGE_BUILD,
+    STAGE_DEPLOY,
+    STAGE_TEST,
+    CompactPipelineWriter,
+    Job,
+    Pipeline,
+    PipelineWriter,
+)
+
+REPO_VARIABLES = {
+    "SCCI_REPO": "https://example.com/repo.git",
+    "SCCI_BRANCH": "master",
+    "SCCI_TARGET_REGISTRY_ADDRESS": "registry.example.com",
+    "SCCI_TARGET_REGISTRY_AUTH_VARIABLE": "SCCI_REGISTRY_AUTH_REG",
+}
+
+
+def _config(
+    target: str, test_parallel: Optional[int] = None, build: bool = True
+) -> PipelineConfig:
+    return PipelineConfig(
+        target=target,
+        build=["build"] if build else None,
+        test=["test"],
+        test_parallel=test_parallel,
+        push=["push"],
+    )
+
+
+def _env_vars(image: str, **variables: str) -> Dict[str, str]:
+    return {
+        **REPO_VARIABLES,
+        "SCCI_IMAGE_NAME": image,
+        "SCCI_TAG": "1.0.0",
+        **variables,
+    }
+
+
+def _jobs(pipeline: Pipeline) -> Dict[str, Job]:
+    return {name: job for name, job in pipeline.items() if "script" in job}
+
+
+def test_images_share_one_job_per_stage():
+    writer = CompactPipelineWriter({"SCCI_REGISTRY_AUTH_REG": "{}"})
+    for image in ("a", "b", "c"):
+        writer.add(_config(image), _env_vars(image))
+    assert len(writer) == 3
+
+    pipeline = writer.pipeline()
+    validate_pipeline(pipeline)
+    # common to all images, including the ones not in the matrix
+    assert pipeline[".basic"]["variables"] == {
+        "SCCI_REGISTRY_AUTH_REG": "{}",
+        **REPO_VARIABLES,
+        "SCCI_TAG": "1.0.0",
+    }
+    jobs = _jobs(pipeline)
+    assert [job["stage"] for job in jobs.values()] == [
+        STAGE_BUILD,
+        STAGE_TEST,
+        STAGE_DEPLOY,
+    ]
+    for job in jobs.values():
+        assert "variables" not in job
+        assert job["parallel"]["matrix"] == [
+            {"SCCI_IMAGE_NAME": "a"},
+            {"SCCI_IMAGE_NAME": "b"},
+            {"SCCI_IMAGE_NAME": "c"},
+        ]
+
+
+def test_shapes_are_split_by_commands_and_repository():
+    writer = CompactPipelineWriter()
+    writer.add(_config("a"), _env_vars("a"))
+    writer.add(_config("b"), {**_env_vars("b"), "SCCI_BRANCH": "develop"})
+    writer.add(_config("c", build=False), _env_vars("c"))
+
+    pipeline = writer.pipeline()
+    validate_pipeline(pipeline)
+    jobs = _jobs(pipeline)
+    assert len(jobs) == 3 + 3 + 2
+    # repository variables are not common, they stay on the jobs
+    assert "SCCI_BRANCH" not in pipeline[".basic"]["variables"]
+    assert sorted(job["variables"]["SCCI_BRANCH"] for job in jobs.values()) == [
+        "develop",
+        "develop",
+        "develop",
+        "master",
+        "master",
+        "master",
+        "master",
+        "master",
+    ]
+
+
+def test_matrix_is_chunked():
+    writer = CompactPipelineWriter()
+    count = MAX_MATRIX_ENTRIES * 2 + 1
+    for index in range(count):
+        writer.add(_config(f"image-{index}"), _env_vars(f"image-{index}"))
+
+    pipeline = writer.pipeline()
+    validate_pipeline(pipeline)
+    builds = [job for job in _jobs(pipeline).values() if job["stage"] == STAGE_BUILD]
+    assert [len(job["parallel"]["matrix"]) for job in builds] == [
+        MAX_MATRIX_ENTRIES,
+        MAX_MATRIX_ENTRIES,
+        1,
+    ]
+    names = [name for name in _jobs(pipeline) if name.startswith("build-")]
+    assert [name.rsplit("-", 1)[-1] for name in names] == ["0", "1", "2"]
+
+
+def test_single_job_fallbacks():
+    writer = CompactPipelineWriter()
+    # the name rendered by GitLab for this entry would be too long
+    long_image = "x" * MAX_JOB_NAME_LENGTH
+    writer.add(_config("a"), _env_vars("a"))
+    writer.add(_config(long_image), _env_vars(long_image))
+
+    pipeline = writer.pipeline()
+    validate_pipeline(pipeline)
+    jobs = _jobs(pipeline)
+    single = [name for name in jobs if "-single-" in name]
+    assert len(single) == 3
+    for name in single:
+        assert "parallel" not in jobs[name]
+        assert jobs[name]["variables"]["SCCI_IMAGE_NAME"] == long_image
+    matrix = [job for job in jobs.values() if "parallel" in job]
+    assert all(
+        job["parallel"]["matrix"] == [{"SCCI_IMAGE_NAME": "a"}] for job in matrix
+    )
+
+
+def test_sharded_tests_are_single_jobs():
+    writer = CompactPipelineWriter()
+    for image in ("a", "b"):
+        writer.add(_config(image, test_parallel=4), _env_vars(image))
+
+    pipeline = writer.pipeline()
+    validate_pipeline(pipeline)
+    tests = {n: j for n, j in _jobs(pipeline).items() if j["stage"] == STAGE_TEST}
+    assert len(tests) == 2
+    assert all(name.split("-")[-2] == "single" for name in tests)
+    assert sorted(job["variables"]["SCCI_IMAGE_NAME"] for job in tests.values()) == [
+        "a",
+        "b",
+    ]
+    assert all(job["parallel"] == 4 for job in tests.values())
+
+
+def test_single_image_has_no_matrix_variables():
+    writer = CompactPipelineWriter()
+    writer.add(_config("a"), _env_vars("a"))
+
+    pipeline = writer.pipeline()
+    validate_pipeline(pipeline)
+    # everything is common, the matrix would be empty
+    for name, job in _jobs(pipeline).items():
+        assert "-single-" in name
+        assert not job.get("variables")
+
+
+def test_push_only_job_does_not_wait_for_other_images():
+    # e.g. an already built test image, without tests
+    config = PipelineConfig(target="a", build=None, push=["push"])
+    jobs = PipelineWriter(config, _env_vars("a")).jobs()
+    assert list(jobs) == ["a-push"]
+    assert jobs["a-push"]["needs"] == []
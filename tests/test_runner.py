@@ -0,0 +1,342 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import pytest
+from click.testing import CliRunner, Result
+
+from docker_publisher_osparc_services import evaluation
+from docker_publisher_osparc_services.cli import main
+from docker_publisher_osparc_services.evaluation import (
+    ImageEvaluation,
+    RepoEvaluation,
+)
+from docker_publisher_osparc_services.exceptions import CommandFailedException
+from docker_publisher_osparc_services.gitlab_ci_setup.commands import (
+    registry_auth_variables,
+)
+from docker_publisher_osparc_services.gitlab_ci_setup.constants import (
+    GENERATED_PIPELINE_PATH,
+)
+from docker_publisher_osparc_services.gitlab_ci_setup.pipeline_config import (
+    PipelineGenerator,
+)
+from docker_publisher_osparc_services.models import ConfigModel, RepoModel
+from docker_publisher_osparc_services.runner import (
+    _add_pipelines,
+    _plan_records,
+    _plan_verdict,
+)
+from docker_publisher_osparc_services.yaml_utils import safe_load
+
+BRANCH_HASH = "0123456789abcdef0123456789abcdef01234567"
+JOB_PREFIX = "simcore-services-dynamic-service"
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    # pipeline configs are written to the working directory
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def _pipeline(
+    tmp_path: Path,
+    repo_model: RepoModel,
+    test_tag_exists: bool,
+    compact: bool = False,
+) -> dict:
+    cfg = ConfigModel.model_validate(
+        {
+            "registries": {
+                "registry": {
+                    "address": "registry.example.com",
+                    "user": "u",
+                    "password": "p",
+                }
+            },
+            "repositories": [],
+        }
+    )
+    evaluation = RepoEvaluation(
+        repo_model=repo_model,
+        branch_hash=BRANCH_HASH,
+        ci_passed=True,
+        images=[
+            ImageEvaluation(
+                image_name="simcore/services/dynamic/service",
+                tag="1.0.0",
+                test_image="ci/builder/service",
+                release_image="ci/service",
+                release_tag_exists=False,
+                revision=BRANCH_HASH,
+                test_tag_exists=test_tag_exists,
+            )
+        ],
+    )
+    output_path = tmp_path / "child-pipeline.yml"
+
+    async def _run() -> None:
+        async with PipelineGenerator(
+            compact=compact,
+            output_path=output_path,
+            variables=registry_auth_variables(cfg.registries, [repo_model]),
+        ) as generator:
+            await _add_pipelines(cfg, evaluation, generator, legacy_escape=False)
+
+    asyncio.run(_run())
+    return safe_load(output_path.read_text())
+
+
+def test_build_test_and_push(tmp_path: Path, make_repo_model: Callable[..., RepoModel]):
+    pipeline = _pipeline(
+        tmp_path, make_repo_model(ci_stage_test_script=["make test"]), False
+    )
+    build = pipeline[f"{JOB_PREFIX}-build"]
+    assert build["variables"]["SCCI_REVISION_TAG"] == f"rev-{BRANCH_HASH}"
+    assert any("${SCCI_REVISION_TAG}" in command for command in build["script"])
+    assert pipeline[f"{JOB_PREFIX}-test"]["needs"] == [f"{JOB_PREFIX}-build"]
+
+
+def test_pushed_test_image_is_not_rebuilt(
+    tmp_path: Path, make_repo_model: Callable[..., RepoModel]
+):
+    pipeline = _pipeline(
+        tmp_path, make_repo_model(ci_stage_test_script=["make test"]), True
+    )
+    assert f"{JOB_PREFIX}-build" not in pipeline
+    test = pipeline[f"{JOB_PREFIX}-test"]
+    # starts right away, nothing to wait for
+    assert test["needs"] == []
+    assert (
+        "docker pull ${SCCI_TARGET_REGISTRY_ADDRESS}/${SCCI_TEST_IMAGE}:"
+        "${SCCI_REVISION_TAG}" in test["script"]
+    )
+    assert pipeline[f"{JOB_PREFIX}-push"]["needs"] == [f"{JOB_PREFIX}-test"]
+
+
+def test_pushed_test_image_without_tests(
+    tmp_path: Path, make_repo_model: Callable[..., RepoModel]
+):
+    pipeline = _pipeline(tmp_path, make_repo_model(), True)
+    jobs = [name for name in pipeline if name.startswith(JOB_PREFIX)]
+    assert jobs == [f"{JOB_PREFIX}-push"]
+    assert pipeline[f"{JOB_PREFIX}-push"]["needs"] == []
+
+
+def test_pushed_test_image_compact(
+    tmp_path: Path, make_repo_model: Callable[..., RepoModel]
+):
+    pipeline = _pipeline(
+        tmp_path,
+        make_repo_model(ci_stage_test_script=["make test"]),
+        True,
+        compact=True,
+    )
+    stages = [job["stage"] for job in pipeline.values() if "script" in job]
+    assert stages == ["test-image", "deploy-image"]
+
+
+def test_plan_verdict_of_a_pushed_test_image(make_repo_model: Callable[..., RepoModel]):
+    evaluation = RepoEvaluation(
+        repo_model=make_repo_model(),
+        branch_hash=BRANCH_HASH,
+        ci_passed=True,
+        images=[
+            ImageEvaluation(
+                image_name="simcore/services/dynamic/service",
+                tag="1.0.0",
+                test_image="ci/builder/service",
+                release_image="ci/service",
+                release_tag_exists=False,
+                revision=BRANCH_HASH,
+                test_tag_exists=True,
+            )
+        ],
+    )
+    (record,) = _plan_records(evaluation)
+    assert record["build_required"] is False
+    assert record["test_image_exists"] is True
+    assert _plan_verdict(record) == "test-and-push"
+
+    evaluation.images[0].release_tag_exists = True
+    evaluation.images[0].test_tag_exists = False
+    assert _plan_verdict(_plan_records(evaluation)[0]) == "up-to-date"
+
+
+@pytest.fixture
+def sweep_config(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    make_repo_model: Callable[..., RepoModel],
+) -> Path:
+    """a healthy and a broken repository, evaluated with stand-ins"""
+    repositories = [
+        make_repo_model(address=f"https://gitlab.example.com/group/{name}.git")
+        for name in ("healthy", "broken")
+    ]
+    config = {
+        "registries": {
+            "registry": {
+                "address": "registry.example.com",
+                "user": "u",
+                "password": "p",
+            }
+        },
+        "repositories": [
+            json.loads(repo_model.model_dump_json(exclude_none=True))
+            for repo_model in repositories
+        ],
+    }
+    path = tmp_path / "config.yml"
+    path.write_text(json.dumps(config))
+
+    async def _get_branch_hash(repo_model: RepoModel) -> str:
+        if "broken" in repo_model.address:
+            raise CommandFailedException("repository not found")
+        return BRANCH_HASH
+
+    async def _did_ci_pass(repo_model: RepoModel, branch_hash: str) -> bool:
+        return True
+
+    async def _clone_repo(repo_model: RepoModel, target_dir: Path) -> None:
+        repo_model.clone_path = target_dir
+
+    async def _assemble_compose(repo_model: RepoModel) -> None:
+        pass
+
+    async def _get_tags_for_repo(*_: Any) -> List[str]:
+        return []
+
+    monkeypatch.setattr(evaluation, "get_branch_hash", _get_branch_hash)
+    monkeypatch.setattr(evaluation, "did_ci_pass", _did_ci_pass)
+    monkeypatch.setattr(evaluation, "clone_repo", _clone_repo)
+    monkeypatch.setattr(evaluation, "assemble_compose", _assemble_compose)
+    monkeypatch.setattr(
+        evaluation,
+        "fetch_images_from_compose_spec",
+        lambda _: ["simcore/services/dynamic/service:1.0.0"],
+    )
+    monkeypatch.setattr(evaluation, "get_tags_for_repo", _get_tags_for_repo)
+    return path
+
+
+@pytest.fixture
+def event_loop() -> Iterator[asyncio.AbstractEventLoop]:
+    # the commands run in the current event loop, `asyncio.run` unsets it
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
+@pytest.mark.usefixtures("event_loop")
+@pytest.mark.parametrize("fail_on_error, exit_code", [(False, 0), (True, 1)])
+def test_run_skips_failing_repositories(
+    workdir: Path, sweep_config: Path, fail_on_error: bool, exit_code: int
+):
+    args = ["run", f"{sweep_config}", "--workspace", f"{workdir / 'workspace'}"]
+    result = CliRunner().invoke(
+        main, args + (["--fail-on-error"] if fail_on_error else [])
+    )
+    assert result.exit_code == exit_code, result.output
+    assert "1 of 2 repositories skipped" in result.output
+    assert "CommandFailedException: repository not found" in result.output
+
+    pipeline = (workdir / GENERATED_PIPELINE_PATH).read_text()
+    assert "group/healthy" in pipeline
+    assert "group/broken" not in pipeline
+
+
+def _plan(
+    sweep_config: Path, workspace_root: Path, *args: str
+) -> Tuple[Result, List[Dict[str, Any]]]:
+    result = CliRunner().invoke(
+        main,
+        [
+            "plan",
+            f"{sweep_config}",
+            "--json",
+            "--workspace",
+            f"{workspace_root}",
+            *args,
+        ],
+    )
+    records = [json.loads(line) for line in result.stdout.splitlines()]
+    return result, records
+
+
+@pytest.mark.usefixtures("event_loop")
+def test_plan_json_records(
+    workdir: Path, sweep_config: Path, tmp_path_factory: pytest.TempPathFactory
+):
+    result, records = _plan(
+        sweep_config, tmp_path_factory.mktemp("workspace"), "--concurrency", "1"
+    )
+    assert result.exit_code == 0, result.stderr
+    # the progress of the evaluation only goes to stderr
+    assert "CI OK" in result.stderr
+    assert "1 of 2 repositories skipped" in result.stderr
+
+    healthy, broken = records
+    assert set(healthy.pop("timings")) == {
+        "ls-remote",
+        "ci-check",
+        "clone",
+        "compose",
+        "tag-lookup",
+    }
+    assert healthy == {
+        "repo": "https://gitlab.example.com/group/healthy.git",
+        "branch": "master",
+        "hash": BRANCH_HASH,
+        "ci_passed": True,
+        "image": "simcore/services/dynamic/service",
+        "tag": "1.0.0",
+        "release_image": "ci/service",
+        "exists_in_registry": False,
+        "build_required": True,
+        "test_image_exists": False,
+        "tree_hash": None,
+    }
+    assert _plan_verdict(healthy) == "build"
+    assert set(broken.pop("timings")) == {"ls-remote"}
+    assert broken == {
+        "repo": "https://gitlab.example.com/group/broken.git",
+        "branch": "master",
+        "hash": None,
+        "ci_passed": False,
+        "image": None,
+        "error": "CommandFailedException: repository not found",
+        "timed_out": False,
+    }
+    assert _plan_verdict(broken) == "failed"
+    # nothing but the configuration in the working directory
+    assert list(workdir.iterdir()) == [sweep_config]
+
+
+@pytest.mark.usefixtures("event_loop")
+def test_plan_repo_filter(sweep_config: Path, tmp_path_factory: pytest.TempPathFactory):
+    result, records = _plan(
+        sweep_config,
+        tmp_path_factory.mktemp("workspace"),
+        "--repo",
+        "group/healthy",
+        "--fail-on-error",
+    )
+    assert result.exit_code == 0, result.stderr
+    assert [record["repo"] for record in records] == [
+        "https://gitlab.example.com/group/healthy.git"
+    ]
+
+    result, records = _plan(
+        sweep_config,
+        tmp_path_factory.mktemp("workspace"),
+        "--repo",
+        "broken",
+        "--fail-on-error",
+    )
+    assert result.exit_code == 1
+    assert [record["image"] for record in records] == [None]
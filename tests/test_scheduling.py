@@ -0,0 +1,187 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pytest
+
+from docker_publisher_osparc_services.evaluation import (
+    ImageEvaluation,
+    RepoEvaluation,
+    repo_span_name,
+)
+from docker_publisher_osparc_services.models import RepoModel
+from docker_publisher_osparc_services.scheduling import (
+    STABLE_RUNS,
+    History,
+    RepoHistory,
+    ScheduledRepo,
+    _simulate,
+    plan_schedule,
+)
+
+BRANCH_HASH = "0123456789abcdef0123456789abcdef01234567"
+
+
+@pytest.fixture
+def repositories(make_repo_model: Callable[..., RepoModel]) -> List[RepoModel]:
+    return [
+        make_repo_model(address=f"https://gitlab.example.com/group/{name}.git")
+        for name in ("a", "b", "c", "d")
+    ]
+
+
+def _history(
+    durations: List[Tuple[RepoModel, float]], stable: List[RepoModel]
+) -> History:
+    return History(
+        repositories={
+            repo_span_name(repo_model): RepoHistory(
+                phases={"clone": duration},
+                unchanged_runs=STABLE_RUNS if repo_model in stable else 0,
+            )
+            for repo_model, duration in durations
+        }
+    )
+
+
+def _names(repo_models: List[RepoModel]) -> List[str]:
+    return [Path(repo_model.address).stem for repo_model in repo_models]
+
+
+def test_longest_first_stable_last(repositories: List[RepoModel]):
+    a, b, c, d = repositories
+    history = _history([(a, 1), (b, 5), (c, 3), (d, 10)], stable=[d])
+    schedule = plan_schedule(repositories, history, concurrency=2)
+    assert _names(schedule.order) == ["b", "c", "a", "d"]
+    assert [s.stable for s in schedule.repositories] == [False, False, False, True]
+
+
+def test_unknown_repositories_are_as_slow_as_the_slowest(
+    repositories: List[RepoModel],
+):
+    a, b, _, _ = repositories
+    schedule = plan_schedule(repositories, _history([(a, 2), (b, 4)], stable=[]), 2)
+    # ties keep the configuration order
+    assert _names(schedule.order) == ["b", "c", "d", "a"]
+    predicted = {
+        Path(s.repo_model.address).stem: (s.predicted, s.measured)
+        for s in schedule.repositories
+    }
+    assert predicted == {
+        "a": (2, True),
+        "b": (4, True),
+        "c": (4, False),
+        "d": (4, False),
+    }
+
+
+def test_without_history_the_configuration_order_is_kept(
+    repositories: List[RepoModel],
+):
+    schedule = plan_schedule(repositories, History(), concurrency=4)
+    assert schedule.order == repositories
+    assert schedule.makespan == 0
+
+
+@pytest.mark.parametrize(
+    "durations, concurrency, starts, makespan",
+    [
+        ([], 2, [], 0),
+        ([4, 3, 2, 1], 1, [0, 4, 7, 9], 10),
+        ([4, 3, 2, 1], 2, [0, 0, 3, 4], 5),
+        ([4, 3, 2, 1], 8, [0, 0, 0, 0], 4),
+    ],
+)
+def test_simulate(
+    make_repo_model: Callable[..., RepoModel],
+    durations: List[float],
+    concurrency: int,
+    starts: List[float],
+    makespan: float,
+):
+    scheduled = [
+        ScheduledRepo(
+            repo_model=make_repo_model(),
+            predicted=duration,
+            measured=True,
+            stable=False,
+        )
+        for duration in durations
+    ]
+    assert _simulate(scheduled, concurrency) == makespan
+    assert [s.start for s in scheduled] == starts
+
+
+def _evaluation(
+    repo_model: RepoModel,
+    timings: Dict[str, float],
+    branch_hash: Optional[str] = BRANCH_HASH,
+    outdated: bool = False,
+    error: Optional[str] = None,
+) -> RepoEvaluation:
+    return RepoEvaluation(
+        repo_model=repo_model,
+        branch_hash=branch_hash,
+        ci_passed=True,
+        images=[
+            ImageEvaluation(
+                image_name="simcore/services/dynamic/service",
+                tag="1.0.0",
+                test_image="ci/builder/service",
+                release_image="ci/service",
+                release_tag_exists=not outdated,
+                revision=f"{branch_hash}",
+            )
+        ],
+        timings=timings,
+        error=error,
+    )
+
+
+def test_record_smooths_the_phase_durations(make_repo_model: Callable[..., RepoModel]):
+    repo_model = make_repo_model()
+    history = History()
+    history.record(_evaluation(repo_model, {"clone": 10, "compose": 2}))
+    history.record(_evaluation(repo_model, {"clone": 20}))
+
+    repo_history = history.get(repo_model)
+    assert repo_history is not None
+    assert repo_history.phases == {"clone": 15, "compose": 2}
+    assert repo_history.duration == 17
+
+
+def test_record_counts_unchanged_runs(make_repo_model: Callable[..., RepoModel]):
+    repo_model = make_repo_model()
+    history = History()
+
+    def _unchanged_runs(**kwargs) -> int:
+        history.record(_evaluation(repo_model, {}, **kwargs))
+        repo_history = history.get(repo_model)
+        assert repo_history is not None
+        return repo_history.unchanged_runs
+
+    # the first run has nothing to compare with
+    assert _unchanged_runs() == 0
+    assert [_unchanged_runs() for _ in range(STABLE_RUNS)] == [1, 2, 3]
+    assert history.get(repo_model).stable  # type: ignore[union-attr]
+
+    assert _unchanged_runs(outdated=True) == 0
+    assert _unchanged_runs() == 1
+    assert _unchanged_runs(error="boom") == 0
+    assert _unchanged_runs() == 1
+    assert _unchanged_runs(branch_hash="f" * 40) == 0
+    # a failed ls-remote keeps the last known branch hash
+    assert _unchanged_runs(branch_hash=None, error="timeout") == 0
+    assert _unchanged_runs(branch_hash="f" * 40) == 1
+
+
+def test_history_round_trip(tmp_path: Path, make_repo_model: Callable[..., RepoModel]):
+    repo_model = make_repo_model()
+    history = History()
+    history.record(_evaluation(repo_model, {"clone": 1.5}))
+    path = tmp_path / "cache" / "history.json"
+    history.save(path)
+    assert History.load(path) == history
+
+    path.write_text("{not json")
+    assert History.load(path) == History()
+    assert History.load(tmp_path / "missing.json") == History()
@@ -0,0 +1,76 @@
+from pathlib import Path
+from typing import Callable
+
+import pytest
+from pydantic import ValidationError
+
+from docker_publisher_osparc_services.models import RepoModel
+from docker_publisher_osparc_services.sharding import Shard
+
+
+@pytest.mark.parametrize("value", ["1/1", "2/3", "3/3"])
+def test_parse(value: str):
+    assert str(Shard.parse(value)) == value
+
+
+@pytest.mark.parametrize("value", ["", "1", "0/2", "3/2", "a/2", "1/b", "-1/2"])
+def test_parse_invalid(value: str):
+    with pytest.raises(ValueError):
+        Shard.parse(value)
+
+
+def test_index_out_of_range():
+    with pytest.raises(ValidationError, match="out of range"):
+        Shard(index=3, total=2)
+
+
+def test_each_repository_has_exactly_one_shard(
+    make_repo_model: Callable[..., RepoModel],
+):
+    repositories = [
+        make_repo_model(address=f"https://gitlab.example.com/group/repo-{i}.git")
+        for i in range(50)
+    ] + [make_repo_model(branch="develop")]
+    shards = [Shard(index=i, total=4) for i in range(1, 5)]
+
+    selected = [shard.select(repositories) for shard in shards]
+    assert sorted(r.address + r.branch for s in selected for r in s) == sorted(
+        r.address + r.branch for r in repositories
+    )
+    # spread over all shards
+    assert all(selected)
+
+
+def test_assignment_is_stable(make_repo_model: Callable[..., RepoModel]):
+    repositories = [
+        make_repo_model(address=f"https://gitlab.example.com/group/repo-{i}.git")
+        for i in range(20)
+    ]
+    shard = Shard(index=2, total=3)
+    owned = shard.select(repositories)
+    # adding repositories does not move the other ones
+    extended = shard.select(
+        [make_repo_model(address="https://gitlab.example.com/new.git")] + repositories
+    )
+    assert [r for r in extended if r in repositories] == owned
+    # the assignment does not depend on the credentials
+    other_credentials = [
+        make_repo_model(
+            address=r.address,
+            gitlab={
+                "personal_access_token": "other",
+                "deploy_token_username": "other",
+                "deploy_token_password": "other",
+            },
+        )
+        for r in repositories
+    ]
+    assert [r.address for r in shard.select(other_credentials)] == [
+        r.address for r in owned
+    ]
+
+
+def test_pipeline_path():
+    assert Shard(index=2, total=5).pipeline_path(
+        Path("out/child-pipeline-gitlab-ci.yml")
+    ) == Path("out/child-pipeline-gitlab-ci.shard-2-of-5.yml")
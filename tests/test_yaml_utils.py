@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import pytest
+
+from docker_publisher_osparc_services import yaml_utils
+from docker_publisher_osparc_services.yaml_utils import (
+    read_compose_builds,
+    read_compose_services,
+)
+
+COMPOSE_SPEC = """
+version: "3.7"
+x-unused:
+  nested: [1, {a: b}]
+services:
+  first:
+    build:
+      context: ./first
+      labels:
+        io.simcore.key: '{"key": "simcore/services/dynamic/first"}'
+    image: simcore/services/dynamic/first:1.0.0
+  second:
+    environment:
+      - A=B
+    image: simcore/services/dynamic/second:2.0.0
+    build: ./second
+"""
+
+# anchors and merge keys are only resolved by a full load
+COMPOSE_SPEC_WITH_MERGE_KEY = """
+x-common: &common
+  image: simcore/services/dynamic/common:1.0.0
+services:
+  first:
+    <<: *common
+  second:
+    image: simcore/services/dynamic/second:2.0.0
+"""
+
+
+@pytest.fixture
+def compose_file(tmp_path: Path) -> Path:
+    path = tmp_path / "docker-compose.yml"
+    path.write_text(COMPOSE_SPEC)
+    return path
+
+
+def test_read_compose_services_selective(
+    compose_file: Path, monkeypatch: pytest.MonkeyPatch
+):
+    def _no_full_load(text):
+        raise AssertionError("the spec should be read selectively")
+
+    monkeypatch.setattr(yaml_utils, "_load_services", _no_full_load)
+    assert [s.image for s in read_compose_services(compose_file)] == [
+        "simcore/services/dynamic/first:1.0.0",
+        "simcore/services/dynamic/second:2.0.0",
+    ]
+
+
+def test_read_compose_services_falls_back_to_full_load(tmp_path: Path):
+    compose_file = tmp_path / "docker-compose.yml"
+    compose_file.write_text(COMPOSE_SPEC_WITH_MERGE_KEY)
+    assert [s.image for s in read_compose_services(compose_file)] == [
+        "simcore/services/dynamic/common:1.0.0",
+        "simcore/services/dynamic/second:2.0.0",
+    ]
+
+
+def test_read_compose_builds(compose_file: Path):
+    assert read_compose_builds(compose_file) == {
+        "simcore/services/dynamic/first:1.0.0": {
+            "context": "./first",
+            "labels": {"io.simcore.key": '{"key": "simcore/services/dynamic/first"}'},
+        },
+        "simcore/services/dynamic/second:2.0.0": {"context": "./second"},
+    }